@@ -1,10 +1,16 @@
 import os
-import io
-import pandas as pd
 import requests
-from flask import Flask, request, render_template_string, redirect
-from google.oauth2 import service_account
-from google.auth.transport.requests import AuthorizedSession
+from flask import Flask, request, render_template_string, redirect, make_response, jsonify
+
+from http_transport import DIALOGFLOW_API, dialogflow_credentials, dialogflow_transport, pool_stats
+from menu_index import MenuIndex, MenuItem
+from menu_ingest import MenuIngestError, ingest
+from menu_snapshot import MENU_CACHE_CSV, MENU_SNAPSHOT, MenuWatcher, load_menu, write_snapshot
+from session_entities import EntityPusher, SessionEntityTracker, push_item_entities
+from entity_sync import ITEM_ENTITY_MODE, EntitySyncError, sync_item_entity
+from circuit_breaker import DETECT_INTENT_TIMEOUT, OPEN, CircuitBreaker, CircuitOpenError, breaker_stats, http_failure
+from local_nlu import CONFIDENCE_THRESHOLD, default_model
+from session_store import open_session_store
 
 # CONFIGURAÇÕES
 # Arquivo de credenciais da conta de serviço Dialogflow
@@ -18,17 +24,19 @@ LANG = "pt-BR"
 app = Flask(__name__)
 
 # Variáveis globais
-# DataFrame que armazena o cardápio carregado
-MENU_DF: pd.DataFrame | None = None
-# Carrinhos de compra por sessão (chat)
-CARTS: dict[str, list[dict]] = {}
-
-# Autenticação com a API Dialogflow
+# Índice do cardápio reconstruído a cada carga (consultas O(1) nas intents).
+MENU_INDEX: MenuIndex | None = None
+# Carrinho e última ação por sessão (chat), com TTL; SESSION_STORE=sqlite:///... compartilha entre workers
+SESSIONS = open_session_store()
+# Versão do cardápio já enviada a cada sessão (evita PUT de @Item a cada mensagem)
+ENTITY_TRACKER = SessionEntityTracker()
+
+# Autenticação com a API Dialogflow (transporte com pool, timeouts e novas tentativas)
 SCOPES = ["https://www.googleapis.com/auth/dialogflow"]
-credentials = service_account.Credentials.from_service_account_file(
-    CREDENTIALS_FILE, scopes=SCOPES
-)
-GSESSION = AuthorizedSession(credentials)
+credentials = dialogflow_credentials(CREDENTIALS_FILE, SCOPES)
+GSESSION = dialogflow_transport(credentials)
+# Com o Dialogflow fora do ar ou lento, as mensagens vão direto para local_intent
+DIALOGFLOW_BREAKER = CircuitBreaker("dialogflow")
 
 # HTML simples para a página de upload do cardápio
 HTML = """
@@ -40,6 +48,9 @@ HTML = """
   <button type=submit>Enviar</button>
 </form>
 <hr>
+<form method=post action="/admin/sync-entities">
+  <button type=submit>Sincronizar @Item no agente</button>
+</form>
 <a href="/menu">Ver cardápio carregado</a>
 """
 
@@ -50,6 +61,24 @@ def home():
     return "Bot online", 200
 
 
+@app.route("/stats/http")
+def http_stats():
+    """Estatísticas do transporte HTTP (chamadas, novas tentativas, pool)."""
+    return jsonify(pool_stats())
+
+
+@app.route("/stats/breaker")
+def breaker_status():
+    """Estado do disjuntor do Dialogflow."""
+    return jsonify(breaker_stats())
+
+
+@app.route("/stats/sessions")
+def session_stats():
+    """Sessões guardadas (carrinhos) e descartes por TTL e limite."""
+    return jsonify(SESSIONS.stats())
+
+
 @app.route("/admin")
 def admin():
     """Página de administração para upload de cardápio."""
@@ -58,102 +87,195 @@ def admin():
 
 @app.route("/upload", methods=["POST"])
 def upload():
-    """Recebe planilha CSV/XLSX e carrega no DataFrame global."""
-    global MENU_DF
+    """
+    Recebe planilha CSV/XLSX e recompila o índice global do cardápio.
+    O arquivo é lido em streaming (blocos de linhas), sem carregar tudo em memória.
+    """
+    global MENU_INDEX
     f = request.files.get("file")
     if not f:
         return "Arquivo não enviado.", 400
-    content = f.read()
     try:
-        # Detecta extensão para leitura
-        if f.filename.lower().endswith(".csv"):
-            df = pd.read_csv(io.BytesIO(content))
-        else:
-            df = pd.read_excel(io.BytesIO(content))
-    except Exception as e:
-        return f"Erro ao ler planilha: {e}", 400
-
-    # Normaliza colunas para minúsculas e sem espaços
-    df.columns = [c.strip().lower() for c in df.columns]
-    required = ["categoria", "item", "descricao", "preco"]
-    # Verifica se todas as colunas obrigatórias existem
-    if not set(required).issubset(set(df.columns)):
-        return f"Colunas obrigatórias ausentes: {', '.join(required)}", 400
-    # Coluna vegetariano padrão "não" caso não exista
-    df["vegetariano"] = df.get("vegetariano", "não").astype(str).str.lower()
-    # Converte preços para float com duas casas decimais
-    df["preco"] = pd.to_numeric(df["preco"], errors="coerce").round(2)
-    MENU_DF = df
-    # Persiste em disco para uso posterior
-    df.to_csv("cardapio_cache.csv", index=False)
+        # Valida colunas, normaliza preço/vegetariano e persiste o cache em disco
+        result = ingest(f.stream, f.filename, cache_path=MENU_CACHE_CSV)
+    except MenuIngestError as e:
+        return str(e), 400
+    set_menu_index(result.index)
+    # Snapshot compilado: os demais workers carregam o índice sem reler o CSV
+    try:
+        write_snapshot(MENU_INDEX, MENU_SNAPSHOT)
+    except OSError as e:
+        print("Falha ao gravar snapshot do cardápio:", e)
+    if ITEM_ENTITY_MODE == "agent":
+        # @Item do agente acompanha o cardápio (só as diferenças são enviadas)
+        try:
+            print("Sincronização de @Item:", sync_item_entity(GSESSION, PROJECT_ID, MENU_INDEX, LANG))
+        except (EntitySyncError, requests.RequestException) as e:
+            print("Falha ao sincronizar @Item:", e)
+    if result.bad_count:
+        # Carregou as linhas válidas, mas informa as rejeitadas
+        return result.report(), 200, {"Content-Type": "text/plain; charset=utf-8"}
     return redirect("/menu")
 
 
+@app.route("/admin/sync-entities", methods=["POST"])
+def sync_entities():
+    """Sincroniza a entidade @Item do agente com o cardápio (apenas as diferenças)."""
+    if not ensure_menu_loaded():
+        return "Nenhum cardápio carregado. Vá em /admin", 400
+    try:
+        resumo = sync_item_entity(GSESSION, PROJECT_ID, MENU_INDEX, LANG)
+    except (EntitySyncError, requests.RequestException) as e:
+        return f"Falha ao sincronizar @Item: {e}", 502
+    return (
+        f"@Item sincronizado (versão {resumo['version']}): {resumo['added']} novos, "
+        f"{resumo['changed']} alterados, {resumo['removed']} removidos."
+    ), 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+
 @app.route("/menu")
 def show_menu():
-    """Exibe o cardápio carregado em formato HTML."""
-    global MENU_DF
-    if MENU_DF is None and os.path.exists("cardapio_cache.csv"):
-        MENU_DF = pd.read_csv("cardapio_cache.csv")
-    if MENU_DF is None:
+    """
+    Exibe o cardápio carregado em formato HTML.
+    O corpo é pré-renderizado por versão do cardápio e servido com ETag forte,
+    respondendo 304 quando o cliente já possui a versão atual (If-None-Match).
+    """
+    if not ensure_menu_loaded():
         return "Nenhum cardápio carregado. Vá em /admin", 200
-    # Gera tabela HTML sem índice
-    return MENU_DF.to_html(index=False)
+    menu = MENU_INDEX
+    etag = menu.version
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(menu.render("html"), 200)
+    response.set_etag(etag)
+    # Permite cache no cliente, mas sempre revalidando com o servidor
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def set_menu_index(index: MenuIndex) -> None:
+    """Troca o índice global de uma vez (leitores mantêm a referência antiga)."""
+    global MENU_INDEX
+    MENU_INDEX = index
+    if ITEM_ENTITY_MODE != "agent":
+        # Sessões ativas recebem o @Item novo em segundo plano, antes da próxima mensagem
+        ENTITY_PUSHER.refresh_all(index.version)
+
+
+# Recarrega o cardápio quando outro worker faz upload (snapshot substituído)
+MENU_WATCHER = MenuWatcher(lambda: MENU_INDEX, set_menu_index, MENU_SNAPSHOT)
 
 
 def ensure_menu_loaded() -> bool:
-    """Garante que o DataFrame do cardápio esteja carregado na memória."""
-    global MENU_DF
-    if MENU_DF is None and os.path.exists("cardapio_cache.csv"):
-        MENU_DF = pd.read_csv("cardapio_cache.csv")
-    return MENU_DF is not None
+    """Garante que o índice do cardápio esteja carregado (snapshot binário ou CSV)."""
+    global MENU_INDEX
+    # A thread de observação é iniciada no próprio worker (após o fork do gunicorn)
+    MENU_WATCHER.start()
+    if MENU_INDEX is None:
+        MENU_INDEX = load_menu(MENU_CACHE_CSV, MENU_SNAPSHOT)
+    return MENU_INDEX is not None
+
+
+def format_items(rows: list[MenuItem]) -> str:
+    """Formata itens do cardápio como "Nome (R$preço)" separados por vírgula."""
+    return ", ".join(f"{row.item} (R${row.preco:.2f})" for row in rows)
+
+
+def _push_entities(session_id: str) -> None:
+    """PUT do @Item com o corpo pré-serializado da versão atual (thread de envio)."""
+    push_item_entities(GSESSION, PROJECT_ID, session_id, MENU_INDEX, ENTITY_TRACKER)
+
+
+# Envios de @Item em segundo plano, um pendente por sessão
+ENTITY_PUSHER = EntityPusher(_push_entities, ENTITY_TRACKER)
 
 
 def push_session_entities(session_id: str) -> None:
     """
     Envia entidades dinâmicas para a sessão do Dialogflow.
     Cada item do cardápio vira um valor em @Item com sinônimos opcionais.
+    Só espera o envio no primeiro turno da sessão; reenvios (cardápio novo ou
+    validade perto do fim) são feitos em segundo plano.
+    Com ITEM_ENTITY_MODE=agent a entidade do agente já está sincronizada e nada é enviado;
+    com o disjuntor aberto a mensagem não irá ao Dialogflow e também não há envio.
     """
-    if not ensure_menu_loaded():
+    if ITEM_ENTITY_MODE == "agent" or DIALOGFLOW_BREAKER.state == OPEN or not ensure_menu_loaded():
         return
-    import pandas as pd  # Import local para tipagem
-    # Lista de entidades
-    items_entities = []
-    for _, row in MENU_DF.iterrows():
-        value = str(row["item"]).strip()
-        synonyms = [value]
-        # Se houver coluna de sinônimos, separa por |
-        if "sinonimos" in MENU_DF.columns:
-            raw = row.get("sinonimos", "")
-            if pd.notna(raw) and str(raw).strip() != "":
-                parts = str(raw).split("|")
-                synonyms += [p.strip() for p in parts if p.strip()]
-        items_entities.append({"value": value, "synonyms": synonyms})
-    # Monta payload do session entity type
+    ENTITY_PUSHER.ensure(session_id, MENU_INDEX.version)
+
+
+def local_intent(text: str) -> tuple[str | None, dict]:
+    """
+    Classificação local (sem Dialogflow): classificador de intents treinado
+    com as frases do agente e itens do cardápio citados no texto.
+    """
+    params = {"queryText": text}
+    intent = None
+    nlu = default_model()
+    if nlu is not None:
+        previsto, confianca = nlu.predict(text)
+        if confianca >= CONFIDENCE_THRESHOLD:
+            intent = previsto
+    if intent in (None, "FazerPedido", "PedidoDetalhado") and ensure_menu_loaded():
+        itens = MENU_INDEX.matcher.find(text)
+        if itens:
+            intent = "FazerPedido"
+            params["item"] = itens[0].item
+    return intent, params
+
+
+def detect_intent(text: str, session_id: str) -> tuple[str | None, dict]:
+    """
+    detectIntent com orçamento de latência e disjuntor; se o Dialogflow
+    falhar, demorar ou estiver com o disjuntor aberto, usa local_intent.
+    """
     url = (
-        f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/sessions/"
-        f"{session_id}/entityTypes/Item"
+        f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/sessions/"
+        f"{session_id}:detectIntent"
     )
     payload = {
-        "entityOverrideMode": "ENTITY_OVERRIDE_MODE_OVERRIDE",
-        "entities": items_entities,
+        "queryInput": {
+            "text": {
+                "text": text,
+                "languageCode": LANG,
+            }
+        }
     }
     try:
-        # Utiliza PUT para criar/atualizar o SessionEntityType
-        GSESSION.put(url, json=payload)
+        resp = DIALOGFLOW_BREAKER.call(GSESSION.post, url, json=payload, timeout=DETECT_INTENT_TIMEOUT,
+                                       retries=0, is_failure=http_failure)
+        resp.raise_for_status()
+    except CircuitOpenError:
+        return local_intent(text)
     except Exception as e:
-        # Em caso de falha, apenas registra no log (não interrompe fluxo)
-        print("Falha ao enviar entidades dinâmicas:", e)
+        print("[WARN] detectIntent indisponível, usando classificação local:", e)
+        return local_intent(text)
+    query_result = resp.json().get("queryResult", {})
+    intent = query_result.get("intent", {}).get("displayName")
+    params = query_result.get("parameters", {})
+    # Adiciona o texto original do usuário aos parâmetros para fallback inteligente
+    params["queryText"] = text
+    return intent, params
 
 
-def handle_intent(intent_name: str, params: dict, session_id: str) -> str:
+def handle_intent(intent_name: str, params: dict, session_id: str, formato: str = "markdown") -> str:
     """
     Manipula as intents customizadas com base no cardápio e estado da sessão.
+    O formato ("markdown" ou "text") define como o cardápio completo é enviado.
     """
-    ensure_menu_loaded()
-    if MENU_DF is None:
+    if not ensure_menu_loaded():
         return "Cardápio não carregado. Por favor, faça upload do cardápio em /admin."
+    # Mesma versão do cardápio do início ao fim da requisição, mesmo se houver recarga
+    menu = MENU_INDEX
+    # Carrinho e última ação lidos e gravados de uma vez (atômico por sessão)
+    with SESSIONS.session(session_id) as sessao:
+        return respond_intent(intent_name, params, sessao, menu, formato)
 
+
+def respond_intent(intent_name: str, params: dict, sessao: dict, menu: MenuIndex,
+                   formato: str = "markdown") -> str:
+    """Resposta da intent; altera o carrinho e a última ação em `sessao`."""
     # Fallback inteligente - detecta cumprimentos e confirmações diretamente no texto
     user_text = params.get("queryText", "").lower().strip()
 
@@ -163,16 +285,11 @@ def handle_intent(intent_name: str, params: dict, session_id: str) -> str:
         if any(c in user_text for c in cumprimentos):
             intent_name = "BoasVindas"
 
-    # Contexto simples para última ação
-    if 'last_action' not in CARTS:
-        CARTS['last_action'] = {}
-    last_action = CARTS['last_action'].get(session_id)
-
     # Tratamento especial para "Sim" baseado no contexto
     if intent_name == "ConfirmarPedido" and user_text in ["sim", "yes"]:
-        cart = CARTS.get(session_id)
+        cart = sessao["cart"]
         if not cart:
-            last = CARTS['last_action'].get(session_id)
+            last = sessao["last_action"]
             if last == 'show_menu':
                 return "Ótimo! Qual item você gostaria de pedir? Digite 'ver opções' para o cardápio completo."
             elif last == 'show_category' or last == 'show_items':
@@ -185,51 +302,48 @@ def handle_intent(intent_name: str, params: dict, session_id: str) -> str:
             f"{itm['qty']}x {itm['item']} (R${itm['price'] * itm['qty']:.2f})"
             for itm in cart
         ]
-        CARTS[session_id] = []  # Limpa carrinho
-        CARTS['last_action'][session_id] = 'pedido_confirmado'
+        sessao["cart"] = []  # Limpa carrinho
+        sessao["last_action"] = 'pedido_confirmado'
         return "Pedido confirmado: " + ", ".join(itens) + f". Total R${total:.2f}. Obrigado!"
 
     # Intents de categoria
     if intent_name == "ItensCategoria":
         categoria = params.get("categoria") or params.get("Categoria")
         if categoria:
-            cat = str(categoria).strip().lower()
-            df = MENU_DF[MENU_DF["categoria"].str.lower() == cat]
-            if df.empty:
+            rows = menu.get_category(categoria)
+            if not rows:
                 return f"Não encontrei itens na categoria {categoria}."
-            items = [f"{row['item']} (R${row['preco']:.2f})" for _, row in df.iterrows()]
-            CARTS['last_action'][session_id] = 'show_category'
-            return f"Itens de {categoria}: " + ", ".join(items)
+            sessao["last_action"] = 'show_category'
+            return f"Itens de {categoria}: " + format_items(rows)
         return "Qual categoria você deseja ver? Por exemplo: Burgers, Bebidas."
     # Intents de preço
     elif intent_name == "PrecoItem":
         item = params.get("item") or params.get("Item")
         if item:
-            item_name = str(item).strip().lower()
-            row = MENU_DF[MENU_DF["item"].str.lower() == item_name]
-            if row.empty:
+            # Nome exato ou parecido (erros de digitação) resolvidos localmente
+            row = menu.resolve(item)
+            if row is None:
                 return f"Não encontrei o item {item}."
-            price = row.iloc[0]["preco"]
+            item = row.item
+            price = row.preco
             return f"{item} custa R${price:.2f}."
         return "Sobre qual item você deseja saber o preço?"
     # Intents de detalhes
     elif intent_name == "DetalheItem":
         item = params.get("item") or params.get("Item")
         if item:
-            item_name = str(item).strip().lower()
-            row = MENU_DF[MENU_DF["item"].str.lower() == item_name]
-            if row.empty:
+            row = menu.resolve(item)
+            if row is None:
                 return f"Não encontrei o item {item}."
-            desc = row.iloc[0]["descricao"]
+            item = row.item
+            desc = row.descricao
             return f"{item}: {desc}."
         return "Qual item você deseja detalhes?"
     # Intents de listar vegetarianos
     elif intent_name == "ItensVegetarianos":
-        df = MENU_DF[MENU_DF["vegetariano"].isin(["sim", "true", "vegano", "vegetariano"])]
-        if df.empty:
+        if not menu.vegetarian:
             return "Nenhum item vegetariano disponível."
-        items = [f"{row['item']} (R${row['preco']:.2f})" for _, row in df.iterrows()]
-        return "Opções vegetarianas: " + ", ".join(items)
+        return "Opções vegetarianas: " + format_items(menu.vegetarian)
     # Intents para adicionar pedido
     elif intent_name == "FazerPedido":
         item = params.get("item") or params.get("Item")
@@ -240,53 +354,49 @@ def handle_intent(intent_name: str, params: dict, session_id: str) -> str:
             # Verifica se a mensagem do usuário menciona uma categoria
             user_text = params.get("queryText", "").lower()
             if "hambúrguer" in user_text or "burger" in user_text:
-                burgers = MENU_DF[MENU_DF["categoria"].str.lower() == "burgers"]
-                if not burgers.empty:
-                    items = [f"{row['item']} (R${row['preco']:.2f})" for _, row in burgers.iterrows()]
-                    return f"Temos estes hambúrgueres: {', '.join(items)}. Qual você gostaria de pedir?"
+                burgers = menu.get_category("burgers")
+                if burgers:
+                    return f"Temos estes hambúrgueres: {format_items(burgers)}. Qual você gostaria de pedir?"
             elif "bebida" in user_text:
-                bebidas = MENU_DF[MENU_DF["categoria"].str.lower() == "bebidas"]
-                if not bebidas.empty:
-                    items = [f"{row['item']} (R${row['preco']:.2f})" for _, row in bebidas.iterrows()]
-                    return f"Temos estas bebidas: {', '.join(items)}. Qual você gostaria de pedir?"
+                bebidas = menu.get_category("bebidas")
+                if bebidas:
+                    return f"Temos estas bebidas: {format_items(bebidas)}. Qual você gostaria de pedir?"
             elif "porção" in user_text or "porcao" in user_text:
-                porcoes = MENU_DF[MENU_DF["categoria"].str.lower() == "porções"]
-                if not porcoes.empty:
-                    items = [f"{row['item']} (R${row['preco']:.2f})" for _, row in porcoes.iterrows()]
-                    return f"Temos estas porções: {', '.join(items)}. Qual você gostaria de pedir?"
+                porcoes = menu.get_category("porções")
+                if porcoes:
+                    return f"Temos estas porções: {format_items(porcoes)}. Qual você gostaria de pedir?"
 
             return "Qual item você deseja pedir? Digite 'ver opções' para ver o cardápio completo."
 
-        item_name = str(item).strip().lower()
-        row = MENU_DF[MENU_DF["item"].str.lower() == item_name]
-        if row.empty:
-            # Busca por correspondência parcial
-            matches = MENU_DF[MENU_DF["item"].str.lower().str.contains(item_name, na=False)]
-            if not matches.empty:
-                items = [f"{row['item']} (R${row['preco']:.2f})" for _, row in matches.iterrows()]
-                return f"Encontrei: {', '.join(items)}. Qual especificamente você quer?"
+        row = menu.resolve(item)
+        if row is None:
+            # Busca por correspondência parcial/aproximada (índice de trigramas)
+            matches = menu.search(item)
+            if matches:
+                return f"Encontrei: {format_items(matches)}. Qual especificamente você quer?"
             return f"Não encontrei o item '{item}'. Digite 'ver opções' para ver o cardápio."
 
-        price = row.iloc[0]["preco"]
+        item = row.item
+        price = row.preco
         try:
             qty = int(quantidade) if quantidade else 1
         except Exception:
             qty = 1
         total_price = price * qty
         # Adiciona no carrinho
-        cart = CARTS.setdefault(session_id, [])
+        cart = sessao["cart"]
         cart.append({"item": item, "qty": qty, "price": price})
-        CARTS['last_action'][session_id] = 'pedido_iniciado'
+        sessao["last_action"] = 'pedido_iniciado'
         return (
             f"Pedido adicionado: {qty}x {item} (R${total_price:.2f}). "
             "Deseja pedir mais alguma coisa ou confirmar?"
         )
     # Intents de confirmação de pedido
     elif intent_name == "ConfirmarPedido":
-        cart = CARTS.get(session_id)
+        cart = sessao["cart"]
         if not cart:
             # Resposta mais amigável e contextual
-            last = CARTS['last_action'].get(session_id)
+            last = sessao["last_action"]
             if last == 'show_menu' or last == 'show_category':
                 return "Ótimo! Qual item você gostaria de pedir?"
             return "Você gostaria de fazer um pedido? Posso mostrar o cardápio ou tirar dúvidas!"
@@ -295,42 +405,28 @@ def handle_intent(intent_name: str, params: dict, session_id: str) -> str:
             f"{itm['qty']}x {itm['item']} (R${itm['price'] * itm['qty']:.2f})"
             for itm in cart
         ]
-        CARTS[session_id] = []  # Limpa carrinho
-        CARTS['last_action'][session_id] = 'pedido_confirmado'
+        sessao["cart"] = []  # Limpa carrinho
+        sessao["last_action"] = 'pedido_confirmado'
         return "Pedido confirmado: " + ", ".join(itens) + f". Total R${total:.2f}. Obrigado!"
     elif intent_name == "NegarPedido":
-        CARTS[session_id] = []  # Limpa carrinho
-        CARTS['last_action'][session_id] = 'pedido_cancelado'
+        sessao["cart"] = []  # Limpa carrinho
+        sessao["last_action"] = 'pedido_cancelado'
         return "Pedido cancelado. Se precisar de algo, estou à disposição!"
     # Intents simples (cumprimento, cardápio, horário, endereço, despedida)
     if intent_name == "BoasVindas":
-        CARTS['last_action'][session_id] = 'boasvindas'
+        sessao["last_action"] = 'boasvindas'
         return "Olá! Bem-vindo à nossa hamburgueria! Como posso te ajudar hoje?"
     elif intent_name == "Cardapio":
-        CARTS['last_action'][session_id] = 'show_menu'
+        sessao["last_action"] = 'show_menu'
         return "Temos hambúrgueres artesanais, porções e bebidas geladas. Deseja ver as opções?"
     elif intent_name == "MostrarItens":
         # Mostra o cardápio detalhado com todos os itens
-        CARTS['last_action'][session_id] = 'show_items'
-        if MENU_DF is None or MENU_DF.empty:
+        sessao["last_action"] = 'show_items'
+        if not menu:
             return "Cardápio não disponível no momento."
 
-        # Agrupa por categoria e lista os itens
-        categorias = MENU_DF['categoria'].unique()
-        resultado = "📋 **CARDÁPIO COMPLETO** 📋\n\n"
-
-        for categoria in categorias:
-            items_categoria = MENU_DF[MENU_DF['categoria'] == categoria]
-            resultado += f"🍴 **{categoria.upper()}**\n"
-            for _, item in items_categoria.iterrows():
-                vegetariano = " 🌱" if item.get('vegetariano', '').lower() in ['sim', 'true', 'vegetariano'] else ""
-                resultado += f"• {item['item']} - R${item['preco']:.2f}{vegetariano}\n"
-                if pd.notna(item.get('descricao', '')):
-                    resultado += f"  {item['descricao']}\n"
-            resultado += "\n"
-
-        resultado += "💬 Digite o nome do item que deseja pedir!"
-        return resultado
+        # Texto pré-renderizado por versão do cardápio (recalculado só após upload)
+        return menu.render(formato) + "💬 Digite o nome do item que deseja pedir!"
     elif intent_name == "HorarioFuncionamento":
         return "Funcionamos de terça a domingo, das 18h às 23h."
     elif intent_name == "Endereco":
@@ -350,23 +446,7 @@ def dialogflow_webhook():
         user_message = body['text']
         session_id = "usuario-streamlit"
         push_session_entities(session_id)
-        url = (
-            f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/sessions/"
-            f"{session_id}:detectIntent"
-        )
-        payload = {
-            "queryInput": {
-                "text": {
-                    "text": user_message,
-                    "languageCode": LANG,
-                }
-            }
-        }
-        df_response = GSESSION.post(url, json=payload).json()
-        intent = df_response.get("queryResult", {}).get("intent", {}).get("displayName")
-        params = df_response.get("queryResult", {}).get("parameters", {})
-        # Adiciona o texto original do usuário aos parâmetros para fallback inteligente
-        params["queryText"] = user_message
+        intent, params = detect_intent(user_message, session_id)
         print(f"[DEBUG] detectIntent: texto='{user_message}' intent='{intent}' params={params}")
         response = handle_intent(intent, params, session_id)
         return {"fulfillmentText": response}
@@ -376,7 +456,8 @@ def dialogflow_webhook():
     push_session_entities(session_id)
     intent = body.get("queryResult", {}).get("intent", {}).get("displayName")
     params = body.get("queryResult", {}).get("parameters", {})
-    response = handle_intent(intent, params, session_id)
+    # Respostas do fulfillment chegam ao Telegram como texto puro
+    response = handle_intent(intent, params, session_id, formato="text")
     return {"fulfillmentText": response}
 
 
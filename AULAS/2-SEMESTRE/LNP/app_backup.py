@@ -4,7 +4,10 @@ import pandas as pd
 import requests
 from flask import Flask, request, render_template_string, redirect
 from google.oauth2 import service_account
-from google.auth.transport.requests import AuthorizedSession
+
+from http_transport import DIALOGFLOW_API, dialogflow_transport
+from menu_index import MenuIndex
+from session_entities import push_item_entities
 
 # CONFIGURAÇÕES
 # Arquivo de credenciais da conta de serviço Dialogflow
@@ -22,13 +25,15 @@ app = Flask(__name__)
 MENU_DF: pd.DataFrame | None = None
 # Carrinhos de compra por sessão (chat)
 CARTS: dict[str, list[dict]] = {}
+# (DataFrame de origem, índice) usado para montar o @Item pré-serializado
+_ENTITY_SOURCE: tuple[pd.DataFrame, MenuIndex] | None = None
 
 # Autenticação com a API Dialogflow
 SCOPES = ["https://www.googleapis.com/auth/dialogflow"]
 credentials = service_account.Credentials.from_service_account_file(
     CREDENTIALS_FILE, scopes=SCOPES
 )
-GSESSION = AuthorizedSession(credentials)
+GSESSION = dialogflow_transport(credentials)
 
 # HTML simples para a página de upload do cardápio
 HTML = """
@@ -114,33 +119,15 @@ def push_session_entities(session_id: str) -> None:
     Envia entidades dinâmicas para a sessão do Dialogflow.
     Cada item do cardápio vira um valor em @Item com sinônimos opcionais.
     """
+    global _ENTITY_SOURCE
     if not ensure_menu_loaded():
         return
-    import pandas as pd  # Import local para tipagem
-    # Lista de entidades
-    items_entities = []
-    for _, row in MENU_DF.iterrows():
-        value = str(row["item"]).strip()
-        synonyms = [value]
-        # Se houver coluna de sinônimos, separa por |
-        if "sinonimos" in MENU_DF.columns:
-            raw = row.get("sinonimos", "")
-            if pd.notna(raw) and str(raw).strip() != "":
-                parts = str(raw).split("|")
-                synonyms += [p.strip() for p in parts if p.strip()]
-        items_entities.append({"value": value, "synonyms": synonyms})
-    # Monta payload do session entity type
-    url = (
-        f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/sessions/"
-        f"{session_id}/entityTypes/Item"
-    )
-    payload = {
-        "entityOverrideMode": "ENTITY_OVERRIDE_MODE_OVERRIDE",
-        "entities": items_entities,
-    }
+    # Índice recriado apenas quando o DataFrame do cardápio é substituído
+    if _ENTITY_SOURCE is None or _ENTITY_SOURCE[0] is not MENU_DF:
+        _ENTITY_SOURCE = (MENU_DF, MenuIndex.from_dataframe(MENU_DF))
     try:
-        # Utiliza PUT para criar/atualizar o SessionEntityType
-        GSESSION.put(url, json=payload)
+        # Utiliza PUT com o corpo pré-serializado compartilhado com app.py
+        push_item_entities(GSESSION, PROJECT_ID, session_id, _ENTITY_SOURCE[1])
     except Exception as e:
         # Em caso de falha, apenas registra no log (não interrompe fluxo)
         print("Falha ao enviar entidades dinâmicas:", e)
@@ -319,7 +306,7 @@ def dialogflow_webhook():
         session_id = "usuario-streamlit"
         push_session_entities(session_id)
         url = (
-            f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/sessions/"
+            f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/sessions/"
             f"{session_id}:detectIntent"
         )
         payload = {
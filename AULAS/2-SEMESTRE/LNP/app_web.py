@@ -3,8 +3,15 @@ import json
 import random
 from datetime import datetime, timedelta
 from flask import Flask, request, render_template, jsonify, redirect, url_for
-from google.oauth2 import service_account
-from google.auth.transport.requests import AuthorizedSession
+
+from http_transport import (
+    DIALOGFLOW_API, dialogflow_credentials, dialogflow_transport, pool_stats,
+)
+from intent_cache import IntentCache, active_contexts
+from telegram_polling import LongPoller
+from telegram_queue import ShardedUpdateQueue, extract_message
+from telegram_sender import TelegramSender
+from update_dedup import UpdateDedup
 
 # CONFIGURAÇÕES
 CREDENTIALS_FILE = "fiap-boot-a239f7750ffc.json"
@@ -22,14 +29,22 @@ CONTADOR_CHAMADOS = 1000
 
 # Autenticação com a API Dialogflow
 SCOPES = ["https://www.googleapis.com/auth/dialogflow"]
-credentials = service_account.Credentials.from_service_account_file(
-    CREDENTIALS_FILE, scopes=SCOPES
-)
-GSESSION = AuthorizedSession(credentials)
+credentials = dialogflow_credentials(CREDENTIALS_FILE, SCOPES)
+GSESSION = dialogflow_transport(credentials)
+
+# Intents de resposta fixa: não dependem do contexto da conversa nem abrem contextos
+CACHEABLE_INTENTS = {"FAQ_Informacoes", "Horario_Funcionamento", "Planos_Precos", "Solucoes_Rapidas"}
+INTENT_CACHE = IntentCache(CACHEABLE_INTENTS)
 
 def detect_intent(text: str, session_id: str = "default") -> dict:
-    """Detecta a intenção do usuário usando Dialogflow."""
-    url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/sessions/{session_id}:detectIntent"
+    """Detecta a intenção do usuário usando Dialogflow (com cache para perguntas fixas)."""
+    chave = INTENT_CACHE.key(text, INTENT_CACHE.session_context(session_id))
+    cached = INTENT_CACHE.get(chave)
+    if cached is not None:
+        intent, params = cached
+        return {"intent": intent, "params": {**params, "queryText": text}}
+
+    url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/sessions/{session_id}:detectIntent"
     
     payload = {
         "queryInput": {
@@ -43,9 +58,12 @@ def detect_intent(text: str, session_id: str = "default") -> dict:
     try:
         response = GSESSION.post(url, json=payload)
         if response.status_code == 200:
-            result = response.json()
-            intent = result.get("queryResult", {}).get("intent", {}).get("displayName", "Default Fallback Intent")
-            params = result.get("queryResult", {}).get("parameters", {})
+            query_result = response.json().get("queryResult", {})
+            intent = query_result.get("intent", {}).get("displayName", "Default Fallback Intent")
+            params = query_result.get("parameters", {})
+            contextos = active_contexts(query_result.get("outputContexts"))
+            INTENT_CACHE.set_session_context(session_id, contextos)
+            INTENT_CACHE.put(chave, intent, (intent, dict(params)), contextos)
             params["queryText"] = text
             
             print(f"[DEBUG] detectIntent: texto='{text}' intent='{intent}' params={params}")
@@ -398,7 +416,7 @@ def buscar_chamado(chamado_id):
 def listar_intents():
     """Lista todas as intents do Dialogflow."""
     try:
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents"
         response = GSESSION.get(url)
         
         if response.status_code == 200:
@@ -424,7 +442,7 @@ def buscar_intent(intent_name):
     """Busca uma intent específica."""
     try:
         # Buscar intent por displayName
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents"
         response = GSESSION.get(url)
         
         if response.status_code == 200:
@@ -478,7 +496,7 @@ def criar_intent():
         if data.get("contexts"):
             intent_payload["inputContextNames"] = data["contexts"].split(",")
         
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents"
         response = GSESSION.post(url, json=intent_payload)
         
         if response.status_code == 200:
@@ -495,7 +513,7 @@ def excluir_intent(intent_name):
     """Exclui uma intent."""
     try:
         # Primeiro, buscar o ID da intent
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents"
         response = GSESSION.get(url)
         
         if response.status_code == 200:
@@ -510,7 +528,7 @@ def excluir_intent(intent_name):
                     break
             
             if intent_id:
-                delete_url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents/{intent_id}"
+                delete_url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents/{intent_id}"
                 delete_response = GSESSION.delete(delete_url)
                 
                 if delete_response.status_code == 200:
@@ -532,7 +550,7 @@ def excluir_intent(intent_name):
 def listar_entidades():
     """Lista todas as entidades do Dialogflow."""
     try:
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/entityTypes"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/entityTypes"
         response = GSESSION.get(url)
         
         if response.status_code == 200:
@@ -557,7 +575,7 @@ def buscar_entidade(entity_name):
     """Busca uma entidade específica."""
     try:
         # Buscar entidade por displayName
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/entityTypes"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/entityTypes"
         response = GSESSION.get(url)
         
         if response.status_code == 200:
@@ -602,7 +620,7 @@ def criar_entidade():
             "autoExpansionMode": "AUTO_EXPANSION_MODE_DEFAULT" if data.get("autoExpand") else "AUTO_EXPANSION_MODE_DISABLED"
         }
         
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/entityTypes"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/entityTypes"
         response = GSESSION.post(url, json=entity_payload)
         
         if response.status_code == 200:
@@ -619,7 +637,7 @@ def excluir_entidade(entity_name):
     """Exclui uma entidade."""
     try:
         # Primeiro, buscar o ID da entidade
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/entityTypes"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/entityTypes"
         response = GSESSION.get(url)
         
         if response.status_code == 200:
@@ -634,7 +652,7 @@ def excluir_entidade(entity_name):
                     break
             
             if entity_id:
-                delete_url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/entityTypes/{entity_id}"
+                delete_url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/entityTypes/{entity_id}"
                 delete_response = GSESSION.delete(delete_url)
                 
                 if delete_response.status_code == 200:
@@ -652,37 +670,52 @@ def excluir_entidade(entity_name):
 
 # ==================== TELEGRAM WEBHOOK ====================
 
+def process_telegram_message(chat_id: int, text: str) -> None:
+    """Processa uma mensagem do Telegram (thread da fila) e envia a resposta."""
+    # Detectar intenção
+    result = detect_intent(text, f"telegram_{chat_id}")
+    intent_name = result["intent"]
+    params = result["params"]
+
+    # Processar resposta
+    response = handle_intent(intent_name, params, f"telegram_{chat_id}")
+
+    # Enviar resposta para o Telegram (fila de saída com limite de taxa)
+    TELEGRAM_SENDER.send(chat_id, response, parse_mode="Markdown")
+
+# Respostas enviadas dentro dos limites da Bot API (sem TELEGRAM_TOKEN, nada é enviado)
+TELEGRAM_SENDER = TelegramSender(os.getenv("TELEGRAM_TOKEN"))
+
+# Mensagens do Telegram processadas fora do webhook, em ordem por chat
+TELEGRAM_QUEUE = ShardedUpdateQueue(process_telegram_message)
+# update_ids já aceitos (o Telegram reentrega quando o webhook demora)
+TELEGRAM_DEDUP = UpdateDedup()
+
+def enqueue_telegram_update(update: dict) -> bool | None:
+    """Enfileira uma atualização (webhook e long polling): None sem texto, False com a fila cheia."""
+    mensagem = extract_message(update)
+    if mensagem is None:
+        return None
+    chat_id, text = mensagem
+    update_id = update.get("update_id")
+    # Reentrega de uma atualização já aceita: descarta antes de qualquer chamada externa
+    if not TELEGRAM_DEDUP.claim(update_id, chat_id):
+        return None
+    if not TELEGRAM_QUEUE.submit(chat_id, text):
+        TELEGRAM_DEDUP.release(update_id, chat_id)
+        return False
+    return True
+
+# Long polling (TELEGRAM_MODE=polling ao rodar este arquivo; não usar com gunicorn)
+TELEGRAM_POLLER: LongPoller | None = None
+
 @app.route("/telegram", methods=["POST"])
 def telegram_webhook():
-    """Webhook para Telegram."""
+    """Webhook para Telegram: valida, enfileira e responde na hora."""
     try:
-        data = request.get_json()
-        message = data.get("message", {})
-        text = message.get("text", "")
-        chat_id = message.get("chat", {}).get("id")
-        
-        if not text or not chat_id:
-            return "OK", 200
-        
-        # Detectar intenção
-        result = detect_intent(text, f"telegram_{chat_id}")
-        intent_name = result["intent"]
-        params = result["params"]
-        
-        # Processar resposta
-        response = handle_intent(intent_name, params, f"telegram_{chat_id}")
-        
-        # Enviar resposta para o Telegram
-        telegram_token = os.getenv("TELEGRAM_TOKEN")
-        if telegram_token:
-            telegram_url = f"https://api.telegram.org/bot{telegram_token}/sendMessage"
-            telegram_data = {
-                "chat_id": chat_id,
-                "text": response,
-                "parse_mode": "Markdown"
-            }
-            
-            requests.post(telegram_url, json=telegram_data)
+        # Fila cheia: o Telegram reentrega a atualização mais tarde
+        if enqueue_telegram_update(request.get_json() or {}) is False:
+            return "BUSY", 503
         
         return "OK", 200
         
@@ -698,7 +731,13 @@ def health():
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "http": pool_stats(),
+        "intent_cache": INTENT_CACHE.stats(),
+        "telegram_queue": TELEGRAM_QUEUE.stats(),
+        "telegram_sender": TELEGRAM_SENDER.stats(),
+        "telegram_dedup": TELEGRAM_DEDUP.stats(),
+        "telegram_polling": TELEGRAM_POLLER.stats() if TELEGRAM_POLLER else None
     })
 
 if __name__ == "__main__":
@@ -710,4 +749,15 @@ if __name__ == "__main__":
     print(f"🔧 Debug: {debug}")
     print(f"🌐 Acesse: http://localhost:{port}")
     
+    telegram_token = os.getenv("TELEGRAM_TOKEN")
+    # Com debug o reloader do Werkzeug roda este bloco também no processo pai, que só vigia
+    # os arquivos; o polling fica no filho (WERKZEUG_RUN_MAIN) para não haver dois getUpdates
+    processo_servidor = not debug or os.getenv("WERKZEUG_RUN_MAIN") == "true"
+    if telegram_token and os.getenv("TELEGRAM_MODE", "webhook") == "polling" and processo_servidor:
+        # Sem URL pública: mensagens do Telegram via getUpdates
+        print("📨 Telegram: long polling")
+        TELEGRAM_POLLER = LongPoller(telegram_token, enqueue_telegram_update)
+        TELEGRAM_POLLER.delete_webhook()
+        TELEGRAM_POLLER.start()
+    
     app.run(host="0.0.0.0", port=port, debug=debug)
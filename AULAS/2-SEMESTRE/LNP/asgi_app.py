@@ -0,0 +1,252 @@
+"""
+Modo assíncrono (ASGI) do bot da hamburgueria.
+
+No Flask cada mensagem ocupa uma thread durante as chamadas de rede
+(PUT de @Item, detectIntent e sendMessage do Telegram), o que limita as
+conversas simultâneas a workers × threads. Aqui essas chamadas são feitas
+com clientes assíncronos (httpx) em um único event loop, e um processo
+atende milhares de conversas em andamento. A lógica de negócio é a mesma:
+cardápio, carrinhos e respostas vêm de app.handle_intent, executado no
+pool de threads do Starlette (ele pode gravar sessões no SQLite e não deve
+bloquear o event loop). O detectIntent usa o mesmo disjuntor, orçamento de
+latência e classificação local do app.py.
+
+O webhook do Telegram só valida a atualização, descarta reentregas por
+update_id (UpdateDedup) e responde 200; o push de @Item, o detectIntent e
+o envio acontecem numa tarefa em segundo plano, em ordem por chat (um
+asyncio.Lock por chat com mensagens em andamento). As respostas saem pelo
+AsyncTelegramSender, com os limites de taxa da Bot API. Acima de
+MAX_QUEUE_DEPTH atualizações pendentes o webhook responde 503 e o Telegram
+reentrega mais tarde. Corpo que não é JSON recebe 400.
+
+Rotas:
+    POST /dialogflow  -> mesmo contrato do app.py ({"text": ...} ou payload de fulfillment)
+    POST /webhook     -> webhook do Telegram (como o webhook_telegram.py)
+    GET  /stats/http  -> estatísticas dos transportes HTTP
+    GET  /stats/queue -> atualizações pendentes, envio ao Telegram e repetidas
+
+Execução:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5009
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+import app as hamburgueria
+from circuit_breaker import DETECT_INTENT_TIMEOUT, OPEN, http_failure
+from http_transport import DIALOGFLOW_API, AsyncHttpTransport, pool_stats
+from session_entities import AsyncEntityPusher, push_item_entities_async
+from telegram_queue import MAX_QUEUE_DEPTH, extract_message
+from telegram_sender import AsyncTelegramSender
+from update_dedup import UpdateDedup
+
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+
+# Clientes assíncronos (criados no startup, dentro do event loop)
+DIALOGFLOW: AsyncHttpTransport | None = None
+TELEGRAM: AsyncHttpTransport | None = None
+ENTITY_PUSHER: AsyncEntityPusher | None = None
+# Respostas enviadas dentro dos limites da Bot API
+TELEGRAM_SENDER: AsyncTelegramSender | None = None
+# update_ids já aceitos (o Telegram reentrega quando o webhook demora)
+TELEGRAM_DEDUP = UpdateDedup()
+# chat_id -> [lock, atualizações do chat pendentes]; sai do dicionário quando zera
+_CHAT_LOCKS: dict[object, list] = {}
+# Atualizações aceitas ainda em processamento e contadores (/stats/queue)
+UPDATE_STATS = {"pending": 0, "processed": 0, "rejected": 0, "errors": 0}
+
+
+async def _push_entities(session_id: str) -> None:
+    await push_item_entities_async(DIALOGFLOW, hamburgueria.PROJECT_ID, session_id,
+                                   hamburgueria.MENU_INDEX, hamburgueria.ENTITY_TRACKER)
+
+
+async def push_session_entities(session_id: str) -> None:
+    """Só espera o @Item no primeiro turno da sessão (ver app.push_session_entities)."""
+    if (hamburgueria.ITEM_ENTITY_MODE == "agent" or hamburgueria.DIALOGFLOW_BREAKER.state == OPEN
+            or not hamburgueria.ensure_menu_loaded()):
+        return
+    await ENTITY_PUSHER.ensure(session_id, hamburgueria.MENU_INDEX.version)
+
+
+async def local_intent(text: str) -> tuple[str | None, dict]:
+    """app.local_intent fora do event loop (carrega o modelo na primeira vez)."""
+    return await run_in_threadpool(hamburgueria.local_intent, text)
+
+
+async def detect_intent(text: str, session_id: str) -> tuple[str | None, dict]:
+    """
+    detectIntent assíncrono pelo disjuntor do app.py (DIALOGFLOW_BREAKER) e
+    com o mesmo orçamento de latência; se o Dialogflow falhar, demorar ou
+    estiver com o disjuntor aberto, usa a classificação local.
+    """
+    breaker = hamburgueria.DIALOGFLOW_BREAKER
+    if not breaker.allow():
+        return await local_intent(text)
+    url = f"{DIALOGFLOW_API}/projects/{hamburgueria.PROJECT_ID}/agent/sessions/{session_id}:detectIntent"
+    payload = {"queryInput": {"text": {"text": text, "languageCode": hamburgueria.LANG}}}
+    inicio = time.monotonic()
+    try:
+        resp = await DIALOGFLOW.post(url, json=payload, timeout=DETECT_INTENT_TIMEOUT, retries=0)
+    except Exception as e:
+        breaker.record_failure()
+        print("[WARN] detectIntent indisponível, usando classificação local:", e)
+        return await local_intent(text)
+    if http_failure(resp):
+        breaker.record_failure()
+    else:
+        breaker.record_success(time.monotonic() - inicio)
+    if resp.status_code != 200:
+        print(f"[WARN] detectIntent {resp.status_code}, usando classificação local: {resp.text[:200]}")
+        return await local_intent(text)
+    try:
+        query_result = resp.json().get("queryResult", {})
+    except (ValueError, AttributeError) as e:
+        print("[WARN] detectIntent com resposta inválida, usando classificação local:", e)
+        return await local_intent(text)
+    intent = query_result.get("intent", {}).get("displayName")
+    params = dict(query_result.get("parameters", {}))
+    params["queryText"] = text
+    return intent, params
+
+
+async def _json_body(request: Request) -> dict | None:
+    """Corpo JSON da requisição; None se não é um objeto JSON válido."""
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+async def dialogflow_webhook(request: Request) -> JSONResponse:
+    """Mesmo contrato de app.dialogflow_webhook, sem bloquear threads na rede."""
+    body = await _json_body(request)
+    if body is None:
+        return JSONResponse({"error": "JSON inválido"}, status_code=400)
+    if "text" in body:
+        session_id = "usuario-streamlit"
+        await push_session_entities(session_id)
+        intent, params = await detect_intent(body["text"], session_id)
+        response = await run_in_threadpool(hamburgueria.handle_intent, intent, params, session_id)
+        return JSONResponse({"fulfillmentText": response})
+    # Suporte legado (payload de fulfillment do Dialogflow)
+    session = body.get("session", "")
+    session_id = session.split("/")[-1] if session else "unknown"
+    await push_session_entities(session_id)
+    query_result = body.get("queryResult", {})
+    intent = query_result.get("intent", {}).get("displayName")
+    params = query_result.get("parameters", {})
+    response = await run_in_threadpool(hamburgueria.handle_intent, intent, params, session_id,
+                                       formato="text")
+    return JSONResponse({"fulfillmentText": response})
+
+
+async def process_update(chat_id, user_message: str) -> None:
+    """Processa uma atualização já confirmada ao Telegram: entidades, intent e resposta."""
+    entrada = _CHAT_LOCKS.setdefault(chat_id, [asyncio.Lock(), 0])
+    entrada[1] += 1
+    try:
+        # Uma mensagem do chat por vez: respostas na ordem das mensagens
+        async with entrada[0]:
+            session_id = str(chat_id)
+            try:
+                await push_session_entities(session_id)
+            except Exception as e:
+                print("Erro ao atualizar entidades:", e)
+            intent, params = await detect_intent(user_message, session_id)
+            # Texto puro: a mensagem é enviada sem parse_mode
+            reply = await run_in_threadpool(hamburgueria.handle_intent, intent, params, session_id,
+                                            formato="text")
+            await TELEGRAM_SENDER.send(chat_id, reply)
+    except Exception as e:
+        print(f"Erro ao processar atualização do chat {chat_id}:", e)
+        UPDATE_STATS["errors"] += 1
+    finally:
+        entrada[1] -= 1
+        if not entrada[1]:
+            del _CHAT_LOCKS[chat_id]
+        UPDATE_STATS["pending"] -= 1
+        UPDATE_STATS["processed"] += 1
+
+
+async def telegram_webhook(request: Request) -> PlainTextResponse:
+    """
+    Recebe a atualização do Telegram e agenda o processamento (process_update)
+    para depois da resposta. Reentregas de uma atualização já aceita são
+    ignoradas; com atualizações demais pendentes responde 503.
+    """
+    data = await _json_body(request)
+    if data is None:
+        return PlainTextResponse("invalid json", status_code=400)
+    mensagem = extract_message(data)
+    if mensagem is None:
+        return PlainTextResponse("skip")
+    chat_id, user_message = mensagem
+    update_id = data.get("update_id")
+    if not TELEGRAM_DEDUP.claim(update_id, chat_id):
+        return PlainTextResponse("skip")
+    if UPDATE_STATS["pending"] >= MAX_QUEUE_DEPTH:
+        # Não aceita: a reentrega do Telegram deve ser processada
+        TELEGRAM_DEDUP.release(update_id, chat_id)
+        UPDATE_STATS["rejected"] += 1
+        return PlainTextResponse("busy", status_code=503)
+    UPDATE_STATS["pending"] += 1
+    return PlainTextResponse("ok", background=BackgroundTask(process_update, chat_id, user_message))
+
+
+async def home(request: Request) -> PlainTextResponse:
+    """Página de health check."""
+    return PlainTextResponse("Bot online (async)")
+
+
+async def http_stats(request: Request) -> JSONResponse:
+    """Estatísticas dos transportes HTTP (síncronos e assíncronos)."""
+    return JSONResponse(pool_stats())
+
+
+async def queue_stats(request: Request) -> JSONResponse:
+    """Atualizações pendentes, envio ao Telegram e atualizações repetidas descartadas."""
+    return JSONResponse({**UPDATE_STATS, "max_depth": MAX_QUEUE_DEPTH, "chats": len(_CHAT_LOCKS),
+                         "sender": TELEGRAM_SENDER.stats() if TELEGRAM_SENDER else None,
+                         "dedup": TELEGRAM_DEDUP.stats()})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global DIALOGFLOW, TELEGRAM, ENTITY_PUSHER, TELEGRAM_SENDER
+    DIALOGFLOW = AsyncHttpTransport(hamburgueria.credentials, name="dialogflow-async")
+    TELEGRAM = AsyncHttpTransport(name="telegram-async")
+    TELEGRAM_SENDER = AsyncTelegramSender(TELEGRAM_TOKEN, TELEGRAM)
+    ENTITY_PUSHER = AsyncEntityPusher(_push_entities, hamburgueria.ENTITY_TRACKER)
+    hamburgueria.ensure_menu_loaded()
+    yield
+    await DIALOGFLOW.aclose()
+    await TELEGRAM.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route("/", home),
+        Route("/dialogflow", dialogflow_webhook, methods=["POST"]),
+        Route("/webhook", telegram_webhook, methods=["POST"]),
+        Route("/stats/http", http_stats),
+        Route("/stats/queue", queue_stats),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=5009)
@@ -0,0 +1,164 @@
+"""
+Disjuntor (circuit breaker) e orçamento de latência para o Dialogflow.
+
+Sem limite de tempo, uma lentidão do Dialogflow prende cada worker do
+gunicorn até o --timeout matar o processo, e as mensagens se acumulam.
+Cada chamada ao detectIntent tem um orçamento de latência (timeout curto,
+sem novas tentativas) e passa pelo disjuntor:
+
+    CLOSED     chamadas normais; erros e chamadas lentas seguidas são contados
+    OPEN       após FAILURE_THRESHOLD falhas seguidas: nenhuma chamada é feita
+               e a mensagem vai direto para o processamento local
+    HALF_OPEN  passado RESET_TIMEOUT, uma chamada de teste é liberada; se der
+               certo o disjuntor fecha, se falhar abre de novo
+
+Assim, durante uma lentidão, a latência da resposta fica limitada ao
+orçamento (e, com o disjuntor aberto, ao processamento local).
+"""
+
+import os
+import threading
+import time
+
+# Falhas (erros ou chamadas lentas) seguidas que abrem o disjuntor
+FAILURE_THRESHOLD = int(os.getenv("DIALOGFLOW_BREAKER_FAILURES", "5"))
+# Chamada mais lenta que isso conta como falha, mesmo com resposta (segundos)
+SLOW_CALL_SECONDS = float(os.getenv("DIALOGFLOW_SLOW_CALL", "2.0"))
+# Tempo com o disjuntor aberto antes da chamada de teste (segundos)
+RESET_TIMEOUT = float(os.getenv("DIALOGFLOW_BREAKER_RESET", "15"))
+# Chamadas de teste simultâneas no estado HALF_OPEN
+HALF_OPEN_PROBES = 1
+# Orçamento de latência do detectIntent: (conexão, leitura) em segundos
+DETECT_INTENT_TIMEOUT = (1.0, float(os.getenv("DETECT_INTENT_BUDGET", "2.5")))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Disjuntores criados no processo (nome -> disjuntor), para breaker_stats()
+_BREAKERS: dict[str, "CircuitBreaker"] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Chamada recusada: o disjuntor está aberto."""
+
+
+def http_failure(resp) -> bool:
+    """Respostas que indicam serviço com problema (5xx e 429)."""
+    status = getattr(resp, "status_code", 200)
+    return status >= 500 or status == 429
+
+
+class CircuitBreaker:
+    """Disjuntor por falhas seguidas, com chamadas de teste após RESET_TIMEOUT; seguro entre threads."""
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 slow_call_seconds: float = SLOW_CALL_SECONDS,
+                 reset_timeout: float = RESET_TIMEOUT, half_open_probes: int = HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._calls = 0
+        self._rejected = 0
+        self._slow = 0
+        self._trips = 0
+        with _REGISTRY_LOCK:
+            _BREAKERS[name] = self
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """Reserva uma chamada; False se o disjuntor está aberto (ou sem vaga de teste)."""
+        with self._lock:
+            estado = self._current_state()
+            if estado == CLOSED:
+                self._calls += 1
+                return True
+            if estado == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                self._calls += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self, elapsed: float = 0.0) -> None:
+        """Registra uma chamada concluída; lenta demais conta como falha."""
+        if elapsed > self.slow_call_seconds:
+            with self._lock:
+                self._slow += 1
+            self.record_failure()
+            return
+        with self._lock:
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                self._state = CLOSED
+
+    def record_failure(self) -> None:
+        """Registra um erro; abre o disjuntor no limite (ou se a chamada de teste falhou)."""
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+                self._trips += 1
+
+    def call(self, fn, *args, is_failure=None, **kwargs):
+        """
+        Executa fn pelo disjuntor. Levanta CircuitOpenError sem chamar fn se
+        ele estiver aberto; exceções de fn contam como falha e são relançadas.
+        `is_failure(resultado)` marca como falha respostas sem exceção (ex.: HTTP 503).
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name}: circuito aberto")
+        inicio = time.monotonic()
+        try:
+            resultado = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        if is_failure is not None and is_failure(resultado):
+            self.record_failure()
+        else:
+            self.record_success(time.monotonic() - inicio)
+        return resultado
+
+    def stats(self) -> dict:
+        """Estado atual e contadores do disjuntor."""
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "calls": self._calls,
+                "rejected": self._rejected,
+                "slow_calls": self._slow,
+                "trips": self._trips,
+            }
+
+
+def breaker_stats() -> list[dict]:
+    """Estatísticas de todos os disjuntores do processo."""
+    with _REGISTRY_LOCK:
+        breakers = list(_BREAKERS.values())
+    return [b.stats() for b in breakers]
@@ -1,5 +1,5 @@
 from google.oauth2 import service_account
-from google.auth.transport.requests import AuthorizedSession
+from http_transport import DIALOGFLOW_API, dialogflow_transport
 
 # Dados
 PROJECT_ID = "fiap-boot"
@@ -8,7 +8,7 @@ CREDENTIALS_FILE = "fiap-boot-a239f7750ffc.json"
 # Autenticação
 scopes = ["https://www.googleapis.com/auth/dialogflow"]
 credentials = service_account.Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=scopes)
-authed_session = AuthorizedSession(credentials)
+authed_session = dialogflow_transport(credentials)
 
 # JSON da intent
 intent = {
@@ -33,7 +33,7 @@ intent = {
 }
 
 # Requisição para criar a intent
-url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents"
+url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents"
 response = authed_session.post(url, json=intent)
 
 # Resultado
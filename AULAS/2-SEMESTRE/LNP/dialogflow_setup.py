@@ -7,7 +7,7 @@ import os
 import json
 import requests
 from google.oauth2 import service_account
-from google.auth.transport.requests import AuthorizedSession
+from http_transport import DIALOGFLOW_API, dialogflow_transport
 
 def setup_dialogflow_webhook():
     """Configura o webhook do Dialogflow."""
@@ -33,10 +33,10 @@ def setup_dialogflow_webhook():
         credentials = service_account.Credentials.from_service_account_file(
             CREDENTIALS_FILE, scopes=SCOPES
         )
-        session = AuthorizedSession(credentials)
+        session = dialogflow_transport(credentials)
         
         # URL da API do Dialogflow
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent"
         
         # Dados do webhook
         webhook_data = {
@@ -82,10 +82,10 @@ def list_intents():
         credentials = service_account.Credentials.from_service_account_file(
             CREDENTIALS_FILE, scopes=SCOPES
         )
-        session = AuthorizedSession(credentials)
+        session = dialogflow_transport(credentials)
         
         # URL da API
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents"
         
         print("📋 Listando intents...")
         
@@ -129,10 +129,10 @@ def enable_webhook_for_intents():
         credentials = service_account.Credentials.from_service_account_file(
             CREDENTIALS_FILE, scopes=SCOPES
         )
-        session = AuthorizedSession(credentials)
+        session = dialogflow_transport(credentials)
         
         # Listar intents
-        url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents"
+        url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents"
         response = session.get(url)
         
         if response.status_code != 200:
@@ -161,7 +161,7 @@ def enable_webhook_for_intents():
                 "webhookState": "WEBHOOK_STATE_ENABLED"
             }
             
-            update_url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents/{intent_id}"
+            update_url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents/{intent_id}"
             update_response = session.patch(update_url, json=update_data)
             
             if update_response.status_code == 200:
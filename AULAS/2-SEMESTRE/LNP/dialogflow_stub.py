@@ -0,0 +1,641 @@
+"""
+Servidor local que imita a API REST v2 do Dialogflow, para testes offline e benchmarks.
+
+Implementa os endpoints usados pelos apps:
+    POST   .../agent/sessions/<sessão>:detectIntent
+    GET/PUT/PATCH/DELETE .../agent/sessions/<sessão>/entityTypes/<nome>
+    GET/POST .../agent/intents         GET/PATCH/DELETE .../agent/intents/<id>
+    GET/POST .../agent/entityTypes     GET/PATCH/DELETE .../agent/entityTypes/<id>
+    POST   .../agent/entityTypes/<id>/entities:batchUpdate | :batchDelete
+    GET/PATCH .../agent
+
+As intents vêm de intents_hamburgueria.json e intent_PedidoDetalhado.json
+(e das criadas pela API); a intent é escolhida pelo classificador do
+local_nlu.py, retreinado quando as intents mudam. Parâmetros são extraídos
+procurando no texto os sinônimos das entidades: as do agente (semeadas de
+entities_hamburgueria.json) e as de sessão (@Item enviado pelos apps), que
+têm precedência. Entidades de sessão que a intent não declara também viram
+parâmetro (ex.: @Item -> "item"), como no agente configurado no console.
+
+Latência e falhas são configuráveis, para reproduzir lentidões e erros:
+    --latency fixed:120 | uniform:100,400 | normal:250,60 | lognormal:200,0.5   (ms)
+    --error-rate 0.02 --error-status 503    respostas de erro injetadas
+    --stall-rate 0.01 --stall-seconds 30    chamadas que "travam" (timeouts)
+A configuração também pode ser trocada em execução: POST /stub/config
+(mesmas chaves, com "_" no lugar de "-"); GET /stub/stats mostra contadores.
+
+Uso:
+    python dialogflow_stub.py --port 5010 --latency lognormal:200,0.5
+    DIALOGFLOW_API_URL=http://127.0.0.1:5010/v2 python app.py
+
+O estado fica em memória do processo: rode com um único processo (threads).
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+from flask import Flask, jsonify, request
+
+from local_nlu import ENTITIES_FILE, INTENT_FILES, LocalNLU, expand_placeholders
+from menu_index import normalizar, remover_acentos
+
+# Confiança mínima para casar uma intent (limiar padrão de ML do Dialogflow)
+MATCH_THRESHOLD = 0.3
+# Validade de um SessionEntityType (segundos), como no Dialogflow
+SESSION_ENTITY_TTL = 20 * 60
+FALLBACK_INTENT = "Default Fallback Intent"
+FALLBACK_TEXT = "Desculpe, não entendi."
+PAGE_SIZE = 100
+
+_STATUS_NAMES = {400: "INVALID_ARGUMENT", 404: "NOT_FOUND", 409: "ALREADY_EXISTS",
+                 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE",
+                 504: "DEADLINE_EXCEEDED"}
+_PLACEHOLDER = re.compile(r"@([\w-]+)(?::([\w-]+))?")
+
+app = Flask(__name__)
+
+
+def _norm(texto: str) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", remover_acentos(normalizar(texto))).split())
+
+
+def api_error(status: int, message: str):
+    """Resposta de erro no formato do Google (error.code/message/status)."""
+    return jsonify({"error": {"code": status, "message": message,
+                              "status": _STATUS_NAMES.get(status, "UNKNOWN")}}), status
+
+
+class LatencyModel:
+    """Distribuição de latência a partir de uma especificação em ms ("lognormal:200,0.5")."""
+
+    def __init__(self, spec: str = "0"):
+        self.spec = spec
+        nome, _, args = spec.partition(":")
+        valores = [float(v) for v in args.split(",") if v.strip()] if args else []
+        if not args and nome.replace(".", "", 1).isdigit():
+            nome, valores = "fixed", [float(nome)]
+        if nome not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Distribuição de latência desconhecida: {spec}")
+        self.kind = nome
+        self.params = valores
+
+    def sample(self, rng: random.Random) -> float:
+        """Uma amostra em segundos."""
+        p = self.params
+        if self.kind == "fixed":
+            ms = p[0] if p else 0.0
+        elif self.kind == "uniform":
+            ms = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            ms = rng.gauss(p[0], p[1])
+        else:
+            # p[0] = mediana (ms), p[1] = sigma do log
+            ms = rng.lognormvariate(math.log(p[0]), p[1])
+        return max(0.0, ms) / 1000
+
+
+class EntitySet:
+    """Sinônimos de uma entidade compilados em uma única regex (o mais longo primeiro)."""
+
+    def __init__(self, entities: list[dict]):
+        self.values: dict[str, str] = {}
+        for entity in entities:
+            for sinonimo in entity.get("synonyms") or [entity["value"]]:
+                chave = _norm(sinonimo)
+                if chave:
+                    self.values.setdefault(chave, entity["value"])
+        termos = sorted(self.values, key=len, reverse=True)
+        self.pattern = (
+            re.compile(r"(?<![0-9a-z])(?:" + "|".join(map(re.escape, termos)) + r")(?![0-9a-z])")
+            if termos else None
+        )
+
+    def find(self, texto_norm: str) -> str | None:
+        if self.pattern is None:
+            return None
+        m = self.pattern.search(texto_norm)
+        return self.values[m.group(0)] if m else None
+
+
+class AgentStore:
+    """Intents, entidades do agente e entidades de sessão em memória; seguro entre threads."""
+
+    def __init__(self, project: str = "fiap-boot"):
+        self.project = project
+        self.lock = threading.RLock()
+        self.agent = {"parent": f"projects/{project}", "displayName": project,
+                      "defaultLanguageCode": "pt-BR", "timeZone": "America/Sao_Paulo"}
+        self.intents: dict[str, dict] = {}
+        self.entity_types: dict[str, dict] = {}
+        # sessão -> displayName -> (expira_em, corpo, EntitySet)
+        self.session_entities: dict[str, dict[str, tuple[float, dict, EntitySet]]] = {}
+        # Um EntitySet por corpo de @Item (todas as sessões da mesma versão compartilham)
+        self._compiled: dict[str, EntitySet] = {}
+        self._agent_sets: dict[str, EntitySet] | None = None
+        self._model: LocalNLU | None = None
+
+    # ----- carga inicial -----
+    def seed(self, intent_files: list[str], entities_file: str | None) -> None:
+        if entities_file and os.path.exists(entities_file):
+            with open(entities_file, encoding="utf-8") as f:
+                for entity_type in json.load(f):
+                    self.create_entity_type(entity_type)
+        for caminho in intent_files:
+            if not os.path.exists(caminho):
+                continue
+            with open(caminho, encoding="utf-8") as f:
+                for intent in json.load(f):
+                    self.create_intent(self._from_project_format(intent))
+        if not self.intents or not self.entity_types:
+            # Sem dados o stub sobe "funcionando", mas todo detectIntent cai no fallback
+            print(f"[WARN] Stub do Dialogflow semeado com {len(self.intents)} intents e "
+                  f"{len(self.entity_types)} entidades; arquivos: {intent_files}, {entities_file}")
+
+    def _from_project_format(self, intent: dict) -> dict:
+        """Converte o formato dos JSON do projeto (frases com @Entidade:param) para o da API."""
+        frases = []
+        for frase in intent.get("trainingPhrases", []):
+            parts, pos = [], 0
+            for m in _PLACEHOLDER.finditer(frase):
+                if m.start() > pos:
+                    parts.append({"text": frase[pos:m.start()]})
+                exemplo = self._example_value(m.group(1))
+                parts.append({"text": exemplo, "entityType": f"@{m.group(1)}",
+                              "alias": m.group(2) or m.group(1).lower(), "userDefined": True})
+                pos = m.end()
+            if pos < len(frase):
+                parts.append({"text": frase[pos:]})
+            frases.append({"type": "EXAMPLE", "parts": parts})
+        return {
+            "displayName": intent["displayName"],
+            "trainingPhrases": frases,
+            "parameters": intent.get("parameters", []),
+            "messages": [{"text": {"text": [intent.get("response", "")]}}],
+        }
+
+    def _example_value(self, display_name: str) -> str:
+        for entity_type in self.entity_types.values():
+            if entity_type["displayName"] == display_name and entity_type.get("entities"):
+                return entity_type["entities"][0]["value"]
+        return display_name
+
+    # ----- intents -----
+    def create_intent(self, body: dict) -> dict:
+        with self.lock:
+            intent_id = str(uuid.uuid4())
+            intent = {**body, "name": f"projects/{self.project}/agent/intents/{intent_id}"}
+            self.intents[intent_id] = intent
+            self._model = None
+            return intent
+
+    def update_intent(self, intent_id: str, body: dict) -> dict | None:
+        with self.lock:
+            if intent_id not in self.intents:
+                return None
+            self.intents[intent_id].update({k: v for k, v in body.items() if k != "name"})
+            self._model = None
+            return self.intents[intent_id]
+
+    def delete_intent(self, intent_id: str) -> bool:
+        with self.lock:
+            self._model = None
+            return self.intents.pop(intent_id, None) is not None
+
+    # ----- entidades do agente -----
+    def create_entity_type(self, body: dict) -> dict:
+        with self.lock:
+            type_id = str(uuid.uuid4())
+            entity_type = {
+                "kind": "KIND_MAP", "entities": [], **body,
+                "name": f"projects/{self.project}/agent/entityTypes/{type_id}",
+            }
+            self.entity_types[type_id] = entity_type
+            self._entities_changed()
+            return entity_type
+
+    def update_entity_type(self, type_id: str, body: dict) -> dict | None:
+        with self.lock:
+            if type_id not in self.entity_types:
+                return None
+            self.entity_types[type_id].update({k: v for k, v in body.items() if k != "name"})
+            self._entities_changed()
+            return self.entity_types[type_id]
+
+    def delete_entity_type(self, type_id: str) -> bool:
+        with self.lock:
+            self._entities_changed()
+            return self.entity_types.pop(type_id, None) is not None
+
+    def batch_update_entities(self, type_id: str, entities: list[dict]) -> bool:
+        with self.lock:
+            entity_type = self.entity_types.get(type_id)
+            if entity_type is None:
+                return False
+            atuais = {e["value"]: e for e in entity_type["entities"]}
+            for entity in entities:
+                atuais[entity["value"]] = entity
+            entity_type["entities"] = list(atuais.values())
+            self._entities_changed()
+            return True
+
+    def batch_delete_entities(self, type_id: str, values: list[str]) -> bool:
+        with self.lock:
+            entity_type = self.entity_types.get(type_id)
+            if entity_type is None:
+                return False
+            remover = set(values)
+            entity_type["entities"] = [e for e in entity_type["entities"] if e["value"] not in remover]
+            self._entities_changed()
+            return True
+
+    def _entities_changed(self) -> None:
+        # Sinônimos do agente entram no treino (expansão de @Entidade) e na extração
+        self._agent_sets = None
+        self._model = None
+
+    def agent_sets(self) -> dict[str, EntitySet]:
+        with self.lock:
+            if self._agent_sets is None:
+                self._agent_sets = {
+                    et["displayName"]: EntitySet(et.get("entities", []))
+                    for et in self.entity_types.values()
+                }
+            return self._agent_sets
+
+    # ----- entidades de sessão -----
+    def set_session_entity(self, session: str, display_name: str, body: dict) -> dict:
+        bruto = json.dumps(body.get("entities", []), sort_keys=True, ensure_ascii=False)
+        chave = hashlib.sha1(bruto.encode("utf-8")).hexdigest()
+        with self.lock:
+            entity_set = self._compiled.get(chave)
+            if entity_set is None:
+                entity_set = EntitySet(body.get("entities", []))
+                if len(self._compiled) >= 16:
+                    self._compiled.pop(next(iter(self._compiled)))
+                self._compiled[chave] = entity_set
+            nome = f"projects/{self.project}/agent/sessions/{session}/entityTypes/{display_name}"
+            corpo = {"name": nome,
+                     "entityOverrideMode": body.get("entityOverrideMode", "ENTITY_OVERRIDE_MODE_OVERRIDE"),
+                     "entities": body.get("entities", [])}
+            self.session_entities.setdefault(session, {})[display_name] = (
+                time.monotonic() + SESSION_ENTITY_TTL, corpo, entity_set
+            )
+            return corpo
+
+    def get_session_entity(self, session: str, display_name: str):
+        with self.lock:
+            registro = self.session_entities.get(session, {}).get(display_name)
+            if registro is None or registro[0] < time.monotonic():
+                return None
+            return registro
+
+    def delete_session_entity(self, session: str, display_name: str) -> bool:
+        with self.lock:
+            return self.session_entities.get(session, {}).pop(display_name, None) is not None
+
+    def session_sets(self, session: str) -> dict[str, EntitySet]:
+        agora = time.monotonic()
+        with self.lock:
+            return {
+                nome: registro[2]
+                for nome, registro in self.session_entities.get(session, {}).items()
+                if registro[0] >= agora
+            }
+
+    # ----- detectIntent -----
+    def model(self) -> LocalNLU | None:
+        with self.lock:
+            if self._model is None and self.intents:
+                sinonimos = {
+                    et["displayName"]: [s for e in et.get("entities", []) for s in e.get("synonyms", [e["value"]])]
+                    for et in self.entity_types.values()
+                }
+                textos, rotulos, respostas = [], [], {}
+                for intent in self.intents.values():
+                    nome = intent["displayName"]
+                    respostas[nome] = _first_text(intent)
+                    for frase in intent.get("trainingPhrases", []):
+                        for texto in expand_placeholders(_phrase_template(frase), sinonimos):
+                            textos.append(texto)
+                            rotulos.append(nome)
+                if textos:
+                    self._model = LocalNLU.train(textos, rotulos, respostas)
+            return self._model
+
+    def intent_by_name(self, display_name: str) -> dict | None:
+        with self.lock:
+            for intent in self.intents.values():
+                if intent["displayName"] == display_name:
+                    return intent
+        return None
+
+    def detect_intent(self, session: str, text: str, language: str) -> dict:
+        modelo = self.model()
+        nome, confianca = modelo.predict(text) if modelo is not None else (None, 0.0)
+        intent = self.intent_by_name(nome) if nome and confianca >= MATCH_THRESHOLD else None
+        resultado = {"queryText": text, "languageCode": language, "parameters": {},
+                     "allRequiredParamsPresent": True}
+        if intent is None:
+            resultado.update({
+                "fulfillmentText": FALLBACK_TEXT,
+                "fulfillmentMessages": [{"text": {"text": [FALLBACK_TEXT]}}],
+                "intent": {"name": f"projects/{self.project}/agent/intents/fallback",
+                           "displayName": FALLBACK_INTENT, "isFallback": True},
+                "intentDetectionConfidence": 1.0,
+            })
+            return resultado
+
+        texto_norm = _norm(text)
+        conjuntos = {**self.agent_sets(), **self.session_sets(session)}
+        parametros = {}
+        for param in intent.get("parameters", []):
+            tipo = param.get("entityTypeDisplayName", "").lstrip("@")
+            entity_set = conjuntos.get(tipo)
+            valor = entity_set.find(texto_norm) if entity_set is not None else None
+            parametros[param["displayName"]] = valor or ""
+        for tipo, entity_set in self.session_sets(session).items():
+            chave = tipo.lower()
+            if not parametros.get(chave):
+                valor = entity_set.find(texto_norm)
+                if valor:
+                    parametros[chave] = valor
+        resposta = _first_text(intent)
+        for chave, valor in parametros.items():
+            resposta = resposta.replace(f"${chave}", str(valor))
+        resultado.update({
+            "parameters": parametros,
+            "allRequiredParamsPresent": all(
+                parametros.get(p["displayName"]) for p in intent.get("parameters", []) if p.get("mandatory")
+            ),
+            "fulfillmentText": resposta,
+            "fulfillmentMessages": [{"text": {"text": [resposta]}}],
+            "intent": {"name": intent["name"], "displayName": intent["displayName"]},
+            "intentDetectionConfidence": round(confianca, 4),
+        })
+        return resultado
+
+
+def _phrase_template(frase: dict) -> str:
+    """Frase de treino da API com partes anotadas como @Entidade:alias."""
+    return "".join(
+        f"{p['entityType']}:{p.get('alias', '')}" if p.get("entityType") else p.get("text", "")
+        for p in frase.get("parts", [])
+    )
+
+
+def _first_text(intent: dict) -> str:
+    for message in intent.get("messages", []):
+        textos = message.get("text", {}).get("text", [])
+        if textos:
+            return textos[0]
+    return ""
+
+
+class FaultConfig:
+    """Latência e falhas injetadas, com contadores; trocável em execução."""
+
+    def __init__(self, latency: str = "0", error_rate: float = 0.0, error_status: int = 503,
+                 stall_rate: float = 0.0, stall_seconds: float = 30.0, seed: int | None = None):
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "errors_injected": 0, "stalls": 0, "latency_total_ms": 0.0}
+        self.endpoints: dict[str, int] = {}
+        self.configure(latency=latency, error_rate=error_rate, error_status=error_status,
+                       stall_rate=stall_rate, stall_seconds=stall_seconds)
+
+    def configure(self, **opcoes) -> None:
+        with self.lock:
+            if "latency" in opcoes:
+                self.latency = LatencyModel(str(opcoes["latency"]))
+            if "error_rate" in opcoes:
+                self.error_rate = float(opcoes["error_rate"])
+            if "error_status" in opcoes:
+                self.error_status = int(opcoes["error_status"])
+            if "stall_rate" in opcoes:
+                self.stall_rate = float(opcoes["stall_rate"])
+            if "stall_seconds" in opcoes:
+                self.stall_seconds = float(opcoes["stall_seconds"])
+
+    def draw(self, endpoint: str) -> tuple[float, bool]:
+        """(espera em segundos, injetar erro?) para uma chamada."""
+        with self.lock:
+            espera = self.latency.sample(self.rng)
+            if self.stall_rate and self.rng.random() < self.stall_rate:
+                espera = self.stall_seconds
+                self.stats["stalls"] += 1
+            erro = bool(self.error_rate) and self.rng.random() < self.error_rate
+            self.stats["requests"] += 1
+            self.stats["errors_injected"] += erro
+            self.stats["latency_total_ms"] += espera * 1000
+            self.endpoints[endpoint] = self.endpoints.get(endpoint, 0) + 1
+            return espera, erro
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "config": {"latency": self.latency.spec, "error_rate": self.error_rate,
+                           "error_status": self.error_status, "stall_rate": self.stall_rate,
+                           "stall_seconds": self.stall_seconds},
+                **self.stats,
+                "endpoints": dict(self.endpoints),
+            }
+
+
+# Estado padrão (também ao importar, ex.: flask --app dialogflow_stub run)
+STORE = AgentStore()
+STORE.seed(INTENT_FILES, ENTITIES_FILE)
+FAULTS = FaultConfig()
+
+
+@app.before_request
+def inject_faults():
+    """Aplica latência e erros configurados às rotas da API (não às de /stub)."""
+    if not request.path.startswith("/v2/"):
+        return None
+    espera, erro = FAULTS.draw(request.endpoint or "unknown")
+    if espera:
+        time.sleep(espera)
+    if erro:
+        return api_error(FAULTS.error_status, "Erro injetado pelo dialogflow_stub")
+    return None
+
+
+# ----- agente -----
+@app.route("/v2/projects/<project>/agent", methods=["GET", "PATCH"])
+def agent(project):
+    if request.method == "PATCH":
+        STORE.agent.update(request.get_json(silent=True) or {})
+    return jsonify(STORE.agent)
+
+
+# ----- detectIntent -----
+@app.post("/v2/projects/<project>/agent/sessions/<session>:detectIntent")
+def detect_intent(project, session):
+    body = request.get_json(silent=True) or {}
+    texto = body.get("queryInput", {}).get("text", {})
+    if not texto.get("text"):
+        return api_error(400, "queryInput.text.text é obrigatório")
+    resultado = STORE.detect_intent(session, texto["text"], texto.get("languageCode", "pt-BR"))
+    return jsonify({"responseId": str(uuid.uuid4()), "queryResult": resultado})
+
+
+# ----- entidades de sessão -----
+@app.route("/v2/projects/<project>/agent/sessions/<session>/entityTypes/<name>",
+           methods=["GET", "PUT", "PATCH", "DELETE"])
+def session_entity_type(project, session, name):
+    if request.method in ("PUT", "PATCH"):
+        return jsonify(STORE.set_session_entity(session, name, request.get_json(force=True) or {}))
+    if request.method == "DELETE":
+        if not STORE.delete_session_entity(session, name):
+            return api_error(404, f"Entidade de sessão {name} não encontrada")
+        return jsonify({})
+    registro = STORE.get_session_entity(session, name)
+    if registro is None:
+        return api_error(404, f"Entidade de sessão {name} não encontrada")
+    return jsonify(registro[1])
+
+
+@app.post("/v2/projects/<project>/agent/sessions/<session>/entityTypes")
+def create_session_entity_type(project, session):
+    body = request.get_json(force=True) or {}
+    nome = body.get("name", "").rsplit("/", 1)[-1]
+    if not nome:
+        return api_error(400, "name é obrigatório")
+    return jsonify(STORE.set_session_entity(session, nome, body))
+
+
+# ----- intents -----
+@app.route("/v2/projects/<project>/agent/intents", methods=["GET", "POST"])
+def intents(project):
+    if request.method == "POST":
+        body = request.get_json(force=True) or {}
+        if not body.get("displayName"):
+            return api_error(400, "displayName é obrigatório")
+        if STORE.intent_by_name(body["displayName"]):
+            return api_error(409, f"Intent {body['displayName']} já existe")
+        return jsonify(STORE.create_intent(body))
+    with STORE.lock:
+        lista = list(STORE.intents.values())
+    return jsonify({"intents": lista})
+
+
+@app.route("/v2/projects/<project>/agent/intents/<intent_id>", methods=["GET", "PATCH", "DELETE"])
+def intent(project, intent_id):
+    if request.method == "DELETE":
+        if not STORE.delete_intent(intent_id):
+            return api_error(404, "Intent não encontrada")
+        return jsonify({})
+    if request.method == "PATCH":
+        atualizada = STORE.update_intent(intent_id, request.get_json(force=True) or {})
+        return jsonify(atualizada) if atualizada else api_error(404, "Intent não encontrada")
+    with STORE.lock:
+        encontrada = STORE.intents.get(intent_id)
+    return jsonify(encontrada) if encontrada else api_error(404, "Intent não encontrada")
+
+
+# ----- entidades do agente -----
+@app.route("/v2/projects/<project>/agent/entityTypes", methods=["GET", "POST"])
+def entity_types(project):
+    if request.method == "POST":
+        body = request.get_json(force=True) or {}
+        if not body.get("displayName"):
+            return api_error(400, "displayName é obrigatório")
+        return jsonify(STORE.create_entity_type(body))
+    tamanho = int(request.args.get("pageSize", PAGE_SIZE))
+    inicio = int(request.args.get("pageToken") or 0)
+    with STORE.lock:
+        lista = list(STORE.entity_types.values())
+    resposta = {"entityTypes": lista[inicio:inicio + tamanho]}
+    if inicio + tamanho < len(lista):
+        resposta["nextPageToken"] = str(inicio + tamanho)
+    return jsonify(resposta)
+
+
+@app.route("/v2/projects/<project>/agent/entityTypes/<type_id>", methods=["GET", "PATCH", "DELETE"])
+def entity_type(project, type_id):
+    if request.method == "DELETE":
+        if not STORE.delete_entity_type(type_id):
+            return api_error(404, "Entidade não encontrada")
+        return jsonify({})
+    if request.method == "PATCH":
+        atualizada = STORE.update_entity_type(type_id, request.get_json(force=True) or {})
+        return jsonify(atualizada) if atualizada else api_error(404, "Entidade não encontrada")
+    with STORE.lock:
+        encontrada = STORE.entity_types.get(type_id)
+    return jsonify(encontrada) if encontrada else api_error(404, "Entidade não encontrada")
+
+
+def _operation() -> dict:
+    return {"name": f"projects/{STORE.project}/operations/{uuid.uuid4()}", "done": True}
+
+
+@app.post("/v2/projects/<project>/agent/entityTypes/<type_id>/entities:batchUpdate")
+def batch_update_entities(project, type_id):
+    body = request.get_json(force=True) or {}
+    if not STORE.batch_update_entities(type_id, body.get("entities", [])):
+        return api_error(404, "Entidade não encontrada")
+    return jsonify(_operation())
+
+
+@app.post("/v2/projects/<project>/agent/entityTypes/<type_id>/entities:batchDelete")
+def batch_delete_entities(project, type_id):
+    body = request.get_json(force=True) or {}
+    if not STORE.batch_delete_entities(type_id, body.get("entityValues", [])):
+        return api_error(404, "Entidade não encontrada")
+    return jsonify(_operation())
+
+
+# ----- controle do stub -----
+@app.get("/stub/stats")
+def stub_stats():
+    with STORE.lock:
+        sessoes = len(STORE.session_entities)
+    return jsonify({**FAULTS.snapshot(), "intents": len(STORE.intents),
+                    "entity_types": len(STORE.entity_types), "sessions": sessoes})
+
+
+@app.post("/stub/config")
+def stub_config():
+    try:
+        FAULTS.configure(**(request.get_json(force=True) or {}))
+    except (TypeError, ValueError) as e:
+        return api_error(400, str(e))
+    return jsonify(FAULTS.snapshot()["config"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor local da API REST v2 do Dialogflow")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5010)
+    parser.add_argument("--project", default="fiap-boot")
+    parser.add_argument("--intents", nargs="*", default=INTENT_FILES)
+    parser.add_argument("--entities", default=ENTITIES_FILE)
+    parser.add_argument("--latency", default="0", help="ms: fixed:N | uniform:A,B | normal:M,SD | lognormal:MEDIANA,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=None, help="semente para latências/erros reproduzíveis")
+    args = parser.parse_args()
+
+    global STORE, FAULTS
+    STORE = AgentStore(args.project)
+    STORE.seed(args.intents, args.entities)
+    STORE.model()
+    FAULTS = FaultConfig(args.latency, args.error_rate, args.error_status,
+                         args.stall_rate, args.stall_seconds, args.seed)
+    print(f"Dialogflow local em http://{args.host}:{args.port}/v2 "
+          f"({len(STORE.intents)} intents, {len(STORE.entity_types)} entidades)")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Sincronização do cardápio com a entidade @Item do agente Dialogflow.
+
+Em vez de sobrescrever @Item em cada sessão de chat, o cardápio é
+comparado com a entidade do próprio agente e só as diferenças são
+aplicadas com os endpoints em lote (entities:batchUpdate e
+entities:batchDelete). Com a entidade do agente em dia, o caminho das
+mensagens não precisa de nenhuma chamada de entidade por sessão.
+
+Uso:
+    - automaticamente pelo /upload do app.py quando ITEM_ENTITY_MODE=agent;
+    - manualmente pelo botão de sincronização em /admin;
+    - pela linha de comando, como o import_entities.py:
+        python entity_sync.py
+"""
+
+import os
+
+from http_transport import DIALOGFLOW_API, MAX_RETRIES
+
+# "session": @Item enviado por sessão (padrão antigo);
+# "agent": @Item sincronizado no agente, sem chamadas por sessão.
+ITEM_ENTITY_MODE = os.getenv("ITEM_ENTITY_MODE", "session").lower()
+# Nome da entidade no agente
+ENTITY_DISPLAY_NAME = "Item"
+# Valores enviados por chamada de lote
+BATCH_SIZE = 500
+
+
+class EntitySyncError(Exception):
+    """Falha ao consultar ou atualizar a entidade do agente."""
+
+
+def desired_entities(index) -> dict[str, list[str]]:
+    """valor -> sinônimos esperados para @Item a partir do cardápio."""
+    return {row.item: [row.item, *row.sinonimos] for row in index.items}
+
+
+def diff_entities(current: dict[str, list[str]],
+                  desired: dict[str, list[str]]) -> tuple[list[dict], list[dict], list[str]]:
+    """
+    Compara a entidade do agente com o cardápio.
+    Devolve (novos, alterados, removidos); a ordem dos sinônimos é ignorada.
+    """
+    added = [
+        {"value": value, "synonyms": synonyms}
+        for value, synonyms in desired.items() if value not in current
+    ]
+    changed = [
+        {"value": value, "synonyms": synonyms}
+        for value, synonyms in desired.items()
+        if value in current and set(current[value]) != set(synonyms)
+    ]
+    removed = [value for value in current if value not in desired]
+    return added, changed, removed
+
+
+def _check(resp, acao: str) -> dict:
+    if not resp.ok:
+        raise EntitySyncError(f"{acao}: HTTP {resp.status_code} {resp.text[:200]}")
+    return resp.json() if resp.content else {}
+
+
+def find_entity_type(http, project_id: str, language: str,
+                     display_name: str = ENTITY_DISPLAY_NAME) -> dict | None:
+    """Procura a entidade do agente pelo nome (percorre todas as páginas)."""
+    url = f"{DIALOGFLOW_API}/projects/{project_id}/agent/entityTypes"
+    params = {"languageCode": language, "pageSize": 100}
+    while True:
+        data = _check(http.get(url, params=params), "Listar entidades")
+        for entity_type in data.get("entityTypes", []):
+            if entity_type.get("displayName") == display_name:
+                return entity_type
+        token = data.get("nextPageToken")
+        if not token:
+            return None
+        params["pageToken"] = token
+
+
+def sync_item_entity(http, project_id: str, index, language: str = "pt-BR") -> dict:
+    """
+    Aplica no agente apenas as diferenças entre @Item e o cardápio.
+    Cria a entidade se ela ainda não existir. Devolve um resumo com as
+    contagens e as operações de longa duração iniciadas pelo Dialogflow.
+    """
+    desired = desired_entities(index)
+    entity_type = find_entity_type(http, project_id, language)
+    if entity_type is None:
+        body = {
+            "displayName": ENTITY_DISPLAY_NAME,
+            "kind": "KIND_MAP",
+            "autoExpansionMode": "AUTO_EXPANSION_MODE_DEFAULT",
+            "entities": [{"value": v, "synonyms": s} for v, s in desired.items()],
+        }
+        _check(
+            http.post(f"{DIALOGFLOW_API}/projects/{project_id}/agent/entityTypes",
+                      params={"languageCode": language}, json=body),
+            "Criar entidade",
+        )
+        return {"version": index.version, "added": len(desired), "changed": 0,
+                "removed": 0, "operations": []}
+
+    current = {
+        e["value"]: e.get("synonyms", [])
+        for e in entity_type.get("entities", [])
+    }
+    added, changed, removed = diff_entities(current, desired)
+    base = f"{DIALOGFLOW_API}/{entity_type['name']}/entities"
+    operations = []
+    upserts = added + changed
+    for i in range(0, len(upserts), BATCH_SIZE):
+        op = _check(
+            http.post(f"{base}:batchUpdate",
+                      json={"entities": upserts[i:i + BATCH_SIZE], "languageCode": language},
+                      retries=MAX_RETRIES),
+            "Atualizar valores",
+        )
+        operations.append(op.get("name"))
+    for i in range(0, len(removed), BATCH_SIZE):
+        op = _check(
+            http.post(f"{base}:batchDelete",
+                      json={"entityValues": removed[i:i + BATCH_SIZE], "languageCode": language},
+                      retries=MAX_RETRIES),
+            "Remover valores",
+        )
+        operations.append(op.get("name"))
+    return {"version": index.version, "added": len(added), "changed": len(changed),
+            "removed": len(removed), "operations": operations}
+
+
+if __name__ == "__main__":
+    from http_transport import dialogflow_credentials, dialogflow_transport
+    from menu_snapshot import load_menu
+
+    CREDENTIALS_FILE = "fiap-boot-a239f7750ffc.json"
+    PROJECT_ID = "fiap-boot"
+
+    scopes = ["https://www.googleapis.com/auth/dialogflow"]
+    credentials = dialogflow_credentials(CREDENTIALS_FILE, scopes)
+    session = dialogflow_transport(credentials)
+
+    menu = load_menu()
+    if menu is None:
+        raise SystemExit("Nenhum cardápio salvo (cardapio_cache.csv). Faça o upload em /admin.")
+    print(sync_item_entity(session, PROJECT_ID, menu))
@@ -0,0 +1,362 @@
+"""
+Transporte HTTP compartilhado para as chamadas ao Dialogflow e ao Telegram.
+
+Cada HttpTransport envolve uma única sessão requests (AuthorizedSession no
+caso do Dialogflow) com pool de conexões dimensionado e keep-alive, timeout
+em toda chamada e novas tentativas com backoff exponencial e jitter para
+429/5xx e falhas de conexão (respeitando Retry-After e o retry_after do
+Telegram). Só métodos idempotentes (GET, PUT, DELETE...) são repetidos
+automaticamente; POST e PATCH só com `retries=` explícito na chamada, já
+que repetir um envio pode duplicá-lo (mensagem enviada duas vezes). O
+pool do urllib3 é thread-safe; a renovação do token OAuth é serializada
+para que várias threads não renovem ao mesmo tempo.
+
+stats() / pool_stats() expõem contadores de chamadas, novas tentativas,
+erros, latência média e a ocupação do pool por host (no httpx, só o
+tamanho máximo configurado).
+
+AsyncHttpTransport oferece o mesmo comportamento sobre httpx.AsyncClient
+para o modo assíncrono (asgi_app.py); httpx só é importado nesse caso.
+
+DIALOGFLOW_API_URL troca o host do Dialogflow, por exemplo pelo servidor
+local dialogflow_stub.py em testes e benchmarks; fora do host oficial as
+chamadas são feitas sem OAuth (e sem arquivo de credenciais).
+"""
+
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+import weakref
+from collections import Counter
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Conexões mantidas por host (threads do gunicorn + envios em segundo plano)
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+# Hosts distintos com pool próprio (Dialogflow, Telegram, OAuth)
+POOL_CONNECTIONS = 4
+# (conexão, leitura) em segundos
+DEFAULT_TIMEOUT = (3.05, 15)
+# Novas tentativas após a primeira chamada
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 4.0
+# Retry-After maior que isso não é aguardado (a resposta 429 é devolvida)
+MAX_RETRY_WAIT = 10.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Repetidos sem pedido explícito; os demais só com retries= na chamada
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+TELEGRAM_API = "https://api.telegram.org"
+# Base da API REST do Dialogflow (ex.: http://127.0.0.1:5010/v2 para o dialogflow_stub.py)
+DIALOGFLOW_API = os.getenv("DIALOGFLOW_API_URL", "https://dialogflow.googleapis.com/v2").rstrip("/")
+# True quando as chamadas vão para um servidor local, sem autenticação
+DIALOGFLOW_STUB = not (urlsplit(DIALOGFLOW_API).hostname or "").endswith(".googleapis.com")
+
+# Transportes vivos no processo, em ordem de criação, para pool_stats(); nomes podem
+# se repetir (ex.: "dialogflow" no app.py e no webhook_telegram.py) sem um apagar o outro
+_TRANSPORTS: "weakref.WeakValueDictionary[int, _TransportStats]" = weakref.WeakValueDictionary()
+_TRANSPORT_IDS = itertools.count()
+_REGISTRY_LOCK = threading.RLock()
+
+
+class _TransportStats:
+    """Contadores comuns aos transportes síncrono e assíncrono."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._errors = 0
+        self._latency_total = 0.0
+        self._status: Counter[int] = Counter()
+        with _REGISTRY_LOCK:
+            _TRANSPORTS[next(_TRANSPORT_IDS)] = self
+
+    def _record(self, status: int | None, elapsed: float = 0.0) -> None:
+        """Registra uma chamada (status None = erro de rede)."""
+        with self._lock:
+            self._requests += 1
+            if status is None:
+                self._errors += 1
+            else:
+                self._latency_total += elapsed
+                self._status[status] += 1
+
+    def _record_retry(self) -> None:
+        with self._lock:
+            self._retries += 1
+
+    def _attempts(self, method: str, retries: int | None) -> int:
+        """Novas tentativas permitidas: as pedidas ou, se omitidas, só para métodos idempotentes."""
+        if retries is not None:
+            return retries
+        return self.max_retries if method.upper() in IDEMPOTENT_METHODS else 0
+
+    @staticmethod
+    def _retry_after(resp) -> float | None:
+        """Espera pedida pelo servidor (cabeçalho Retry-After ou retry_after do Telegram)."""
+        valor = resp.headers.get("Retry-After")
+        if valor is None and "json" in resp.headers.get("Content-Type", ""):
+            try:
+                valor = resp.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                valor = None
+        try:
+            return float(valor) if valor is not None else None
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _backoff(tentativa: int) -> float:
+        # Exponencial com jitter total: espalha as novas tentativas entre threads/workers
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** tentativa))
+
+    def _retry_delay(self, resp, tentativa: int) -> float | None:
+        """Espera antes de repetir uma resposta 429/5xx; None se a espera pedida for longa demais."""
+        espera = self._retry_after(resp)
+        if espera is None:
+            return self._backoff(tentativa)
+        return espera if espera <= MAX_RETRY_WAIT else None
+
+    def _pools(self) -> dict:
+        return {}
+
+    def stats(self) -> dict:
+        """Contadores de chamadas e ocupação do pool por host."""
+        pools = self._pools()
+        with self._lock:
+            return {
+                "name": self.name,
+                "requests": self._requests,
+                "retries": self._retries,
+                "errors": self._errors,
+                "status": dict(self._status),
+                "avg_latency_ms": round(1000 * self._latency_total / max(1, self._requests - self._errors), 2),
+                "pools": pools,
+            }
+
+
+class HttpTransport(_TransportStats):
+    """Sessão HTTP com pool, timeouts e novas tentativas; segura entre threads."""
+
+    def __init__(self, session: requests.Session | None = None, name: str = "http",
+                 pool_maxsize: int = POOL_MAXSIZE, timeout=DEFAULT_TIMEOUT,
+                 max_retries: int = MAX_RETRIES):
+        self.session = session if session is not None else requests.Session()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # Sem retry no urllib3: as novas tentativas são feitas (e contadas) aqui
+        self.adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                                   pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._refresh_lock = threading.Lock()
+        self._auth_request = None
+        super().__init__(name)
+
+    def _ensure_credentials(self) -> None:
+        """Renova o token OAuth uma única vez, mesmo com várias threads."""
+        credentials = getattr(self.session, "credentials", None)
+        if credentials is None or credentials.valid:
+            return
+        with self._refresh_lock:
+            if not credentials.valid:
+                if self._auth_request is None:
+                    from google.auth.transport.requests import Request
+                    self._auth_request = Request()
+                credentials.refresh(self._auth_request)
+
+    def request(self, method: str, url: str, *, timeout=None, retries: int | None = None,
+                **kwargs) -> requests.Response:
+        """
+        Faz a chamada com timeout e novas tentativas em 429/5xx e erros de
+        conexão (POST/PATCH só com `retries` explícito). Devolve a última
+        resposta (mesmo com erro HTTP); relança a exceção de rede se todas as
+        tentativas falharem.
+        """
+        timeout = timeout or self.timeout
+        tentativas = self._attempts(method, retries)
+        for tentativa in range(tentativas + 1):
+            self._ensure_credentials()
+            inicio = time.perf_counter()
+            try:
+                resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.ConnectionError:
+                # Inclui ConnectTimeout; ReadTimeout não é repetido (o servidor pode ter processado)
+                self._record(None)
+                if tentativa >= tentativas:
+                    raise
+                espera = self._backoff(tentativa)
+            else:
+                self._record(resp.status_code, time.perf_counter() - inicio)
+                if resp.status_code not in RETRY_STATUSES or tentativa >= tentativas:
+                    return resp
+                espera = self._retry_delay(resp, tentativa)
+                if espera is None:
+                    return resp
+                resp.close()
+            self._record_retry()
+            time.sleep(espera)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def _pools(self) -> dict:
+        pools = {}
+        poolmanager = self.adapter.poolmanager
+        for key in poolmanager.pools.keys():
+            pool = poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            fila = list(pool.pool.queue) if pool.pool is not None else []
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                # A fila do urllib3 é preenchida com None até maxsize; só conta conexões reais
+                "idle": sum(1 for conn in fila if conn is not None),
+                "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+            }
+        return pools
+
+
+class AsyncHttpTransport(_TransportStats):
+    """
+    Cliente assíncrono (httpx) com pool, timeouts e novas tentativas.
+    Com `credentials`, adiciona o token OAuth da conta de serviço (renovado em
+    uma thread auxiliar, uma vez só mesmo com muitas corrotinas).
+    """
+
+    def __init__(self, credentials=None, name: str = "http-async",
+                 pool_maxsize: int = POOL_MAXSIZE * 8, timeout=DEFAULT_TIMEOUT,
+                 max_retries: int = MAX_RETRIES):
+        try:
+            import httpx
+        except ImportError as e:
+            raise RuntimeError("O modo assíncrono requer o pacote httpx.") from e
+        super().__init__(name)
+        self.credentials = credentials
+        self.max_retries = max_retries
+        self.pool_maxsize = pool_maxsize
+        connect, read = timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_maxsize,
+                                max_keepalive_connections=pool_maxsize),
+        )
+        self._timeout_cls = httpx.Timeout
+        self._connect_error = httpx.TransportError
+        self._read_timeout = httpx.ReadTimeout
+        self._refresh_lock: asyncio.Lock | None = None
+
+    async def _auth_headers(self) -> dict:
+        if self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            if self._refresh_lock is None:
+                self._refresh_lock = asyncio.Lock()
+            async with self._refresh_lock:
+                if not self.credentials.valid:
+                    from google.auth.transport.requests import Request
+                    await asyncio.to_thread(self.credentials.refresh, Request())
+        return {"Authorization": f"Bearer {self.credentials.token}"}
+
+    async def request(self, method: str, url: str, *, timeout=None, retries: int | None = None,
+                      **kwargs):
+        """Mesmo contrato de HttpTransport.request, sem bloquear o event loop."""
+        tentativas = self._attempts(method, retries)
+        if timeout is not None:
+            connect, read = timeout
+            kwargs["timeout"] = self._timeout_cls(read, connect=connect)
+        headers = kwargs.pop("headers", None) or {}
+        for tentativa in range(tentativas + 1):
+            inicio = time.perf_counter()
+            try:
+                resp = await self.client.request(
+                    method, url, headers={**headers, **await self._auth_headers()}, **kwargs
+                )
+            except self._read_timeout:
+                # Não repete: o servidor pode ter processado a chamada
+                self._record(None)
+                raise
+            except self._connect_error:
+                self._record(None)
+                if tentativa >= tentativas:
+                    raise
+                espera = self._backoff(tentativa)
+            else:
+                self._record(resp.status_code, time.perf_counter() - inicio)
+                if resp.status_code not in RETRY_STATUSES or tentativa >= tentativas:
+                    return resp
+                espera = self._retry_delay(resp, tentativa)
+                if espera is None:
+                    return resp
+            self._record_retry()
+            await asyncio.sleep(espera)
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def _pools(self) -> dict:
+        # O httpx não expõe a ocupação do pool em API pública: só o limite configurado
+        return {"httpx": {"maxsize": self.pool_maxsize}}
+
+
+def pool_stats() -> list[dict]:
+    """Estatísticas de todos os transportes do processo."""
+    with _REGISTRY_LOCK:
+        transports = list(_TRANSPORTS.values())
+    return [t.stats() for t in transports]
+
+
+def dialogflow_credentials(credentials_file: str, scopes: list[str]):
+    """Credenciais da conta de serviço; None com DIALOGFLOW_API_URL apontando para um servidor local."""
+    if DIALOGFLOW_STUB:
+        return None
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_file(credentials_file, scopes=scopes)
+
+
+def dialogflow_transport(credentials, name: str = "dialogflow") -> HttpTransport:
+    """Transporte autenticado (conta de serviço) para a API REST do Dialogflow."""
+    if credentials is None:
+        # Servidor local (dialogflow_stub.py): sem OAuth
+        return HttpTransport(name=name)
+    from google.auth.transport.requests import AuthorizedSession
+    return HttpTransport(AuthorizedSession(credentials), name=name)
+
+
+def telegram_transport() -> HttpTransport:
+    """Transporte único do processo para a Bot API do Telegram."""
+    with _REGISTRY_LOCK:
+        for transport in _TRANSPORTS.values():
+            if transport.name == "telegram" and isinstance(transport, HttpTransport):
+                return transport
+        return HttpTransport(name="telegram")
@@ -1,6 +1,6 @@
 import json
 from google.oauth2 import service_account
-from google.auth.transport.requests import AuthorizedSession
+from http_transport import DIALOGFLOW_API, dialogflow_transport
 
 # CONFIGURAÇÕES
 CREDENTIALS_FILE = "/Users/alansms/PycharmProjects/Fiap/AULAS/2-SEMESTRE/LNP/fiap-boot-a239f7750ffc.json"
@@ -10,14 +10,14 @@ INTENTS_FILE = "/Users/alansms/PycharmProjects/Fiap/AULAS/2-SEMESTRE/LNP/intents
 # Autenticação
 scopes = ["https://www.googleapis.com/auth/dialogflow"]
 credentials = service_account.Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=scopes)
-session = AuthorizedSession(credentials)
+session = dialogflow_transport(credentials)
 
 # Carregar intents
 with open(INTENTS_FILE, "r", encoding="utf-8") as f:
     intents = json.load(f)
 
 # URL da API
-url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents"
+url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents"
 
 # Enviar intents
 for intent in intents:
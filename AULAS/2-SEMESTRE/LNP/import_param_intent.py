@@ -1,7 +1,7 @@
 
 import json
 from google.oauth2 import service_account
-from google.auth.transport.requests import AuthorizedSession
+from http_transport import DIALOGFLOW_API, dialogflow_transport
 
 # CONFIGURAÇÕES
 CREDENTIALS_FILE = "fiap-boot-a239f7750ffc.json"
@@ -11,14 +11,14 @@ INTENT_FILE = "intent_PedidoDetalhado.json"
 # Autenticação
 scopes = ["https://www.googleapis.com/auth/dialogflow"]
 credentials = service_account.Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=scopes)
-session = AuthorizedSession(credentials)
+session = dialogflow_transport(credentials)
 
 # Carregar intent
 with open(INTENT_FILE, "r", encoding="utf-8") as f:
     intents = json.load(f)
 
 # URL da API
-url = f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/intents"
+url = f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/intents"
 
 for intent in intents:
     training_phrases = []
@@ -0,0 +1,143 @@
+"""
+Cache de respostas do detectIntent para mensagens que não dependem de contexto.
+
+Boa parte do tráfego são mensagens curtas e repetidas ("oi", "cardápio",
+"ver opções", "tchau") que sempre caem na mesma intent com os mesmos
+parâmetros. Para essas, a resposta do Dialogflow é guardada por texto
+normalizado + contexto ativo + versão do cardápio, com validade (TTL) e
+descarte do menos usado (LRU); cada acerto economiza uma ida e volta de
+150–400 ms e uma chamada da cota.
+
+Só entram no cache intents marcadas como independentes de contexto e cujo
+resultado não abriu contextos de saída: se o Dialogflow ativou algum
+contexto, o turno mexeu no estado da sessão e precisa ir ao servidor.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from menu_index import normalizar
+
+# Validade de uma resposta guardada (segundos)
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", "600"))
+# Entradas mantidas por processo
+INTENT_CACHE_MAX = int(os.getenv("INTENT_CACHE_MAX", "5000"))
+# Mensagens maiores que isso raramente se repetem e não são guardadas
+MAX_CACHED_TEXT = 64
+
+_PONTUACAO_BORDAS = re.compile(r"^[\W_]+|[\W_]+$")
+
+
+def normalize_text(texto: str) -> str:
+    """Minúsculas, espaços colapsados e sem pontuação nas bordas ("Oi!! " -> "oi")."""
+    return _PONTUACAO_BORDAS.sub("", " ".join(normalizar(texto).split()))
+
+
+def active_contexts(output_contexts) -> tuple[str, ...]:
+    """Nomes curtos dos contextos de saída ainda ativos (REST ou SDK gRPC)."""
+    nomes = []
+    for ctx in output_contexts or ():
+        if isinstance(ctx, dict):
+            nome, vida = ctx.get("name", ""), ctx.get("lifespanCount", 0)
+        else:
+            nome, vida = ctx.name, ctx.lifespan_count
+        nome = nome.rsplit("/", 1)[-1]
+        # __system_counters__ aparece em todo turno com parâmetros e não afeta o casamento
+        if vida and not nome.startswith("__system"):
+            nomes.append(nome)
+    return tuple(sorted(nomes))
+
+
+class IntentCache:
+    """LRU com TTL de (texto, contexto, versão) -> resultado do detectIntent."""
+
+    def __init__(self, cacheable_intents, ttl: float = INTENT_CACHE_TTL,
+                 max_entries: int = INTENT_CACHE_MAX):
+        self.cacheable_intents = frozenset(cacheable_intents)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        # session_id -> contextos de saída ativos após a última chamada real
+        self._contexts: OrderedDict[str, tuple[str, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._skipped = 0
+
+    @staticmethod
+    def key(texto: str, context=(), version: str = "") -> tuple | None:
+        """Chave do cache; None se a mensagem não deve ser consultada nem guardada."""
+        normalizado = normalize_text(texto)
+        if not normalizado or len(normalizado) > MAX_CACHED_TEXT:
+            return None
+        return normalizado, tuple(sorted(context)), version
+
+    def session_context(self, session_id: str) -> tuple[str, ...]:
+        """Contextos que a sessão tinha ativos na última resposta do Dialogflow."""
+        with self._lock:
+            return self._contexts.get(session_id, ())
+
+    def set_session_context(self, session_id: str, contexts) -> None:
+        """Registra os contextos de saída devolvidos pelo Dialogflow para a sessão."""
+        contexts = tuple(sorted(contexts))
+        with self._lock:
+            if not contexts:
+                self._contexts.pop(session_id, None)
+                return
+            self._contexts[session_id] = contexts
+            self._contexts.move_to_end(session_id)
+            while len(self._contexts) > self.max_entries:
+                self._contexts.popitem(last=False)
+
+    def get(self, key: tuple | None):
+        """Resultado guardado para a chave (None em falta ou expirado)."""
+        if key is None:
+            return None
+        agora = time.monotonic()
+        with self._lock:
+            registro = self._entries.get(key)
+            if registro is not None and registro[0] > agora:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return registro[1]
+            if registro is not None:
+                del self._entries[key]
+            self._misses += 1
+            return None
+
+    def put(self, key: tuple | None, intent: str | None, value, output_contexts=()) -> bool:
+        """Guarda o resultado se a intent é independente de contexto; devolve se guardou."""
+        if key is None or intent not in self.cacheable_intents or output_contexts:
+            with self._lock:
+                self._skipped += 1
+            return False
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._contexts.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        """Acertos, faltas, resultados não guardáveis e taxa de acerto."""
+        with self._lock:
+            consultas = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "not_cacheable": self._skipped,
+                "hit_rate": round(self._hits / consultas, 4) if consultas else 0.0,
+            }
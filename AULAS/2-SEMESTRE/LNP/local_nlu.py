@@ -0,0 +1,293 @@
+"""
+Classificador de intents local (NLU offline).
+
+Treinado com as mesmas frases de treinamento mantidas para o agente
+Dialogflow (intents_hamburgueria.json e intent_PedidoDetalhado.json): cada
+frase vira um vetor TF-IDF de n-gramas de caracteres (2 a 4, sem acentos)
+e uma regressão logística multinomial, escrita em NumPy, dá a probabilidade
+de cada intent. Placeholders como "@BebidaTipo:bebida" são expandidos com
+os sinônimos de entities_hamburgueria.json.
+
+O modelo treinado é salvo em nlu_model.npz junto com o hash dos arquivos de
+treino; load_or_train só retreina quando as frases mudam. Uma previsão é
+um punhado de consultas em dicionário e um produto matriz-vetor pequeno
+(dezenas de microssegundos), então turnos com confiança alta dispensam a
+ida ao Dialogflow.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+
+import numpy as np
+
+from menu_index import normalizar, remover_acentos
+
+# Tamanhos dos n-gramas de caracteres
+NGRAM_MIN = 2
+NGRAM_MAX = 4
+# Treino (gradiente descendente em lote sobre a entropia cruzada)
+EPOCHS = 400
+LEARNING_RATE = 2.0
+L2 = 1e-4
+# Variações geradas por frase com placeholders de entidade
+EXPANSIONS_PER_PHRASE = 6
+# Abaixo dessa fração de n-gramas conhecidos o texto é tratado como fora do domínio
+MIN_COVERAGE = 0.35
+# Confiança mínima sugerida para responder sem consultar o Dialogflow
+CONFIDENCE_THRESHOLD = 0.75
+
+NLU_ARTIFACT = "nlu_model.npz"
+FORMAT_VERSION = 1
+
+# Arquivos de treino do projeto (mesmos usados para criar o agente)
+_DIR = os.path.dirname(os.path.abspath(__file__))
+INTENT_FILES = [os.path.join(_DIR, "intents_hamburgueria.json"),
+                os.path.join(_DIR, "intent_PedidoDetalhado.json")]
+ENTITIES_FILE = os.path.join(_DIR, "entities_hamburgueria.json")
+
+_DEFAULT_MODEL = None
+_DEFAULT_LOCK = threading.Lock()
+
+_PLACEHOLDER = re.compile(r"@([\w-]+)(?::[\w-]+)?")
+
+
+def char_ngrams(texto: str) -> list[str]:
+    """N-gramas de caracteres do texto normalizado, com espaço nas bordas."""
+    limpo = " ".join(re.sub(r"[^0-9a-z]+", " ", remover_acentos(normalizar(texto))).split())
+    if not limpo:
+        return []
+    padded = f" {limpo} "
+    return [
+        padded[i:i + n]
+        for n in range(NGRAM_MIN, NGRAM_MAX + 1)
+        for i in range(len(padded) - n + 1)
+    ]
+
+
+def expand_placeholders(frase: str, entidades: dict[str, list[str]]) -> list[str]:
+    """Substitui @Entidade:param por sinônimos (variações determinísticas)."""
+    if not _PLACEHOLDER.search(frase):
+        return [frase]
+    variacoes = []
+    for k in range(EXPANSIONS_PER_PHRASE):
+        # k-ésima variação: cada placeholder avança um sinônimo em relação ao anterior
+        posicao = itertools.count(k)
+
+        def troca(m):
+            sinonimos = entidades.get(m.group(1)) or [m.group(1)]
+            return sinonimos[next(posicao) % len(sinonimos)]
+        variacoes.append(_PLACEHOLDER.sub(troca, frase))
+    return list(dict.fromkeys(variacoes))
+
+
+def load_training_data(intent_files: list[str], entities_file: str | None = None):
+    """
+    Lê os arquivos de intents no formato do projeto (displayName,
+    trainingPhrases, response). Devolve (frases, rótulos, respostas por intent).
+    """
+    entidades: dict[str, list[str]] = {}
+    if entities_file and os.path.exists(entities_file):
+        with open(entities_file, encoding="utf-8") as f:
+            for tipo in json.load(f):
+                entidades[tipo["displayName"]] = [
+                    s for e in tipo.get("entities", []) for s in e.get("synonyms", [e["value"]])
+                ]
+    textos, rotulos, respostas = [], [], {}
+    for caminho in intent_files:
+        with open(caminho, encoding="utf-8") as f:
+            intents = json.load(f)
+        for intent in intents:
+            nome = intent["displayName"]
+            respostas[nome] = intent.get("response", "")
+            for frase in intent.get("trainingPhrases", []):
+                for texto in expand_placeholders(frase, entidades):
+                    textos.append(texto)
+                    rotulos.append(nome)
+    return textos, rotulos, respostas
+
+
+def training_hash(paths: list[str]) -> str:
+    """Hash do conteúdo dos arquivos de treino (detecta artefato desatualizado)."""
+    digest = hashlib.sha256(str(FORMAT_VERSION).encode())
+    for caminho in paths:
+        if caminho and os.path.exists(caminho):
+            with open(caminho, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class LocalNLU:
+    """Modelo TF-IDF (n-gramas de caracteres) + regressão logística multinomial."""
+
+    def __init__(self, vocab: dict[str, int], idf: np.ndarray, weights: np.ndarray,
+                 bias: np.ndarray, labels: list[str], responses: dict[str, str] | None = None,
+                 source_hash: str = ""):
+        self.vocab = vocab
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        self.labels = labels
+        self.responses = responses or {}
+        self.source_hash = source_hash
+
+    @classmethod
+    def train(cls, textos: list[str], rotulos: list[str], responses: dict[str, str] | None = None,
+              source_hash: str = "", epochs: int = EPOCHS) -> "LocalNLU":
+        """Treina o modelo a partir de frases rotuladas."""
+        labels = sorted(set(rotulos))
+        docs = [char_ngrams(t) for t in textos]
+        vocab: dict[str, int] = {}
+        for grams in docs:
+            for g in grams:
+                vocab.setdefault(g, len(vocab))
+        # IDF suavizado (como no scikit-learn)
+        df = np.zeros(len(vocab))
+        for grams in docs:
+            df[[vocab[g] for g in set(grams)]] += 1
+        idf = (np.log((1 + len(docs)) / (1 + df)) + 1).astype(np.float32)
+
+        model = cls(vocab, idf, np.zeros((len(vocab), len(labels)), np.float32),
+                    np.zeros(len(labels), np.float32), labels, responses, source_hash)
+        X = np.zeros((len(docs), len(vocab)), np.float32)
+        for i, texto in enumerate(textos):
+            idx, vals, _ = model._vectorize(texto)
+            X[i, idx] = vals
+        Y = np.zeros((len(docs), len(labels)), np.float32)
+        Y[np.arange(len(docs)), [labels.index(r) for r in rotulos]] = 1
+
+        W, b = model.weights, model.bias
+        n = len(docs)
+        for _ in range(epochs):
+            logits = X @ W + b
+            logits -= logits.max(axis=1, keepdims=True)
+            P = np.exp(logits)
+            P /= P.sum(axis=1, keepdims=True)
+            G = (P - Y) / n
+            W -= LEARNING_RATE * (X.T @ G + L2 * W)
+            b -= LEARNING_RATE * G.sum(axis=0)
+        return model
+
+    def _vectorize(self, texto: str) -> tuple[np.ndarray, np.ndarray, float]:
+        """Índices e pesos TF-IDF (L2) dos n-gramas conhecidos e a cobertura do texto."""
+        grams = char_ngrams(texto)
+        contagem: dict[int, int] = {}
+        for g in grams:
+            j = self.vocab.get(g)
+            if j is not None:
+                contagem[j] = contagem.get(j, 0) + 1
+        if not contagem:
+            return np.empty(0, np.intp), np.empty(0, np.float32), 0.0
+        idx = np.fromiter(contagem.keys(), np.intp, len(contagem))
+        tf = np.fromiter(contagem.values(), np.float32, len(contagem))
+        vals = (1 + np.log(tf)) * self.idf[idx]
+        vals /= np.linalg.norm(vals)
+        cobertura = sum(contagem.values()) / len(grams)
+        return idx, vals, cobertura
+
+    def predict_proba(self, texto: str) -> dict[str, float]:
+        """Probabilidade de cada intent (vazio se o texto não tem n-gramas conhecidos)."""
+        idx, vals, _ = self._vectorize(texto)
+        if not len(idx):
+            return {}
+        logits = vals @ self.weights[idx] + self.bias
+        p = np.exp(logits - logits.max())
+        p /= p.sum()
+        return dict(zip(self.labels, p.tolist()))
+
+    def predict(self, texto: str) -> tuple[str | None, float]:
+        """(intent mais provável, confiança); (None, 0.0) para texto fora do domínio."""
+        idx, vals, cobertura = self._vectorize(texto)
+        if cobertura < MIN_COVERAGE:
+            return None, 0.0
+        logits = vals @ self.weights[idx] + self.bias
+        p = np.exp(logits - logits.max())
+        p /= p.sum()
+        melhor = int(p.argmax())
+        return self.labels[melhor], float(p[melhor])
+
+    def save(self, path: str = NLU_ARTIFACT) -> None:
+        """Grava o artefato (.npz) de forma atômica."""
+        termos = sorted(self.vocab, key=self.vocab.get)
+        # Nome único: processos e threads treinando ao mesmo tempo não disputam o temporário
+        diretorio, nome = os.path.split(path)
+        fd, tmp_path = tempfile.mkstemp(prefix=nome + ".", suffix=".tmp", dir=diretorio or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    format_version=np.array(FORMAT_VERSION),
+                    source_hash=np.array(self.source_hash),
+                    vocab=np.array(termos),
+                    idf=self.idf,
+                    weights=self.weights,
+                    bias=self.bias,
+                    labels=np.array(self.labels),
+                    responses=np.array(json.dumps(self.responses, ensure_ascii=False)),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str = NLU_ARTIFACT) -> "LocalNLU":
+        """Carrega o artefato gravado por save() (ValueError se o formato mudou)."""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format_version"]) != FORMAT_VERSION:
+                raise ValueError(f"{path}: formato {int(data['format_version'])} incompatível")
+            termos = data["vocab"].tolist()
+            return cls(
+                {t: i for i, t in enumerate(termos)},
+                data["idf"], data["weights"], data["bias"],
+                data["labels"].tolist(),
+                json.loads(str(data["responses"])),
+                str(data["source_hash"]),
+            )
+
+
+def load_or_train(intent_files: list[str], entities_file: str | None = None,
+                  artifact_path: str = NLU_ARTIFACT) -> LocalNLU | None:
+    """
+    Usa o artefato salvo se ele corresponde às frases atuais; senão treina e
+    grava um novo. Devolve None se não houver arquivos de intents.
+    """
+    existentes = [p for p in intent_files if os.path.exists(p)]
+    if not existentes:
+        return None
+    fonte = training_hash(existentes + [entities_file])
+    if os.path.exists(artifact_path):
+        try:
+            model = LocalNLU.load(artifact_path)
+            if model.source_hash == fonte:
+                return model
+        except (OSError, ValueError, KeyError) as e:
+            print("Artefato de NLU ignorado:", e)
+    textos, rotulos, respostas = load_training_data(existentes, entities_file)
+    model = LocalNLU.train(textos, rotulos, respostas, source_hash=fonte)
+    try:
+        model.save(artifact_path)
+    except OSError as e:
+        print("Falha ao gravar artefato de NLU:", e)
+    return model
+
+
+def default_model() -> LocalNLU | None:
+    """Modelo dos arquivos do projeto, carregado (ou treinado) uma vez por processo."""
+    global _DEFAULT_MODEL
+    if _DEFAULT_MODEL is None:
+        with _DEFAULT_LOCK:
+            if _DEFAULT_MODEL is None:
+                _DEFAULT_MODEL = load_or_train(INTENT_FILES, ENTITIES_FILE,
+                                               os.path.join(_DIR, NLU_ARTIFACT))
+    return _DEFAULT_MODEL
+
+
+if __name__ == "__main__":
+    # Treina e grava o artefato: python local_nlu.py
+    nlu = default_model()
+    print(f"{len(nlu.labels)} intents, {len(nlu.vocab)} n-gramas -> {NLU_ARTIFACT}")
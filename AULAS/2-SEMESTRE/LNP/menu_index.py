@@ -0,0 +1,506 @@
+"""
+Índice pré-compilado do cardápio.
+
+O índice é construído uma única vez a cada carga do cardápio (upload ou
+leitura do cache em disco) e permite que as intents do webhook consultem
+itens, categorias e opções vegetarianas em O(1), sem refiltrar o
+DataFrame a cada mensagem.
+
+Os itens ficam em registros compactos e imutáveis (MenuItem), com preço em
+centavos inteiros; o pandas fica restrito à ingestão de planilhas, então
+este módulo (e quem só atende requisições) não precisa importá-lo.
+"""
+
+import csv
+import difflib
+import hashlib
+import html
+import re
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+
+# Similaridade mínima (trigramas) para sugerir um item parecido
+FUZZY_MIN_SCORE = 0.3
+# Candidatos (por trigramas) reavaliados por distância de edição em resolve()
+FUZZY_RESOLVE_CANDIDATES = 5
+FUZZY_CANDIDATE_SCORE = 0.2
+# Similaridade de edição (difflib, 2·iguais/total) mínima para assumir o item sem perguntar
+# ao usuário: cerca de 1 letra trocada, faltando ou sobrando a cada 5 (2 num nome de 10).
+# Variantes que são outro produto ("coca zero", "suco uva") ficam abaixo e geram pergunta
+FUZZY_RESOLVE_SCORE = 0.8
+# Vantagem mínima do melhor candidato sobre o segundo para resolver sozinho
+FUZZY_RESOLVE_MARGIN = 0.1
+# Trigramas presentes em mais que esta fração dos termos ("  b", "er ") não geram candidatos
+FUZZY_STOPGRAM_RATIO = 0.02
+# ...desde que a lista tenha ao menos este tamanho (cardápios pequenos usam todos)
+FUZZY_STOPGRAM_MIN = 64
+# Se todos os trigramas da busca forem comuns, usa só as N listas mais curtas
+FUZZY_FALLBACK_LISTS = 2
+# Buscas memorizadas por índice (erros de digitação se repetem muito)
+FUZZY_CACHE_MAX = 1024
+
+# Valores da coluna "vegetariano" considerados verdadeiros
+VEGETARIANO_VALORES = {"sim", "true", "vegano", "vegetariano"}
+
+# Formatos pré-renderizados do cardápio completo
+FORMATOS_CARDAPIO = ("markdown", "text", "html")
+# Cache de renderização: (versão do cardápio, formato) -> texto pronto
+RENDER_CACHE: dict[tuple[str, str], str] = {}
+# Quantidade máxima de entradas (versões antigas são descartadas primeiro)
+RENDER_CACHE_MAX = 16
+
+
+def normalizar(texto) -> str:
+    """Normaliza um texto para comparação (sem espaços nas bordas e em minúsculas)."""
+    return str(texto).strip().lower()
+
+
+def remover_acentos(texto: str) -> str:
+    """Remove acentos mantendo os demais caracteres ("porção" -> "porcao")."""
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def trigramas(texto) -> set[str]:
+    """
+    Trigramas de um texto normalizado (sem acentos e pontuação), no estilo do
+    pg_trgm: cada palavra é completada com dois espaços antes e um depois,
+    então "coca-cola" e "coca cola" geram o mesmo conjunto.
+    """
+    grams = set()
+    for palavra in texto_busca(texto).split():
+        padded = f"  {palavra} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def texto_busca(texto) -> str:
+    """Texto só com letras e números, sem acentos e com espaços simples ("Coca-Cola" -> "coca cola")."""
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", remover_acentos(normalizar(texto))).split())
+
+
+def is_missing(valor) -> bool:
+    """Indica valor ausente: None, NaN (float) ou texto vazio."""
+    if valor is None:
+        return True
+    if isinstance(valor, float):
+        return valor != valor
+    return str(valor).strip() == ""
+
+
+def split_sinonimos(raw) -> list[str]:
+    """Separa a coluna "sinonimos" ("x-burguer|xb") ignorando valores vazios/NaN."""
+    if is_missing(raw):
+        return []
+    return [p.strip() for p in str(raw).split("|") if p.strip()]
+
+
+def to_centavos(preco) -> int | None:
+    """Converte um preço (float/str) para centavos inteiros; None se inválido."""
+    if is_missing(preco):
+        return None
+    try:
+        valor = float(str(preco).replace(",", ".")) if isinstance(preco, str) else float(preco)
+    except (TypeError, ValueError):
+        return None
+    if valor != valor:
+        return None
+    return round(valor * 100)
+
+
+class MenuItem:
+    """Item do cardápio: registro imutável e compacto usado no atendimento."""
+
+    __slots__ = ("categoria", "item", "descricao", "preco_centavos", "vegetariano", "sinonimos")
+
+    def __init__(self, categoria: str, item: str, descricao: str | None,
+                 preco_centavos: int, vegetariano: bool, sinonimos: tuple[str, ...] = ()):
+        # Categorias se repetem em todo o cardápio: internar evita cópias
+        object.__setattr__(self, "categoria", sys.intern(categoria))
+        object.__setattr__(self, "item", item)
+        object.__setattr__(self, "descricao", descricao)
+        object.__setattr__(self, "preco_centavos", preco_centavos)
+        object.__setattr__(self, "vegetariano", vegetariano)
+        object.__setattr__(self, "sinonimos", sinonimos)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MenuItem é imutável")
+
+    def __repr__(self) -> str:
+        return f"MenuItem({self.categoria!r}, {self.item!r}, R${self.preco:.2f})"
+
+    def __reduce__(self):
+        # Serialização (snapshot) via construtor, já que __setattr__ é bloqueado
+        return (MenuItem, (self.categoria, self.item, self.descricao,
+                           self.preco_centavos, self.vegetariano, self.sinonimos))
+
+    @property
+    def preco(self) -> float:
+        """Preço em reais (derivado dos centavos)."""
+        return self.preco_centavos / 100
+
+    @classmethod
+    def from_record(cls, record: dict) -> "MenuItem | None":
+        """Cria o item a partir de uma linha (dict); None se item/preço forem inválidos."""
+        nome = record.get("item")
+        centavos = to_centavos(record.get("preco"))
+        if is_missing(nome) or centavos is None:
+            return None
+        descricao = record.get("descricao")
+        categoria = record.get("categoria")
+        return cls(
+            categoria="" if is_missing(categoria) else str(categoria).strip(),
+            item=str(nome).strip(),
+            descricao=None if is_missing(descricao) else str(descricao),
+            preco_centavos=centavos,
+            vegetariano=(not is_missing(record.get("vegetariano"))
+                         and normalizar(record.get("vegetariano")) in VEGETARIANO_VALORES),
+            sinonimos=tuple(split_sinonimos(record.get("sinonimos"))),
+        )
+
+
+class ItemMatcher:
+    """
+    Autômato Aho-Corasick compilado a partir dos nomes dos itens e sinônimos.
+    Encontra todos os itens citados em uma mensagem em uma única passada
+    linear pelo texto e devolve as ocorrências mais longas sem sobreposição.
+    """
+
+    def __init__(self, items: list[MenuItem]):
+        # Cada nó do trie: transições, link de falha e padrões terminados nele
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[tuple[int, MenuItem]]] = [[]]
+        for row in items:
+            termos = (row.item,) + row.sinonimos
+            for termo in termos:
+                padrao = self._preparar(termo)
+                if padrao:
+                    self._add(padrao, row)
+        self._build_links()
+
+    @staticmethod
+    def _preparar(texto) -> str:
+        return remover_acentos(normalizar(texto))
+
+    def _add(self, padrao: str, row: MenuItem) -> None:
+        node = 0
+        for ch in padrao:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(padrao), row))
+
+    def _build_links(self) -> None:
+        # BFS: o link de falha aponta para o maior sufixo próprio que também é prefixo
+        fila = deque(self._goto[0].values())
+        while fila:
+            node = fila.popleft()
+            for ch, nxt in self._goto[node].items():
+                fila.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                destino = self._goto[f].get(ch, 0)
+                self._fail[nxt] = destino if destino != nxt else 0
+                # Herda as saídas do sufixo para reportar padrões contidos
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, texto: str) -> list[MenuItem]:
+        """Retorna os itens citados no texto, na ordem em que aparecem."""
+        texto = self._preparar(texto)
+        ocorrencias = []
+        node = 0
+        for fim, ch in enumerate(texto, start=1):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for tamanho, row in self._out[node]:
+                inicio = fim - tamanho
+                # Só aceita palavras inteiras ("veg" não casa dentro de "vegetal")
+                if inicio > 0 and texto[inicio - 1].isalnum():
+                    continue
+                if fim < len(texto) and texto[fim].isalnum():
+                    continue
+                ocorrencias.append((inicio, fim, row))
+
+        # Seleciona as ocorrências mais longas à esquerda, sem sobreposição
+        ocorrencias.sort(key=lambda o: (o[0], o[0] - o[1]))
+        encontrados = []
+        ultimo_fim = 0
+        for inicio, fim, row in ocorrencias:
+            if inicio >= ultimo_fim:
+                encontrados.append(row)
+                ultimo_fim = fim
+        return encontrados
+
+
+class FuzzyIndex:
+    """
+    Índice invertido de trigramas sobre nomes normalizados e sinônimos.
+    Permite achar itens com erros de digitação ("chesburguer") ou grafias
+    diferentes ("coca cola" x "Coca-Cola"), ordenados por similaridade.
+    """
+
+    def __init__(self, items: list[MenuItem]):
+        # Termos indexados: (item, trigramas do termo)
+        self._terms: list[tuple[MenuItem, frozenset[str]]] = []
+        # Trigrama -> ids dos termos que o contêm
+        self._postings: dict[str, list[int]] = {}
+        for row in items:
+            for termo in (row.item,) + row.sinonimos:
+                grams = frozenset(trigramas(termo))
+                if not grams:
+                    continue
+                term_id = len(self._terms)
+                self._terms.append((row, grams))
+                for gram in grams:
+                    self._postings.setdefault(gram, []).append(term_id)
+        # Listas maiores que isto são ignoradas na geração de candidatos
+        self._max_postings = max(FUZZY_STOPGRAM_MIN, int(len(self._terms) * FUZZY_STOPGRAM_RATIO))
+        self._init_cache()
+
+    def _init_cache(self) -> None:
+        # (texto normalizado, limit, min_score, word) -> resultado (LRU); o índice é imutável
+        self._cache: OrderedDict[tuple, list[tuple[MenuItem, float]]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def __getstate__(self):
+        # O cache de buscas (e o lock) não vão para o snapshot
+        state = self.__dict__.copy()
+        del state["_cache"], state["_cache_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
+
+    def search(self, texto, limit: int = 5, min_score: float = FUZZY_MIN_SCORE,
+               word: bool = False) -> list[tuple[MenuItem, float]]:
+        """
+        Retorna até `limit` pares (item, similaridade) em ordem decrescente.
+        Por padrão usa Jaccard entre trigramas (valor de parâmetro contra o
+        termo); com word=True mede a fração dos trigramas do termo presentes
+        no texto, adequado para procurar um item dentro de uma frase inteira.
+        """
+        consulta = texto_busca(texto)
+        # "X-Búrguer" e "x burguer" têm os mesmos trigramas: mesma entrada no cache
+        chave = (consulta, limit, min_score, word)
+        with self._cache_lock:
+            ranking = self._cache.get(chave)
+            if ranking is not None:
+                self._cache.move_to_end(chave)
+                return ranking
+        grams = trigramas(consulta)
+        if not grams:
+            return []
+        # Candidatos vêm dos trigramas seletivos; os muito comuns só entram na
+        # contagem (um termo que só compartilha "  b" e "er " não é parecido)
+        listas = sorted((self._postings[g] for g in grams if g in self._postings), key=len)
+        seletivas = [lista for lista in listas if len(lista) <= self._max_postings]
+        candidatos = set()
+        for lista in seletivas or listas[:FUZZY_FALLBACK_LISTS]:
+            candidatos.update(lista)
+
+        melhores: dict[int, tuple[MenuItem, float]] = {}
+        for term_id in candidatos:
+            row, term_grams = self._terms[term_id]
+            comuns = len(grams & term_grams)
+            total = len(term_grams)
+            score = comuns / total if word else comuns / (total + len(grams) - comuns)
+            if score < min_score:
+                continue
+            atual = melhores.get(id(row))
+            if atual is None or score > atual[1]:
+                melhores[id(row)] = (row, score)
+        ranking = sorted(melhores.values(), key=lambda par: par[1], reverse=True)[:limit]
+        with self._cache_lock:
+            self._cache[chave] = ranking
+            self._cache.move_to_end(chave)
+            while len(self._cache) > FUZZY_CACHE_MAX:
+                self._cache.popitem(last=False)
+        return ranking
+
+    def resolve(self, texto, min_score: float = FUZZY_RESOLVE_SCORE) -> MenuItem | None:
+        """
+        Devolve o item mais parecido apenas quando a escolha não é ambígua.
+        Os trigramas só escolhem os candidatos: em palavras curtas um erro de
+        digitação derruba muitos trigramas ("chesburguer" tem Jaccard 0,38 com
+        "cheeseburger"), então a decisão usa a similaridade de edição entre o
+        texto e o nome/sinônimo mais próximo de cada candidato.
+        """
+        consulta = texto_busca(texto)
+        if not consulta:
+            return None
+        candidatos = self.search(texto, limit=FUZZY_RESOLVE_CANDIDATES, min_score=FUZZY_CANDIDATE_SCORE)
+        if not candidatos:
+            return None
+        ranking = sorted(
+            ((max(difflib.SequenceMatcher(None, consulta, texto_busca(termo)).ratio()
+                  for termo in (row.item,) + row.sinonimos), row)
+             for row, _ in candidatos),
+            key=lambda par: par[0], reverse=True,
+        )
+        melhor, row = ranking[0]
+        if melhor < min_score:
+            return None
+        if len(ranking) > 1 and melhor - ranking[1][0] < FUZZY_RESOLVE_MARGIN:
+            return None
+        return row
+
+
+class MenuIndex:
+    """
+    Estruturas de consulta derivadas do cardápio.
+    Cada item é um MenuItem indexado por nome normalizado, por categoria
+    normalizada e por flag vegetariana.
+    """
+
+    def __init__(self, items):
+        # Itens do cardápio na ordem original da planilha
+        self.items: tuple[MenuItem, ...] = tuple(items)
+        # Nome normalizado -> item (mantém a primeira ocorrência, como o iloc[0] anterior)
+        self.by_name: dict[str, MenuItem] = {}
+        # Categoria normalizada -> itens da categoria
+        self.by_category: dict[str, list[MenuItem]] = {}
+        # Categorias na ordem em que aparecem no cardápio (nome original)
+        self.categories: list[str] = []
+        # Itens marcados como vegetarianos
+        self.vegetarian: list[MenuItem] = []
+
+        digest = hashlib.sha256()
+        for row in self.items:
+            self.by_name.setdefault(normalizar(row.item), row)
+            categoria = sys.intern(normalizar(row.categoria))
+            if categoria not in self.by_category:
+                self.by_category[categoria] = []
+                self.categories.append(row.categoria)
+            self.by_category[categoria].append(row)
+            if row.vegetariano:
+                self.vegetarian.append(row)
+            campos = (row.categoria, row.item, row.descricao or "", str(row.preco_centavos),
+                      "1" if row.vegetariano else "0", "|".join(row.sinonimos))
+            digest.update(("\x1f".join(campos) + "\x1e").encode("utf-8"))
+
+        # Hash do conteúdo: identifica a versão do cardápio nos caches
+        self.version = digest.hexdigest()[:16]
+
+        # Autômato de itens e sinônimos para reconhecer pedidos em texto livre
+        self._matcher: ItemMatcher | None = ItemMatcher(self.items)
+        # Trigramas para nomes incompletos ou com erros de digitação
+        self._fuzzy: FuzzyIndex | None = FuzzyIndex(self.items)
+        # Carregadores tardios (usados quando o índice vem de um snapshot)
+        self._loaders: dict = {}
+
+    @property
+    def matcher(self) -> ItemMatcher:
+        """Autômato de itens/sinônimos (carregado sob demanda a partir do snapshot)."""
+        if self._matcher is None:
+            self._matcher = self._loaders["matcher"]()
+        return self._matcher
+
+    @property
+    def fuzzy(self) -> FuzzyIndex:
+        """Índice de trigramas (carregado sob demanda a partir do snapshot)."""
+        if self._fuzzy is None:
+            self._fuzzy = self._loaders["fuzzy"]()
+        return self._fuzzy
+
+    @classmethod
+    def from_records(cls, records) -> "MenuIndex":
+        """Constrói o índice a partir de linhas (dicts), ignorando linhas sem item/preço válidos."""
+        items = (MenuItem.from_record(record) for record in records)
+        return cls(item for item in items if item is not None)
+
+    @classmethod
+    def from_dataframe(cls, df) -> "MenuIndex":
+        """Constrói o índice a partir de um DataFrame (fronteira de ingestão/admin)."""
+        return cls.from_records(df.to_dict("records"))
+
+    @classmethod
+    def from_csv(cls, path: str) -> "MenuIndex":
+        """Lê o cache CSV do cardápio com a biblioteca padrão (sem pandas)."""
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            reader.fieldnames = [c.strip().lower() for c in reader.fieldnames or []]
+            return cls.from_records(reader)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def get_item(self, name) -> MenuItem | None:
+        """Busca exata (sem diferenciar maiúsculas) pelo nome do item."""
+        return self.by_name.get(normalizar(name))
+
+    def get_category(self, categoria) -> list[MenuItem]:
+        """Retorna os itens de uma categoria (lista vazia se não existir)."""
+        return self.by_category.get(normalizar(categoria), [])
+
+    def resolve(self, name) -> MenuItem | None:
+        """Busca exata pelo nome; se falhar, aceita um item parecido sem ambiguidade."""
+        return self.get_item(name) or self.fuzzy.resolve(name)
+
+    def search(self, fragment) -> list[MenuItem]:
+        """Busca parcial/aproximada: itens parecidos com o fragmento, do mais ao menos similar."""
+        return [row for row, _ in self.fuzzy.search(fragment)]
+
+    def render(self, formato: str = "markdown") -> str:
+        """
+        Retorna o cardápio completo renderizado no formato pedido
+        ("markdown" para Streamlit, "text" para Telegram, "html").
+        O resultado é memoizado pela versão (hash) do cardápio, então só é
+        recalculado quando um cardápio diferente é carregado.
+        """
+        if formato not in FORMATOS_CARDAPIO:
+            raise ValueError(f"Formato de cardápio inválido: {formato}")
+        chave = (self.version, formato)
+        texto = RENDER_CACHE.get(chave)
+        if texto is None:
+            if formato == "html":
+                texto = self._render_html()
+            else:
+                texto = self._render_text(negrito=formato == "markdown")
+            if len(RENDER_CACHE) >= RENDER_CACHE_MAX:
+                # Remove a entrada mais antiga (dicts preservam ordem de inserção)
+                RENDER_CACHE.pop(next(iter(RENDER_CACHE)), None)
+            RENDER_CACHE[chave] = texto
+        return texto
+
+    def _render_text(self, negrito: bool) -> str:
+        b = "**" if negrito else ""
+        partes = [f"📋 {b}CARDÁPIO COMPLETO{b} 📋\n\n"]
+        for categoria in self.categories:
+            partes.append(f"🍴 {b}{categoria.upper()}{b}\n")
+            for row in self.get_category(categoria):
+                vegetariano = " 🌱" if row.vegetariano else ""
+                partes.append(f"• {b}{row.item}{b} - R$ {row.preco:.2f}{vegetariano}\n")
+                if row.descricao is not None:
+                    partes.append(f"  {row.descricao}\n")
+            partes.append("\n")
+        return "".join(partes)
+
+    def _render_html(self) -> str:
+        linhas = []
+        for row in self.items:
+            linhas.append(
+                "<tr>"
+                f"<td>{html.escape(row.categoria)}</td>"
+                f"<td>{html.escape(row.item)}</td>"
+                f"<td>{html.escape(row.descricao or '')}</td>"
+                f"<td>R$ {row.preco:.2f}</td>"
+                f"<td>{'🌱' if row.vegetariano else ''}</td>"
+                "</tr>"
+            )
+        return (
+            '<table class="cardapio">'
+            "<thead><tr><th>Categoria</th><th>Item</th><th>Descrição</th>"
+            "<th>Preço</th><th>Vegetariano</th></tr></thead>"
+            "<tbody>" + "".join(linhas) + "</tbody></table>"
+        )
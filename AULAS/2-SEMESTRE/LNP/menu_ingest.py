@@ -0,0 +1,185 @@
+"""
+Ingestão em streaming de planilhas de cardápio (CSV/XLSX).
+
+A planilha é lida linha a linha em blocos de tamanho fixo: as colunas
+obrigatórias são validadas logo no cabeçalho, "preco" e "vegetariano" são
+normalizados bloco a bloco e linhas inválidas são reportadas com o número
+da linha. As linhas cruas (dicts e textos da planilha) ficam em memória só
+durante o bloco; o que cresce com o arquivo são os registros compactos
+(MenuItem) das linhas válidas, que o MenuIndex precisa manter de qualquer
+forma. O pico de memória é, portanto, O(itens válidos) + O(bloco), e não
+O(tamanho do arquivo) como na leitura com pandas.
+"""
+
+import csv
+import io
+import os
+import tempfile
+
+from menu_index import MenuIndex, MenuItem, is_missing, normalizar, to_centavos
+
+# Colunas que toda planilha de cardápio precisa ter
+REQUIRED_COLUMNS = ["categoria", "item", "descricao", "preco"]
+# Colunas gravadas no cache normalizado
+CACHE_COLUMNS = ["categoria", "item", "descricao", "preco", "vegetariano", "sinonimos"]
+# Linhas processadas por bloco
+CHUNK_SIZE = 5000
+# Máximo de linhas inválidas detalhadas no relatório (as demais só são contadas)
+MAX_BAD_ROWS = 100
+# Linhas guardadas para pré-visualização no painel de administração
+PREVIEW_ROWS = 50
+
+
+class MenuIngestError(Exception):
+    """Planilha ilegível ou sem as colunas obrigatórias."""
+
+
+class IngestResult:
+    """Resultado da ingestão: índice pronto, contagens e linhas rejeitadas."""
+
+    def __init__(self):
+        self.index: MenuIndex | None = None
+        self.total_rows = 0
+        self.bad_count = 0
+        # (número da linha na planilha, motivo)
+        self.bad_rows: list[tuple[int, str]] = []
+        self.preview: list[dict] = []
+
+    def reject(self, line: int, motivo: str) -> None:
+        self.bad_count += 1
+        if len(self.bad_rows) < MAX_BAD_ROWS:
+            self.bad_rows.append((line, motivo))
+
+    def report(self) -> str:
+        """Resumo legível para o administrador."""
+        linhas = [f"{len(self.index or ())} itens carregados de {self.total_rows} linhas."]
+        if self.bad_count:
+            linhas.append(f"{self.bad_count} linhas ignoradas:")
+            linhas += [f"- linha {line}: {motivo}" for line, motivo in self.bad_rows]
+            if self.bad_count > len(self.bad_rows):
+                linhas.append(f"- ... e mais {self.bad_count - len(self.bad_rows)}")
+        return "\n".join(linhas)
+
+
+def _normalize_row(row: dict) -> tuple[dict | None, str | None]:
+    """Normaliza uma linha; devolve (linha, None) ou (None, motivo da rejeição)."""
+    if is_missing(row.get("item")):
+        return None, "item vazio"
+    centavos = to_centavos(row.get("preco"))
+    if centavos is None:
+        return None, f"preço inválido ({row.get('preco')!r})"
+    vegetariano = row.get("vegetariano")
+    row["vegetariano"] = "não" if is_missing(vegetariano) else normalizar(vegetariano)
+    row["preco"] = f"{centavos / 100:.2f}"
+    return row, None
+
+
+def _iter_csv(stream):
+    """Linhas (número, dict) de um CSV binário ou texto, com cabeçalho normalizado."""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        raise MenuIngestError("Planilha vazia.")
+    yield [c.strip().lower() for c in header]
+    for row in reader:
+        # reader.line_num já considera campos com quebra de linha entre aspas
+        yield reader.line_num, row
+
+
+def _iter_xlsx(stream):
+    """Linhas (número, valores) da primeira aba de um XLSX em modo somente leitura."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise MenuIngestError("Leitura de XLSX requer o pacote openpyxl.") from e
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise MenuIngestError("Planilha vazia.")
+        yield [str(c or "").strip().lower() for c in header]
+        for line, row in enumerate(rows, start=2):
+            yield line, row
+    finally:
+        workbook.close()
+
+
+def ingest(stream, filename: str, cache_path: str | None = None,
+           chunk_size: int = CHUNK_SIZE) -> IngestResult:
+    """
+    Lê a planilha em streaming e constrói o MenuIndex.
+    Se `cache_path` for informado, grava as linhas válidas normalizadas nesse
+    CSV (arquivo temporário + rename, para nunca deixar o cache pela metade).
+    Lança MenuIngestError se o cabeçalho for inválido ou nenhuma linha for válida.
+    """
+    linhas = _iter_xlsx(stream) if filename.lower().endswith(".xlsx") else _iter_csv(stream)
+    try:
+        header = next(linhas)
+    except StopIteration:
+        raise MenuIngestError("Planilha vazia.")
+    except MenuIngestError:
+        raise
+    except Exception as e:
+        raise MenuIngestError(f"Erro ao ler planilha: {e}") from e
+    ausentes = [c for c in REQUIRED_COLUMNS if c not in header]
+    if ausentes:
+        raise MenuIngestError(f"Colunas obrigatórias ausentes: {', '.join(ausentes)}")
+
+    result = IngestResult()
+    items: list[MenuItem] = []
+    writer = None
+    tmp_path = None
+    cache_file = None
+    if cache_path:
+        # Nome único por chamada: uploads simultâneos (threads do mesmo worker) não colidem
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(cache_path) + ".",
+                                        suffix=".tmp", dir=os.path.dirname(cache_path) or ".")
+        cache_file = os.fdopen(fd, "w", newline="", encoding="utf-8")
+        writer = csv.DictWriter(cache_file, fieldnames=CACHE_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+
+    def flush(chunk: list[tuple[int, dict]]) -> None:
+        validas = []
+        for line, row in chunk:
+            row, motivo = _normalize_row(row)
+            if motivo:
+                result.reject(line, motivo)
+                continue
+            item = MenuItem.from_record(row)
+            items.append(item)
+            validas.append(row)
+            if len(result.preview) < PREVIEW_ROWS:
+                result.preview.append({c: row.get(c) for c in CACHE_COLUMNS})
+        if writer and validas:
+            writer.writerows(validas)
+
+    try:
+        chunk: list[tuple[int, dict]] = []
+        for line, values in linhas:
+            if not any(not is_missing(v) for v in values):
+                continue  # linha em branco
+            result.total_rows += 1
+            chunk.append((line, dict(zip(header, values))))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        flush(chunk)
+        if not items:
+            raise MenuIngestError("Nenhuma linha válida no cardápio.\n" + result.report())
+    except Exception as e:
+        # Descarta o cache parcial; o cache anterior continua valendo
+        if cache_file:
+            cache_file.close()
+            os.remove(tmp_path)
+        if isinstance(e, MenuIngestError):
+            raise
+        raise MenuIngestError(f"Erro ao ler planilha: {e}") from e
+
+    if cache_file:
+        cache_file.close()
+        os.replace(tmp_path, cache_path)
+    result.index = MenuIndex(items)
+    return result
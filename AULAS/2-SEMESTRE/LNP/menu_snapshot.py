@@ -0,0 +1,265 @@
+"""
+Snapshot binário do cardápio (cardapio_cache.snap).
+
+Guarda o MenuIndex já compilado — itens, tabelas de consulta, autômato de
+sinônimos e índice de trigramas — em seções independentes de um único
+arquivo. Nada de reler o CSV, normalizar linhas ou recompilar índices a
+cada processo.
+
+O que o mmap economiza: o arquivo não é lido inteiro na carga. A seção
+principal (itens e tabelas) é desserializada por completo — O(itens) a
+cada carga, como qualquer pickle —, mas o autômato e os trigramas, as
+seções maiores, só são lidos e desserializados na primeira vez em que
+forem usados; até lá ocupam apenas páginas do cache do sistema,
+compartilhadas entre os workers.
+
+Formato (little-endian):
+    cabeçalho: MAGIC (8s) | FORMAT_VERSION (H) | nº de seções (H) | versão do cardápio (16s)
+    tabela:    por seção, nome (8s) | offset (Q) | tamanho (Q) | SHA-256 (32s)
+    dados:     blobs pickle de cada seção
+
+O arquivo é gravado em um temporário e publicado com os.replace (atômico),
+então um worker nunca enxerga um snapshot pela metade. Antes de qualquer
+pickle.loads o cabeçalho (MAGIC e versão do formato) e o SHA-256 da seção
+são conferidos: arquivo truncado, corrompido ou de outra versão vira
+SnapshotError, nunca um unpickle. O hash não autentica quem gravou; como
+usa pickle, o diretório do snapshot só deve ser gravável pela aplicação.
+
+MenuWatcher propaga um upload para todos os workers: cada processo observa
+o snapshot e, quando ele é substituído, monta o novo índice em uma thread
+de fundo e troca a referência global de uma vez (copy-on-write).
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+
+from menu_index import MenuIndex, MenuItem
+
+# Arquivos de cache do cardápio (CSV legível + snapshot binário)
+MENU_CACHE_CSV = "cardapio_cache.csv"
+MENU_SNAPSHOT = "cardapio_cache.snap"
+
+MAGIC = b"CARDSNP\0"
+# Incrementar sempre que a estrutura do MenuIndex ou do arquivo mudar
+FORMAT_VERSION = 2
+# Intervalo (segundos) entre verificações do snapshot por MenuWatcher
+RELOAD_INTERVAL = float(os.getenv("MENU_RELOAD_INTERVAL", "2"))
+_HEADER = struct.Struct("<8sHH16s")
+_SECTION = struct.Struct("<8sQQ32s")
+
+
+class SnapshotError(Exception):
+    """Snapshot ausente, corrompido ou de outro formato."""
+
+
+class _RefPickler(pickle.Pickler):
+    """Serializa MenuItem como referência à posição em index.items."""
+
+    def __init__(self, file, posicoes: dict[int, int]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._posicoes = posicoes
+
+    def persistent_id(self, obj):
+        if type(obj) is MenuItem:
+            return self._posicoes.get(id(obj))
+        return None
+
+
+class _RefUnpickler(pickle.Unpickler):
+    """Resolve as referências gravadas por _RefPickler."""
+
+    def __init__(self, file, items: tuple[MenuItem, ...]):
+        super().__init__(file)
+        self._items = items
+
+    def persistent_load(self, pid):
+        return self._items[pid]
+
+
+def _dumps(obj, posicoes: dict[int, int]) -> bytes:
+    buf = io.BytesIO()
+    _RefPickler(buf, posicoes).dump(obj)
+    return buf.getvalue()
+
+
+def write_snapshot(index: MenuIndex, path: str = MENU_SNAPSHOT) -> None:
+    """Grava o snapshot do índice de forma atômica (temporário + rename)."""
+    posicoes = {id(item): i for i, item in enumerate(index.items)}
+    core = {
+        "items": index.items,
+        "by_name": index.by_name,
+        "by_category": index.by_category,
+        "categories": index.categories,
+        "vegetarian": index.vegetarian,
+        "version": index.version,
+    }
+    secoes = [
+        (b"core", pickle.dumps(core, protocol=pickle.HIGHEST_PROTOCOL)),
+        (b"matcher", _dumps(index.matcher, posicoes)),
+        (b"fuzzy", _dumps(index.fuzzy, posicoes)),
+    ]
+
+    offset = _HEADER.size + _SECTION.size * len(secoes)
+    tabela = []
+    for nome, blob in secoes:
+        tabela.append(_SECTION.pack(nome, offset, len(blob), hashlib.sha256(blob).digest()))
+        offset += len(blob)
+
+    # Nome único por chamada: gravações simultâneas (threads ou workers) não colidem
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(secoes), index.version.encode("ascii")))
+            f.writelines(tabela)
+            f.writelines(blob for _, blob in secoes)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _section_bytes(mm, secoes: dict, nome: str, path: str) -> bytes:
+    """Bytes da seção, conferidos com o SHA-256 da tabela (SnapshotError se não baterem)."""
+    if nome not in secoes:
+        raise SnapshotError(f"{path} sem a seção {nome}")
+    offset, tamanho, digest = secoes[nome]
+    blob = mm[offset:offset + tamanho]
+    if hashlib.sha256(blob).digest() != digest:
+        raise SnapshotError(f"{path}: seção {nome} corrompida")
+    return blob
+
+
+def load_snapshot(path: str = MENU_SNAPSHOT) -> MenuIndex:
+    """Mapeia o snapshot em memória e devolve o índice (seções pesadas sob demanda)."""
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Não foi possível abrir {path}: {e}") from e
+
+    try:
+        magic, formato, n_secoes, _ = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or formato != FORMAT_VERSION:
+            raise SnapshotError(f"{path} não é um snapshot compatível")
+        secoes = {}
+        for i in range(n_secoes):
+            nome, offset, tamanho, digest = _SECTION.unpack_from(mm, _HEADER.size + i * _SECTION.size)
+            if offset + tamanho > len(mm):
+                raise SnapshotError(f"{path} truncado")
+            secoes[nome.rstrip(b"\0").decode("ascii")] = (offset, tamanho, digest)
+        core = pickle.loads(_section_bytes(mm, secoes, "core", path))
+    except SnapshotError:
+        raise
+    except Exception as e:
+        raise SnapshotError(f"Snapshot inválido em {path}: {e}") from e
+
+    index = MenuIndex.__new__(MenuIndex)
+    index.__dict__.update(core)
+    index._matcher = None
+    index._fuzzy = None
+
+    def loader(nome):
+        def carregar():
+            # O mmap continua aberto enquanto o índice existir (mesmo após um novo rename)
+            return _RefUnpickler(io.BytesIO(_section_bytes(mm, secoes, nome, path)), index.items).load()
+        return carregar
+
+    index._loaders = {"matcher": loader("matcher"), "fuzzy": loader("fuzzy")}
+    return index
+
+
+def load_menu(csv_path: str = MENU_CACHE_CSV, snapshot_path: str = MENU_SNAPSHOT) -> MenuIndex | None:
+    """
+    Carrega o cardápio persistido: usa o snapshot se ele estiver em dia com o
+    CSV; caso contrário lê o CSV uma vez e gera o snapshot para os próximos
+    processos. Devolve None se não houver cardápio salvo.
+    """
+    csv_mtime = os.path.getmtime(csv_path) if os.path.exists(csv_path) else None
+    if os.path.exists(snapshot_path) and (csv_mtime is None or os.path.getmtime(snapshot_path) >= csv_mtime):
+        try:
+            return load_snapshot(snapshot_path)
+        except SnapshotError as e:
+            print("Snapshot do cardápio ignorado:", e)
+    if csv_mtime is None:
+        return None
+    index = MenuIndex.from_csv(csv_path)
+    try:
+        write_snapshot(index, snapshot_path)
+    except OSError as e:
+        print("Falha ao gravar snapshot do cardápio:", e)
+    return index
+
+
+def _signature(path: str) -> tuple | None:
+    """Identifica a versão do arquivo no disco (o rename troca o inode)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class MenuWatcher:
+    """
+    Recarrega o cardápio em cada worker quando o snapshot muda no disco.
+    O índice novo é carregado e aquecido fora do caminho das requisições e só
+    então entregue a `set_index`, que troca a referência global; requisições em
+    andamento continuam com o índice antigo até terminarem.
+    """
+
+    def __init__(self, get_index, set_index, snapshot_path: str = MENU_SNAPSHOT,
+                 interval: float = RELOAD_INTERVAL):
+        self.get_index = get_index
+        self.set_index = set_index
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self._signature = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Inicia a observação neste processo (idempotente e seguro após fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._signature = _signature(self.snapshot_path)
+            threading.Thread(target=self._run, name="menu-watcher", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print("Falha ao recarregar cardápio:", e)
+
+    def poll(self) -> bool:
+        """Verifica o snapshot uma vez; devolve True se o índice foi trocado."""
+        signature = _signature(self.snapshot_path)
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        index = load_snapshot(self.snapshot_path)
+        atual = self.get_index()
+        if atual is not None and atual.version == index.version:
+            return False  # este worker já está na versão do disco (ex.: fez o upload)
+        # Aquece as seções tardias antes da troca
+        index.matcher
+        index.fuzzy
+        self.set_index(index)
+        print(f"Cardápio recarregado: versão {index.version} ({len(index)} itens)")
+        return True
@@ -0,0 +1,255 @@
+"""
+Controle de envio das entidades de sessão (@Item) para o Dialogflow.
+
+Um SessionEntityType continua valendo na sessão por cerca de 20 minutos,
+então não é preciso reenviar o cardápio a cada mensagem: basta reenviar
+quando o cardápio mudou de versão ou quando o envio anterior está perto de
+expirar. O registro (versão, horário do envio) fica em um LRU limitado para
+não crescer com o número de conversas.
+
+O corpo JSON do @Item é montado uma única vez por versão do cardápio e
+guardado em bytes prontos, compartilhado por todas as sessões; cada envio
+só formata a URL e escreve na rede.
+
+EntityPusher faz os envios em segundo plano: a resposta ao usuário só
+espera pelo @Item no primeiro turno da sessão (ou se o envio anterior já
+expirou); reenvios por troca de cardápio ou validade próxima do fim
+acontecem fora do caminho da mensagem.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from http_transport import DIALOGFLOW_API
+
+# Validade de um SessionEntityType no Dialogflow (segundos)
+SESSION_ENTITY_TTL = 20 * 60
+# Reenvia com esta folga antes de expirar (segundos)
+SESSION_ENTITY_MARGIN = 2 * 60
+# Máximo de sessões acompanhadas por processo
+MAX_TRACKED_SESSIONS = 10000
+# Threads de envio em segundo plano por processo
+PUSH_WORKERS = 2
+# Espera máxima (segundos) pelo envio no primeiro turno da sessão
+FIRST_TURN_TIMEOUT = 5.0
+
+# Estados de uma sessão em relação à versão atual do cardápio
+FRESH = "fresh"      # @Item da versão atual, longe de expirar
+STALE = "stale"      # @Item ainda válido, mas de outra versão ou perto de expirar
+MISSING = "missing"  # nunca enviado (ou já expirado): a mensagem depende do envio
+
+JSON_HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+# Corpo do SessionEntityType por versão do cardápio -> bytes prontos para envio
+PAYLOAD_CACHE: dict[str, bytes] = {}
+# Quantidade máxima de versões guardadas (as mais antigas saem primeiro)
+PAYLOAD_CACHE_MAX = 16
+
+
+class SessionEntityTracker:
+    """LRU limitado de session_id -> (versão do cardápio, horário do último envio)."""
+
+    def __init__(self, max_sessions: int = MAX_TRACKED_SESSIONS,
+                 ttl: float = SESSION_ENTITY_TTL, margin: float = SESSION_ENTITY_MARGIN):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.margin = margin
+        self._pushed: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def status(self, session_id: str, version: str) -> str:
+        """Situação do @Item da sessão: FRESH, STALE ou MISSING."""
+        with self._lock:
+            registro = self._pushed.get(session_id)
+            if registro is None:
+                return MISSING
+            self._pushed.move_to_end(session_id)
+        pushed_version, pushed_at = registro
+        idade = time.monotonic() - pushed_at
+        if idade >= self.ttl:
+            return MISSING
+        if pushed_version != version or idade >= self.ttl - self.margin:
+            return STALE
+        return FRESH
+
+    def needs_push(self, session_id: str, version: str) -> bool:
+        """True se a sessão nunca recebeu esta versão ou se o envio está para expirar."""
+        return self.status(session_id, version) != FRESH
+
+    def sessions(self) -> list[str]:
+        """Sessões acompanhadas (cópia, da menos para a mais recente)."""
+        with self._lock:
+            return list(self._pushed)
+
+    def mark_pushed(self, session_id: str, version: str) -> None:
+        """Registra um envio bem-sucedido, descartando a sessão menos recente se cheio."""
+        with self._lock:
+            self._pushed[session_id] = (version, time.monotonic())
+            self._pushed.move_to_end(session_id)
+            while len(self._pushed) > self.max_sessions:
+                self._pushed.popitem(last=False)
+
+    def forget(self, session_id: str) -> None:
+        """Força o reenvio na próxima mensagem da sessão."""
+        with self._lock:
+            self._pushed.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._pushed)
+
+
+def entity_payload(index) -> bytes:
+    """Corpo JSON (bytes) do SessionEntityType @Item para a versão do índice."""
+    payload = PAYLOAD_CACHE.get(index.version)
+    if payload is None:
+        entities = [
+            {"value": row.item, "synonyms": [row.item, *row.sinonimos]}
+            for row in index.items
+        ]
+        payload = json.dumps(
+            {"entityOverrideMode": "ENTITY_OVERRIDE_MODE_OVERRIDE", "entities": entities},
+            ensure_ascii=False, separators=(",", ":"),
+        ).encode("utf-8")
+        if len(PAYLOAD_CACHE) >= PAYLOAD_CACHE_MAX:
+            PAYLOAD_CACHE.pop(next(iter(PAYLOAD_CACHE)), None)
+        PAYLOAD_CACHE[index.version] = payload
+    return payload
+
+
+def push_item_entities(http, project_id: str, session_id: str, index,
+                       tracker: SessionEntityTracker | None = None) -> bool:
+    """
+    Publica @Item na sessão usando o corpo pré-serializado.
+    Devolve False se o tracker indicar que a sessão já está em dia; lança a
+    exceção HTTP/rede em caso de falha (a sessão não é marcada como enviada).
+    """
+    if tracker is not None and not tracker.needs_push(session_id, index.version):
+        return False
+    url = f"{DIALOGFLOW_API}/projects/{project_id}/agent/sessions/{session_id}/entityTypes/Item"
+    resp = http.put(url, data=entity_payload(index), headers=JSON_HEADERS)
+    resp.raise_for_status()
+    if tracker is not None:
+        tracker.mark_pushed(session_id, index.version)
+    return True
+
+
+class EntityPusher:
+    """
+    Envia @Item em segundo plano, com no máximo um envio pendente por sessão
+    (pedidos repetidos da mesma sessão reaproveitam o envio já agendado).
+    `push(session_id)` faz o envio de fato e lança exceção em caso de falha.
+    """
+
+    def __init__(self, push, tracker: SessionEntityTracker, max_workers: int = PUSH_WORKERS,
+                 first_turn_timeout: float = FIRST_TURN_TIMEOUT):
+        self.push = push
+        self.tracker = tracker
+        self.max_workers = max_workers
+        self.first_turn_timeout = first_turn_timeout
+        self._pending: dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._pid = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Criado no próprio processo: threads não sobrevivem ao fork do gunicorn
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="entity-push")
+            self._pending = {}
+            self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, session_id: str):
+        """Agenda o envio para a sessão (ou devolve o envio já pendente)."""
+        with self._lock:
+            future = self._pending.get(session_id)
+            if future is None:
+                future = self._pool().submit(self._run, session_id)
+                self._pending[session_id] = future
+            return future
+
+    def _run(self, session_id: str) -> None:
+        try:
+            self.push(session_id)
+        except Exception as e:
+            print(f"Falha ao enviar entidades da sessão {session_id}:", e)
+        finally:
+            with self._lock:
+                self._pending.pop(session_id, None)
+
+    def ensure(self, session_id: str, version: str) -> None:
+        """
+        Garante @Item na sessão antes do detectIntent. Só bloqueia quando a
+        sessão ainda não tem entidades válidas (primeiro turno ou expiradas).
+        """
+        status = self.tracker.status(session_id, version)
+        if status == FRESH:
+            return
+        future = self.submit(session_id)
+        if status == MISSING:
+            wait([future], timeout=self.first_turn_timeout)
+
+    def refresh_all(self, version: str) -> int:
+        """Reagenda as sessões ativas após troca de cardápio; devolve quantas."""
+        total = 0
+        for session_id in self.tracker.sessions():
+            if self.tracker.status(session_id, version) == STALE:
+                self.submit(session_id)
+                total += 1
+        return total
+
+
+async def push_item_entities_async(http, project_id: str, session_id: str, index,
+                                   tracker: SessionEntityTracker | None = None) -> bool:
+    """Versão assíncrona de push_item_entities (AsyncHttpTransport)."""
+    if tracker is not None and not tracker.needs_push(session_id, index.version):
+        return False
+    url = f"{DIALOGFLOW_API}/projects/{project_id}/agent/sessions/{session_id}/entityTypes/Item"
+    resp = await http.put(url, content=entity_payload(index), headers=JSON_HEADERS)
+    resp.raise_for_status()
+    if tracker is not None:
+        tracker.mark_pushed(session_id, index.version)
+    return True
+
+
+class AsyncEntityPusher:
+    """
+    Equivalente de EntityPusher para o event loop: um envio pendente
+    (asyncio.Task) por sessão, esperado só quando a sessão não tem @Item válido.
+    `push(session_id)` é uma corrotina que faz o envio.
+    """
+
+    def __init__(self, push, tracker: SessionEntityTracker,
+                 first_turn_timeout: float = FIRST_TURN_TIMEOUT):
+        self.push = push
+        self.tracker = tracker
+        self.first_turn_timeout = first_turn_timeout
+        self._pending: dict[str, asyncio.Task] = {}
+
+    def submit(self, session_id: str) -> asyncio.Task:
+        task = self._pending.get(session_id)
+        if task is None:
+            task = asyncio.create_task(self._run(session_id))
+            self._pending[session_id] = task
+        return task
+
+    async def _run(self, session_id: str) -> None:
+        try:
+            await self.push(session_id)
+        except Exception as e:
+            print(f"Falha ao enviar entidades da sessão {session_id}:", e)
+        finally:
+            self._pending.pop(session_id, None)
+
+    async def ensure(self, session_id: str, version: str) -> None:
+        status = self.tracker.status(session_id, version)
+        if status == FRESH:
+            return
+        task = self.submit(session_id)
+        if status == MISSING:
+            # shield: o timeout não cancela o envio, que segue em segundo plano
+            await asyncio.wait([asyncio.shield(task)], timeout=self.first_turn_timeout)
@@ -0,0 +1,316 @@
+"""
+Estado de conversa por sessão (carrinho e última ação) com expiração.
+
+Antes, carrinhos e última ação ficavam num dict global do processo que só
+crescia (uma entrada por chat), com a última ação guardada numa chave
+especial dentro do mesmo mapa, sem lock e perdida a cada reinício. Aqui o
+estado de cada sessão é um dicionário {"cart": [...], "last_action": ...}
+acessado por um SessionStore:
+
+    with SESSIONS.session(session_id) as sessao:
+        sessao["cart"].append(...)
+        sessao["last_action"] = "pedido_iniciado"
+
+O bloco é atômico por sessão e o estado é gravado ao sair (só se mudou).
+Durante o bloco a sessão fica travada (lock da partição em memória,
+transação de escrita no SQLite) e outras sessões podem esperar por ela:
+dentro dele só leitura e alteração do estado, sem rede nem outra espera;
+as chamadas ao Dialogflow e ao Telegram acontecem antes ou depois. Dois
+backends:
+
+    MemorySessionStore  dicionários particionados (lock striping), cada um
+                        com TTL e limite LRU; memória limitada mesmo com
+                        milhões de chats. Vale por processo.
+    SQLiteSessionStore  arquivo SQLite em modo WAL; todos os workers do
+                        gunicorn enxergam o mesmo carrinho e o estado
+                        sobrevive a reinícios. Cada bloco é uma transação
+                        BEGIN IMMEDIATE (escritas serializadas entre processos).
+
+open_session_store() escolhe pelo SESSION_STORE: "memory" (padrão) ou
+"sqlite:///caminho/sessions.db".
+"""
+
+import copy
+import json
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Sessão sem mensagem por mais que isso é descartada (segundos)
+SESSION_TTL = float(os.getenv("SESSION_TTL", "14400"))
+# Sessões mantidas (LRU): no backend em memória, o total entre as partições
+SESSION_MAX = int(os.getenv("SESSION_MAX", "100000"))
+# Partições do backend em memória (cada uma com seu lock)
+SESSION_STRIPES = 64
+# SQLite: limpeza de expiradas e excedentes a cada tantas gravações
+PURGE_EVERY = 500
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+
+def new_session() -> dict:
+    """Estado de uma sessão nova."""
+    return {"cart": [], "last_action": None}
+
+
+class SessionStore(ABC):
+    """Interface comum: session() para ler e alterar, get() para só ler."""
+
+    backend = "base"
+
+    @abstractmethod
+    def session(self, session_id: str):
+        """
+        Context manager com o estado da sessão para leitura e escrita,
+        gravado ao sair do bloco. Segura um lock até o fim do bloco (da
+        partição, em memória; de escrita do arquivo inteiro, no SQLite), que
+        trava também outras sessões: nada de I/O lá dentro.
+        """
+
+    def get(self, session_id: str) -> dict:
+        """Cópia do estado atual (sessão nova se não existe ou expirou)."""
+        with self.session(session_id) as sessao:
+            return copy.deepcopy(sessao)
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Remove a sessão (sem erro se ela não existe)."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Sessões guardadas (incluindo expiradas ainda não descartadas)."""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Contadores do backend."""
+
+
+class _Stripe:
+    __slots__ = ("lock", "entries")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # session_id -> (expira em, estado), do menos para o mais recente
+        self.entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+
+class MemorySessionStore(SessionStore):
+    """Sessões em memória: partições com lock próprio, TTL e LRU; seguro entre threads."""
+
+    backend = "memory"
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX,
+                 stripes: int = SESSION_STRIPES):
+        self.ttl = ttl
+        self.stripes = [_Stripe() for _ in range(max(1, stripes))]
+        self.max_per_stripe = max(1, -(-max_sessions // len(self.stripes)))
+        self._counter_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def _stripe(self, session_id: str) -> _Stripe:
+        return self.stripes[hash(session_id) % len(self.stripes)]
+
+    def _count(self, campo: str, n: int = 1) -> None:
+        with self._counter_lock:
+            setattr(self, campo, getattr(self, campo) + n)
+
+    @contextmanager
+    def session(self, session_id: str):
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            agora = time.monotonic()
+            registro = stripe.entries.get(session_id)
+            if registro is not None and registro[0] <= agora:
+                del stripe.entries[session_id]
+                self._count("_expired")
+                registro = None
+            self._count("_hits" if registro is not None else "_misses")
+            # Cópia: se o bloco levantar exceção, o estado guardado fica como estava
+            sessao = copy.deepcopy(registro[1]) if registro is not None else new_session()
+            yield sessao
+            if registro is None and sessao == new_session():
+                # Só leitura de sessão inexistente: nada a guardar
+                return
+            stripe.entries[session_id] = (time.monotonic() + self.ttl, sessao)
+            stripe.entries.move_to_end(session_id)
+            self._evict(stripe, agora)
+
+    def _evict(self, stripe: _Stripe, agora: float) -> None:
+        """Remove expiradas do início da fila e o excedente LRU da partição."""
+        expiradas = excedentes = 0
+        while stripe.entries:
+            session_id, (expira_em, _) = next(iter(stripe.entries.items()))
+            if expira_em <= agora:
+                expiradas += 1
+            elif len(stripe.entries) > self.max_per_stripe:
+                excedentes += 1
+            else:
+                break
+            del stripe.entries[session_id]
+        if expiradas:
+            self._count("_expired", expiradas)
+        if excedentes:
+            self._count("_evicted", excedentes)
+
+    def delete(self, session_id: str) -> None:
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            stripe.entries.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return sum(len(stripe.entries) for stripe in self.stripes)
+
+    def stats(self) -> dict:
+        """Sessões guardadas, acertos/faltas e descartes por TTL e por limite."""
+        with self._counter_lock:
+            return {
+                "backend": self.backend,
+                "sessions": len(self),
+                "max_sessions": self.max_per_stripe * len(self.stripes),
+                "hits": self._hits,
+                "misses": self._misses,
+                "expired": self._expired,
+                "evicted": self._evicted,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessões em SQLite (WAL), compartilhadas entre processos; uma conexão por thread."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._hits = 0
+        self._misses = 0
+        self._purged = 0
+        # Conexão própria, fechada em seguida: nada aberto para ser herdado pelo fork dos workers
+        conn = self._open()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated_at)")
+        finally:
+            conn.close()
+        # Conexões herdadas de antes de um fork: nunca fechadas no filho (ver _connect)
+        self._inherited: list[sqlite3.Connection] = []
+
+    def _open(self) -> sqlite3.Connection:
+        # Autocommit: as transações são abertas explicitamente em session()
+        return sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None, check_same_thread=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Conexão da thread atual (recriada após fork: conexões não podem ser herdadas)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        if conn is not None:
+            # Fechar a conexão herdada liberaria os locks POSIX do arquivo que este
+            # processo segurar depois: outro processo poderia gravar no meio da transação
+            self._inherited.append(conn)
+        conn = self._open()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def session(self, session_id: str):
+        conn = self._connect()
+        # Reserva a escrita já na leitura: outro worker não altera o carrinho no meio do turno
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            linha = conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            agora = time.time()
+            vivo = linha is not None and linha[1] > agora - self.ttl
+            original = json.loads(linha[0]) if vivo else new_session()
+            sessao = copy.deepcopy(original)
+            yield sessao
+            gravou = False
+            # Sem mudança, a validade só é renovada depois de 1/4 do TTL (evita uma escrita por leitura)
+            if sessao != original or (vivo and linha[1] < agora - self.ttl / 4):
+                conn.execute(
+                    "INSERT INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT(session_id) DO UPDATE SET data = excluded.data,"
+                    " updated_at = excluded.updated_at",
+                    (session_id, json.dumps(sessao, ensure_ascii=False), agora),
+                )
+                gravou = True
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            if vivo:
+                self._hits += 1
+            else:
+                self._misses += 1
+            self._writes += gravou
+            limpar = gravou and self._writes % PURGE_EVERY == 0
+        if limpar:
+            self.purge()
+
+    def purge(self) -> int:
+        """Apaga sessões expiradas e as mais antigas acima de max_sessions."""
+        conn = self._connect()
+        limite = time.time() - self.ttl
+        apagadas = conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (limite,)).rowcount
+        total = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        if total > self.max_sessions:
+            apagadas += conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                " SELECT session_id FROM sessions ORDER BY updated_at LIMIT ?)",
+                (total - self.max_sessions,),
+            ).rowcount
+        with self._lock:
+            self._purged += apagadas
+        return apagadas
+
+    def delete(self, session_id: str) -> None:
+        self._connect().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Sessões no arquivo, acertos/faltas, gravações e apagadas na limpeza."""
+        total = len(self)
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "path": self.path,
+                "sessions": total,
+                "max_sessions": self.max_sessions,
+                "hits": self._hits,
+                "misses": self._misses,
+                "writes": self._writes,
+                "purged": self._purged,
+            }
+
+
+def open_session_store(url: str | None = None) -> SessionStore:
+    """Backend conforme SESSION_STORE: "memory" ou "sqlite:///caminho.db"."""
+    url = url or os.getenv("SESSION_STORE", "memory")
+    if url == "memory":
+        return MemorySessionStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):])
+    raise ValueError(f"SESSION_STORE inválido: {url!r} (use 'memory' ou 'sqlite:///arquivo.db')")
@@ -43,9 +43,16 @@ with aba[0]:
 # --- CARDÁPIO ---
 with aba[1]:
     st.header('Cardápio Atual')
+    # Guarda o último corpo + ETag e revalida com GET condicional (304 = sem mudanças)
+    menu_cache = st.session_state.setdefault('menu_cache', {'etag': None, 'body': None})
+    headers = {'If-None-Match': menu_cache['etag']} if menu_cache['etag'] else {}
     try:
-        resp = requests.get(f"{BACKEND_URL}/menu")
-        if resp.status_code == 200:
+        resp = requests.get(f"{BACKEND_URL}/menu", headers=headers)
+        if resp.status_code == 304 and menu_cache['body'] is not None:
+            st.markdown(menu_cache['body'], unsafe_allow_html=True)
+        elif resp.status_code == 200:
+            menu_cache['etag'] = resp.headers.get('ETag')
+            menu_cache['body'] = resp.text
             st.markdown(resp.text, unsafe_allow_html=True)
         else:
             st.warning('Nenhum cardápio carregado.')
@@ -0,0 +1,162 @@
+"""
+Recebimento de mensagens do Telegram por long polling (getUpdates).
+
+Alternativa ao webhook para quando não há endpoint HTTPS público (ou para
+reduzir o custo de uma requisição de entrada por mensagem): uma thread
+chama getUpdates com `timeout` longo e `limit` de até 100 atualizações; sob
+tráfego alto cada ida e volta traz um lote inteiro. Cada atualização vai
+para a mesma função usada pelo webhook (enqueue_update do app), que a
+coloca na fila por chat (telegram_queue.py); chats diferentes são
+processados em paralelo pelas threads da fila.
+
+O offset só avança até a última atualização aceita. Se a fila estiver
+cheia no meio de um lote, o restante não é confirmado: o próximo
+getUpdates o recebe de novo depois de uma pausa, como faria o Telegram
+com o webhook respondendo 503.
+
+Só um processo pode fazer polling por bot (o Telegram responde 409 a
+chamadas concorrentes e enquanto houver webhook); não use com vários
+workers do gunicorn.
+"""
+
+import random
+import threading
+import time
+
+import requests
+
+from http_transport import MAX_RETRIES, TELEGRAM_API, HttpTransport, telegram_transport
+
+# Tempo que o Telegram segura o getUpdates esperando mensagens (segundos)
+POLL_TIMEOUT = 50
+# Atualizações por chamada (máximo da Bot API)
+POLL_LIMIT = 100
+ALLOWED_UPDATES = ["message", "edited_message"]
+# Pausa antes de reenviar o restante de um lote recusado pela fila cheia (segundos)
+BUSY_BACKOFF = 1.0
+# Backoff após erro de rede ou da API (segundos)
+ERROR_BACKOFF_BASE = 1.0
+ERROR_BACKOFF_MAX = 30.0
+
+
+class LongPoller:
+    """Laço de getUpdates que entrega cada atualização a `enqueue_update(update)`."""
+
+    def __init__(self, token: str, enqueue_update, transport: HttpTransport | None = None,
+                 timeout: int = POLL_TIMEOUT, limit: int = POLL_LIMIT,
+                 allowed_updates=ALLOWED_UPDATES, name: str = "telegram-polling"):
+        self.base_url = f"{TELEGRAM_API}/bot{token}"
+        self.enqueue_update = enqueue_update
+        self.transport = transport or telegram_transport()
+        self.timeout = timeout
+        self.limit = min(max(1, limit), POLL_LIMIT)
+        self.allowed_updates = list(allowed_updates)
+        self.name = name
+        self.offset = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._polls = 0
+        self._updates = 0
+        self._busy = 0
+        self._errors = 0
+        self._largest_batch = 0
+
+    def delete_webhook(self) -> None:
+        """Remove o webhook (o getUpdates não funciona com ele ativo); mantém as pendentes."""
+        # Idempotente: pode ser repetido com segurança
+        resp = self.transport.post(f"{self.base_url}/deleteWebhook",
+                                   json={"drop_pending_updates": False}, retries=MAX_RETRIES)
+        if not resp.ok or not resp.json().get("ok"):
+            raise RuntimeError(f"deleteWebhook falhou: {resp.status_code} {resp.text[:200]}")
+
+    def poll_once(self) -> list[dict]:
+        """Uma chamada ao getUpdates confirmando tudo antes de self.offset."""
+        payload = {"timeout": self.timeout, "limit": self.limit,
+                   "allowed_updates": self.allowed_updates}
+        if self.offset is not None:
+            payload["offset"] = self.offset
+        # Leitura precisa esperar mais que o timeout do long polling
+        resp = self.transport.post(f"{self.base_url}/getUpdates", json=payload,
+                                   timeout=(3.05, self.timeout + 10), retries=0)
+        if resp.status_code == 429:
+            raise _RetryLater(HttpTransport._retry_after(resp) or ERROR_BACKOFF_BASE)
+        corpo = resp.json() if resp.content else {}
+        if not resp.ok or not corpo.get("ok"):
+            raise RuntimeError(f"getUpdates {resp.status_code}: {corpo.get('description', resp.text[:200])}")
+        return corpo.get("result", [])
+
+    def dispatch(self, updates: list[dict]) -> bool:
+        """
+        Entrega o lote em ordem e avança o offset; para na primeira
+        atualização recusada (fila cheia) e devolve False.
+        """
+        aceitas = 0
+        try:
+            for update in updates:
+                if self.enqueue_update(update) is False:
+                    return False
+                aceitas += 1
+                self.offset = update["update_id"] + 1
+            return True
+        finally:
+            with self._lock:
+                self._updates += aceitas
+                if aceitas < len(updates):
+                    self._busy += 1
+
+    def run(self) -> None:
+        """Laço principal (bloqueia até stop())."""
+        falhas = 0
+        while not self._stop.is_set():
+            try:
+                updates = self.poll_once()
+            except _RetryLater as e:
+                self._stop.wait(e.seconds)
+                continue
+            except (requests.RequestException, RuntimeError, ValueError) as e:
+                falhas += 1
+                with self._lock:
+                    self._errors += 1
+                espera = random.uniform(0.5, 1.0) * min(ERROR_BACKOFF_MAX,
+                                                        ERROR_BACKOFF_BASE * 2 ** min(falhas, 10))
+                print(f"[{self.name}] Falha no getUpdates (nova tentativa em {espera:.1f}s):", e)
+                self._stop.wait(espera)
+                continue
+            falhas = 0
+            with self._lock:
+                self._polls += 1
+                self._largest_batch = max(self._largest_batch, len(updates))
+            if updates and not self.dispatch(updates):
+                self._stop.wait(BUSY_BACKOFF)
+
+    def start(self) -> threading.Thread:
+        """Roda o laço em uma thread (o processo continua servindo Flask, por exemplo)."""
+        self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        """Chamadas, atualizações recebidas, tamanho dos lotes e recusas por fila cheia."""
+        with self._lock:
+            return {
+                "name": self.name,
+                "offset": self.offset,
+                "polls": self._polls,
+                "updates": self._updates,
+                "avg_batch": round(self._updates / self._polls, 2) if self._polls else 0.0,
+                "largest_batch": self._largest_batch,
+                "busy_batches": self._busy,
+                "errors": self._errors,
+            }
+
+
+class _RetryLater(Exception):
+    """429 no getUpdates: esperar `seconds` antes da próxima chamada."""
+
+    def __init__(self, seconds: float):
+        super().__init__(f"retry_after {seconds}")
+        self.seconds = seconds
@@ -0,0 +1,138 @@
+"""
+Fila de atualizações do Telegram dividida por chat (fire-and-ack).
+
+O webhook só valida a atualização, coloca na fila e responde 200; o
+Telegram não fica esperando o envio do @Item, o detectIntent e o
+sendMessage (nem reenvia ou reduz a vazão por causa da demora). Um grupo
+de threads consome a fila: cada chat_id cai sempre na mesma partição
+(shard), com uma thread por partição, então as mensagens de um chat são
+processadas em ordem e chats diferentes andam em paralelo.
+
+A profundidade é limitada: com a fila cheia, submit() devolve False e o
+webhook responde 503, para o Telegram reentregar mais tarde em vez de a
+memória crescer sem limite. A ordem por chat vale dentro do processo;
+com vários workers do gunicorn, o mesmo chat pode cair em processos
+diferentes.
+"""
+
+import os
+import queue
+import threading
+import time
+import zlib
+
+# Partições (uma thread cada) por processo
+UPDATE_SHARDS = int(os.getenv("TELEGRAM_UPDATE_SHARDS", "8"))
+# Atualizações pendentes no processo (somadas todas as partições)
+MAX_QUEUE_DEPTH = int(os.getenv("TELEGRAM_MAX_QUEUE_DEPTH", "1000"))
+
+
+def extract_message(update: dict) -> tuple[object, str] | None:
+    """(chat_id, texto) de uma atualização do Telegram; None se não há texto para processar."""
+    msg = update.get("message") or update.get("edited_message") or {}
+    chat_id = (msg.get("chat") or {}).get("id")
+    texto = msg.get("text", "")
+    if not chat_id or not texto:
+        return None
+    return chat_id, texto
+
+
+class ShardedUpdateQueue:
+    """Filas limitadas por partição de chat_id, cada uma com sua thread de processamento."""
+
+    def __init__(self, handler, shards: int = UPDATE_SHARDS, max_depth: int = MAX_QUEUE_DEPTH,
+                 name: str = "telegram-updates"):
+        self.handler = handler
+        self.shards = max(1, shards)
+        self.max_depth = max_depth
+        self.name = name
+        per_shard = max(1, -(-max_depth // self.shards))
+        self._queues = [queue.Queue(maxsize=per_shard) for _ in range(self.shards)]
+        self._lock = threading.Lock()
+        self._pid = None
+        self._enqueued = 0
+        self._processed = 0
+        self._rejected = 0
+        self._errors = 0
+        self._peak_depth = 0
+        self._wait_total = 0.0
+
+    def start(self) -> None:
+        """Inicia as threads no processo atual (seguro após o fork do gunicorn)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Processo filho: as filas herdadas do pai não têm consumidores
+                maxsize = self._queues[0].maxsize
+                self._queues = [queue.Queue(maxsize=maxsize) for _ in range(self.shards)]
+            for shard in range(self.shards):
+                threading.Thread(target=self._run, args=(shard,),
+                                 name=f"{self.name}-{shard}", daemon=True).start()
+            self._pid = os.getpid()
+
+    def shard_of(self, chat_id) -> int:
+        """Partição do chat (estável entre processos)."""
+        try:
+            return int(chat_id) % self.shards
+        except (TypeError, ValueError):
+            return zlib.crc32(str(chat_id).encode()) % self.shards
+
+    def submit(self, chat_id, *args) -> bool:
+        """Enfileira handler(chat_id, *args); False se a partição estiver cheia."""
+        self.start()
+        try:
+            self._queues[self.shard_of(chat_id)].put_nowait((time.monotonic(), chat_id, args))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._enqueued += 1
+            self._peak_depth = max(self._peak_depth, self.depth())
+        return True
+
+    def _run(self, shard: int) -> None:
+        fila = self._queues[shard]
+        while True:
+            enfileirado_em, chat_id, args = fila.get()
+            espera = time.monotonic() - enfileirado_em
+            try:
+                self.handler(chat_id, *args)
+            except Exception as e:
+                print(f"[{self.name}] Erro ao processar atualização do chat {chat_id}:", e)
+                with self._lock:
+                    self._errors += 1
+            finally:
+                fila.task_done()
+                with self._lock:
+                    self._processed += 1
+                    self._wait_total += espera
+
+    def depth(self) -> int:
+        """Atualizações aguardando processamento."""
+        return sum(fila.qsize() for fila in self._queues)
+
+    def join(self) -> None:
+        """Espera a fila esvaziar (testes e encerramento)."""
+        for fila in self._queues:
+            fila.join()
+
+    def stats(self) -> dict:
+        """Profundidade atual e por partição, pico e contadores."""
+        por_particao = [fila.qsize() for fila in self._queues]
+        with self._lock:
+            return {
+                "name": self.name,
+                "depth": sum(por_particao),
+                "max_depth": self.max_depth,
+                "peak_depth": self._peak_depth,
+                "shards": por_particao,
+                "enqueued": self._enqueued,
+                "processed": self._processed,
+                "rejected": self._rejected,
+                "errors": self._errors,
+                "avg_wait_ms": round(1000 * self._wait_total / max(1, self._processed), 2),
+            }
@@ -0,0 +1,548 @@
+"""
+Envio de mensagens ao Telegram com limite de taxa (global e por chat).
+
+A Bot API aceita cerca de 30 mensagens/s por bot e 1 mensagem/s por chat;
+acima disso responde 429 com `retry_after`. Em vez de um sendMessage solto
+por resposta, as mensagens passam por TelegramSender:
+
+    - dois baldes de fichas (token bucket): um global e um por chat;
+    - fila com prioridade (respostas diretas antes de avisos em massa) e
+      ordem preservada dentro de cada chat (uma mensagem por chat em voo);
+    - 429 pausa o balde global pelo retry_after pedido (o limite é do bot,
+      não só do chat) e reagenda a mensagem; 5xx e falhas de conexão (antes
+      de o pedido chegar ao Telegram) são repetidos com backoff até
+      MAX_SEND_ATTEMPTS. Timeout de leitura e outros erros não são repetidos:
+      a mensagem pode já ter sido entregue;
+    - mensagens seguidas de mesma prioridade ainda não enviadas ao mesmo
+      chat são juntadas em uma só (até o limite de 4096 caracteres),
+      economizando fichas. A posição do chat na fila de despacho segue a
+      prioridade da primeira mensagem pendente dele;
+    - stats() informa latência de envio e de entrega e os descartes por
+      motivo (fila cheia, mensagem velha demais, falha definitiva).
+
+Os limites valem por processo: com N workers do gunicorn, use
+TELEGRAM_GLOBAL_RATE=30/N para o total continuar dentro do limite do bot.
+
+AsyncTelegramSender aplica os mesmos baldes, pausa por 429 e regras de
+repetição no modo assíncrono (asgi_app.py), sobre um AsyncHttpTransport:
+send() é uma corrotina que espera a vez do chat e o envio, sem threads.
+"""
+
+import asyncio
+import heapq
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from http_transport import TELEGRAM_API, HttpTransport, telegram_transport
+
+# Mensagens por segundo para o bot (todas as conversas) e por chat
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", "1"))
+# Rajada máxima (fichas acumuladas) de cada balde; com 1 os envios saem espaçados
+# e nenhuma janela de 1 s passa de GLOBAL_RATE
+GLOBAL_BURST = 1
+PER_CHAT_BURST = 1
+# Threads fazendo as chamadas HTTP (o despacho respeita os limites antes delas)
+SENDER_WORKERS = int(os.getenv("TELEGRAM_SENDER_WORKERS", "4"))
+# Mensagens aguardando envio no processo; acima disso send() descarta
+MAX_PENDING = int(os.getenv("TELEGRAM_MAX_PENDING", "5000"))
+# Resposta que ficou na fila mais que isso perdeu o sentido e é descartada (segundos)
+MAX_MESSAGE_AGE = float(os.getenv("TELEGRAM_MAX_MESSAGE_AGE", "120"))
+MAX_SEND_ATTEMPTS = 3
+# Tamanho máximo do texto de uma mensagem na Bot API
+MAX_MESSAGE_LENGTH = 4096
+COALESCE_SEPARATOR = "\n\n"
+# Baldes por chat mantidos em memória (os menos usados são descartados)
+MAX_CHAT_BUCKETS = 10000
+# Amostras usadas no cálculo dos percentis de latência
+LATENCY_SAMPLES = 1000
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class TokenBucket:
+    """Balde de fichas: `rate` fichas por segundo, até `capacity` acumuladas."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, agora: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (agora - self._updated) * self.rate)
+        self._updated = agora
+
+    def wait_time(self, agora: float) -> float:
+        """Segundos até haver uma ficha (0 se já há)."""
+        if agora < self._paused_until:
+            return self._paused_until - agora
+        self._refill(agora)
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def pause(self, segundos: float, agora: float) -> None:
+        """Nenhuma ficha pelos próximos `segundos` (retry_after do servidor)."""
+        self._paused_until = max(self._paused_until, agora + segundos)
+
+    def consume(self, agora: float) -> None:
+        """Gasta uma ficha (chamar depois de wait_time() == 0)."""
+        self._refill(agora)
+        self._tokens -= 1
+
+    def full(self, agora: float) -> bool:
+        self._refill(agora)
+        return self._tokens >= self.capacity
+
+
+def _chat_bucket(baldes: OrderedDict, chat_id, rate: float) -> TokenBucket:
+    """Balde do chat (criado na primeira mensagem); descarta os menos usados já cheios."""
+    bucket = baldes.get(chat_id)
+    if bucket is None:
+        bucket = baldes[chat_id] = TokenBucket(rate, PER_CHAT_BURST)
+        agora = time.monotonic()
+        while len(baldes) > MAX_CHAT_BUCKETS:
+            antigo, balde = next(iter(baldes.items()))
+            if not balde.full(agora):
+                break
+            del baldes[antigo]
+    else:
+        baldes.move_to_end(chat_id)
+    return bucket
+
+
+class OutboundMessage:
+    """Mensagem pendente para um chat (texto pode acumular mensagens juntadas)."""
+
+    __slots__ = ("chat_id", "text", "options", "priority", "created", "attempts", "parts")
+
+    def __init__(self, chat_id, text: str, options: dict, priority: int):
+        self.chat_id = chat_id
+        self.text = text
+        self.options = options
+        self.priority = priority
+        self.created = time.monotonic()
+        self.attempts = 0
+        self.parts = 1
+
+    def can_merge(self, text: str, options: dict, priority: int) -> bool:
+        # Mesma prioridade: juntar não muda a posição já reservada na fila de despacho
+        return (self.attempts == 0 and options == self.options and priority == self.priority
+                and len(self.text) + len(COALESCE_SEPARATOR) + len(text) <= MAX_MESSAGE_LENGTH)
+
+    def merge(self, text: str) -> None:
+        self.text += COALESCE_SEPARATOR + text
+        self.parts += 1
+
+
+def _connect_failed(erro: requests.RequestException) -> bool:
+    """True se a conexão nem foi estabelecida (o pedido não chegou ao Telegram)."""
+    if isinstance(erro, requests.ConnectTimeout):
+        return True
+    if not isinstance(erro, requests.ConnectionError):
+        return False
+    motivo = getattr(erro.args[0], "reason", None) if erro.args else None
+    return isinstance(motivo, NewConnectionError)
+
+
+class TelegramSender:
+    """
+    Fila de saída do sendMessage com limites de taxa; segura entre threads.
+    Uma thread de despacho escolhe a próxima mensagem liberada pelos baldes
+    e SENDER_WORKERS threads fazem as chamadas HTTP.
+    """
+
+    def __init__(self, token: str | None, transport: HttpTransport | None = None,
+                 global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE,
+                 workers: int = SENDER_WORKERS, max_pending: int = MAX_PENDING,
+                 max_age: float = MAX_MESSAGE_AGE, name: str = "telegram-sender"):
+        self.url = f"{TELEGRAM_API}/bot{token}/sendMessage" if token else None
+        self.transport = transport
+        self.per_chat_rate = per_chat_rate
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.name = name
+        self._global = TokenBucket(global_rate, GLOBAL_BURST)
+        self._chat_buckets: OrderedDict[object, TokenBucket] = OrderedDict()
+        self._cond = threading.Condition()
+        # chat_id -> mensagens ainda não enviadas, em ordem
+        self._pending: dict[object, deque[OutboundMessage]] = {}
+        self._pending_count = 0
+        # Chats com mensagem liberada: (prioridade, seq, chat_id)
+        self._ready: list[tuple] = []
+        # Chats esperando ficha do chat ou retry_after: (liberado_em, seq, chat_id)
+        self._delayed: list[tuple] = []
+        self._scheduled: set = set()
+        self._in_flight: set = set()
+        self._seq = 0
+        self._work = None
+        self._pid = None
+        self._counters = {"submitted": 0, "sent": 0, "coalesced": 0, "rate_limited": 0,
+                          "retries": 0, "dropped_full": 0, "dropped_expired": 0,
+                          "dropped_failed": 0}
+        self._send_latency: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._delivery_latency: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def start(self) -> None:
+        """Inicia as threads no processo atual (seguro após o fork do gunicorn)."""
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Processo filho: o que estava pendente pertence ao pai
+                self._pending.clear()
+                self._pending_count = 0
+                self._ready.clear()
+                self._delayed.clear()
+                self._scheduled.clear()
+                self._in_flight.clear()
+            self._work = queue.Queue()
+            if self.transport is None:
+                self.transport = telegram_transport()
+            threading.Thread(target=self._dispatch, name=f"{self.name}-dispatch", daemon=True).start()
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True).start()
+            self._pid = os.getpid()
+
+    def send(self, chat_id, text: str, priority: int = PRIORITY_NORMAL, **options) -> bool:
+        """
+        Agenda o envio de `text` ao chat (opções extras do sendMessage, como
+        parse_mode, em `options`). Devolve False se a mensagem foi descartada.
+        """
+        if not self.url or not text:
+            return False
+        self.start()
+        with self._cond:
+            fila = self._pending.get(chat_id)
+            if fila and fila[-1].can_merge(text, options, priority):
+                fila[-1].merge(text)
+                self._counters["coalesced"] += 1
+                return True
+            if self._pending_count >= self.max_pending:
+                self._counters["dropped_full"] += 1
+                return False
+            if fila is None:
+                fila = self._pending[chat_id] = deque()
+            fila.append(OutboundMessage(chat_id, text, options, priority))
+            self._pending_count += 1
+            self._counters["submitted"] += 1
+            self._schedule(chat_id, priority)
+            self._cond.notify()
+        return True
+
+    # ---- despacho (chamado com self._cond adquirido) ----
+
+    def _schedule(self, chat_id, priority: int, not_before: float = 0.0) -> None:
+        """Coloca o chat na fila de despacho, se ele não está lá nem em voo."""
+        if chat_id in self._scheduled or chat_id in self._in_flight:
+            return
+        self._seq += 1
+        self._scheduled.add(chat_id)
+        if not_before > time.monotonic():
+            heapq.heappush(self._delayed, (not_before, self._seq, chat_id))
+        else:
+            heapq.heappush(self._ready, (priority, self._seq, chat_id))
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        return _chat_bucket(self._chat_buckets, chat_id, self.per_chat_rate)
+
+    def _drop_expired(self, chat_id, agora: float) -> None:
+        fila = self._pending[chat_id]
+        while fila and agora - fila[0].created > self.max_age:
+            fila.popleft()
+            self._pending_count -= 1
+            self._counters["dropped_expired"] += 1
+
+    def _next_message(self) -> tuple[OutboundMessage | None, float | None]:
+        """Próxima mensagem liberada pelos dois baldes, ou (None, segundos até tentar de novo)."""
+        agora = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= agora:
+            _, seq, chat_id = heapq.heappop(self._delayed)
+            fila = self._pending.get(chat_id)
+            prioridade = fila[0].priority if fila else PRIORITY_LOW
+            heapq.heappush(self._ready, (prioridade, seq, chat_id))
+        proximo_adiado = self._delayed[0][0] - agora if self._delayed else None
+        while self._ready:
+            espera_global = self._global.wait_time(agora)
+            if espera_global:
+                return None, espera_global if proximo_adiado is None else min(espera_global, proximo_adiado)
+            _, seq, chat_id = self._ready[0]
+            self._drop_expired(chat_id, agora)
+            fila = self._pending.get(chat_id)
+            if not fila:
+                heapq.heappop(self._ready)
+                self._scheduled.discard(chat_id)
+                self._pending.pop(chat_id, None)
+                continue
+            balde = self._chat_bucket(chat_id)
+            espera_chat = balde.wait_time(agora)
+            heapq.heappop(self._ready)
+            if espera_chat:
+                heapq.heappush(self._delayed, (agora + espera_chat, seq, chat_id))
+                proximo_adiado = min(espera_chat, proximo_adiado or espera_chat)
+                continue
+            balde.consume(agora)
+            self._global.consume(agora)
+            self._scheduled.discard(chat_id)
+            self._in_flight.add(chat_id)
+            mensagem = fila.popleft()
+            self._pending_count -= 1
+            return mensagem, None
+        return None, proximo_adiado
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                mensagem, espera = self._next_message()
+                if mensagem is None:
+                    self._cond.wait(espera)
+                    continue
+            self._work.put(mensagem)
+
+    # ---- envio (threads de trabalho) ----
+
+    def _run(self) -> None:
+        while True:
+            mensagem = self._work.get()
+            try:
+                self._deliver(mensagem)
+            except Exception as e:
+                print(f"[{self.name}] Erro inesperado ao enviar para o chat {mensagem.chat_id}:", e)
+                self._finish(mensagem, requeue_after=None)
+
+    def _deliver(self, mensagem: OutboundMessage) -> None:
+        mensagem.attempts += 1
+        inicio = time.perf_counter()
+        try:
+            # Sem novas tentativas no transporte: 429 e 5xx são reagendados aqui,
+            # sem prender a thread durante o retry_after
+            resp = self.transport.post(self.url, json={"chat_id": mensagem.chat_id,
+                                                       "text": mensagem.text, **mensagem.options},
+                                       retries=0)
+        except requests.RequestException as e:
+            if _connect_failed(e):
+                print(f"[{self.name}] Falha de conexão ao enviar para o chat {mensagem.chat_id}:", e)
+                self._retry_or_drop(mensagem)
+                return
+            # Timeout de leitura, conexão caída no meio...: o Telegram pode ter recebido; repetir duplicaria
+            print(f"[{self.name}] Envio incerto para o chat {mensagem.chat_id}, descartado:", e)
+            with self._cond:
+                self._counters["dropped_failed"] += 1
+            self._finish(mensagem, requeue_after=None)
+            return
+        with self._cond:
+            self._send_latency.append(time.perf_counter() - inicio)
+        if resp.ok:
+            with self._cond:
+                self._counters["sent"] += 1
+                self._delivery_latency.append(time.monotonic() - mensagem.created)
+            self._finish(mensagem, requeue_after=None)
+        elif resp.status_code == 429:
+            espera = HttpTransport._retry_after(resp) or 1.0
+            with self._cond:
+                self._counters["rate_limited"] += 1
+                # O limite é do bot: nenhum chat recebe mensagem até o retry_after passar
+                self._global.pause(espera, time.monotonic())
+            # O limite estourado não conta como tentativa: a mensagem volta para a frente da fila
+            mensagem.attempts -= 1
+            self._finish(mensagem, requeue_after=espera)
+        elif resp.status_code >= 500:
+            self._retry_or_drop(mensagem)
+        else:
+            # 400 (texto inválido), 403 (bot bloqueado pelo usuário)...: repetir não adianta
+            print(f"[{self.name}] Telegram recusou a mensagem para o chat {mensagem.chat_id}:",
+                  resp.status_code, resp.text[:200])
+            with self._cond:
+                self._counters["dropped_failed"] += 1
+            self._finish(mensagem, requeue_after=None)
+
+    def _retry_or_drop(self, mensagem: OutboundMessage) -> None:
+        if mensagem.attempts >= MAX_SEND_ATTEMPTS:
+            with self._cond:
+                self._counters["dropped_failed"] += 1
+            self._finish(mensagem, requeue_after=None)
+            return
+        with self._cond:
+            self._counters["retries"] += 1
+        self._finish(mensagem, requeue_after=random.uniform(0.5, 1.0) * 2 ** mensagem.attempts)
+
+    def _finish(self, mensagem: OutboundMessage, requeue_after: float | None) -> None:
+        """Libera o chat; com requeue_after, a mensagem volta à frente da fila do chat."""
+        chat_id = mensagem.chat_id
+        with self._cond:
+            self._in_flight.discard(chat_id)
+            fila = self._pending.get(chat_id)
+            if requeue_after is not None:
+                if fila is None:
+                    fila = self._pending[chat_id] = deque()
+                fila.appendleft(mensagem)
+                self._pending_count += 1
+            if fila:
+                not_before = time.monotonic() + requeue_after if requeue_after is not None else 0.0
+                self._schedule(chat_id, fila[0].priority, not_before)
+                self._cond.notify()
+            else:
+                self._pending.pop(chat_id, None)
+
+    # ---- métricas ----
+
+    def depth(self) -> int:
+        """Mensagens aguardando envio (sem contar as em voo)."""
+        with self._cond:
+            return self._pending_count
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Espera a fila esvaziar (testes e encerramento); False se o tempo acabou."""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            with self._cond:
+                if not self._pending_count and not self._in_flight:
+                    return True
+            time.sleep(0.02)
+        return False
+
+    @staticmethod
+    def _percentile(amostras, p: float) -> float:
+        if not amostras:
+            return 0.0
+        ordenadas = sorted(amostras)
+        return round(1000 * ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))], 2)
+
+    def stats(self) -> dict:
+        """Fila, contadores (envios, junções, 429, descartes) e latências em ms."""
+        with self._cond:
+            envio = list(self._send_latency)
+            entrega = list(self._delivery_latency)
+            return {
+                "name": self.name,
+                "pending": self._pending_count,
+                "in_flight": len(self._in_flight),
+                "chats_waiting": len(self._scheduled),
+                **self._counters,
+                "dropped": (self._counters["dropped_full"] + self._counters["dropped_expired"]
+                            + self._counters["dropped_failed"]),
+                "send_ms_avg": round(1000 * sum(envio) / len(envio), 2) if envio else 0.0,
+                "send_ms_p95": self._percentile(envio, 0.95),
+                "delivery_ms_avg": round(1000 * sum(entrega) / len(entrega), 2) if entrega else 0.0,
+                "delivery_ms_p95": self._percentile(entrega, 0.95),
+            }
+
+
+class AsyncTelegramSender:
+    """
+    sendMessage assíncrono com os limites do TelegramSender; para um único
+    event loop. send() espera as fichas dos baldes e devolve se o Telegram
+    aceitou; a ordem dentro do chat fica com quem chama (uma mensagem do
+    chat por vez, como a fila por chat do asgi_app.py).
+    """
+
+    def __init__(self, token: str | None, transport, global_rate: float = GLOBAL_RATE,
+                 per_chat_rate: float = PER_CHAT_RATE, max_age: float = MAX_MESSAGE_AGE,
+                 name: str = "telegram-sender-async"):
+        import httpx
+        self.url = f"{TELEGRAM_API}/bot{token}/sendMessage" if token else None
+        self.transport = transport
+        self.per_chat_rate = per_chat_rate
+        self.max_age = max_age
+        self.name = name
+        self._global = TokenBucket(global_rate, GLOBAL_BURST)
+        self._chat_buckets: OrderedDict[object, TokenBucket] = OrderedDict()
+        # Conexão não estabelecida: o pedido não chegou ao Telegram e pode ser repetido
+        self._connect_errors = (httpx.ConnectError, httpx.ConnectTimeout)
+        self._http_error = httpx.HTTPError
+        self._waiting = 0
+        self._counters = {"submitted": 0, "sent": 0, "rate_limited": 0, "retries": 0,
+                          "dropped_expired": 0, "dropped_failed": 0}
+        self._send_latency: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._delivery_latency: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    async def _acquire(self, chat_id) -> None:
+        """Espera e gasta uma ficha do balde global e uma do chat."""
+        balde = _chat_bucket(self._chat_buckets, chat_id, self.per_chat_rate)
+        while True:
+            agora = time.monotonic()
+            espera = max(self._global.wait_time(agora), balde.wait_time(agora))
+            if not espera:
+                balde.consume(agora)
+                self._global.consume(agora)
+                return
+            await asyncio.sleep(espera)
+
+    async def send(self, chat_id, text: str, **options) -> bool:
+        """Envia `text` ao chat (opções extras do sendMessage em `options`); True se foi entregue."""
+        if not self.url or not text:
+            return False
+        criada = time.monotonic()
+        tentativas = 0
+        self._counters["submitted"] += 1
+        self._waiting += 1
+        try:
+            while True:
+                await self._acquire(chat_id)
+                if time.monotonic() - criada > self.max_age:
+                    self._counters["dropped_expired"] += 1
+                    return False
+                tentativas += 1
+                inicio = time.perf_counter()
+                try:
+                    resp = await self.transport.post(self.url, json={"chat_id": chat_id, "text": text,
+                                                                     **options}, retries=0)
+                except self._connect_errors as e:
+                    print(f"[{self.name}] Falha de conexão ao enviar para o chat {chat_id}:", e)
+                    resp = None
+                except self._http_error as e:
+                    # Timeout de leitura, conexão caída no meio...: o Telegram pode ter recebido
+                    print(f"[{self.name}] Envio incerto para o chat {chat_id}, descartado:", e)
+                    self._counters["dropped_failed"] += 1
+                    return False
+                else:
+                    self._send_latency.append(time.perf_counter() - inicio)
+                if resp is not None and resp.is_success:
+                    self._counters["sent"] += 1
+                    self._delivery_latency.append(time.monotonic() - criada)
+                    return True
+                if resp is not None and resp.status_code == 429:
+                    # O limite é do bot: a pausa vale para todos os chats e não conta como tentativa
+                    self._counters["rate_limited"] += 1
+                    self._global.pause(HttpTransport._retry_after(resp) or 1.0, time.monotonic())
+                    tentativas -= 1
+                    continue
+                if resp is not None and resp.status_code < 500:
+                    print(f"[{self.name}] Telegram recusou a mensagem para o chat {chat_id}:",
+                          resp.status_code, resp.text[:200])
+                    self._counters["dropped_failed"] += 1
+                    return False
+                if tentativas >= MAX_SEND_ATTEMPTS:
+                    self._counters["dropped_failed"] += 1
+                    return False
+                self._counters["retries"] += 1
+                await asyncio.sleep(random.uniform(0.5, 1.0) * 2 ** tentativas)
+        finally:
+            self._waiting -= 1
+
+    def stats(self) -> dict:
+        """Envios aguardando a vez, contadores e latências em ms (como TelegramSender.stats)."""
+        envio = list(self._send_latency)
+        entrega = list(self._delivery_latency)
+        return {
+            "name": self.name,
+            "waiting": self._waiting,
+            **self._counters,
+            "dropped": self._counters["dropped_expired"] + self._counters["dropped_failed"],
+            "send_ms_avg": round(1000 * sum(envio) / len(envio), 2) if envio else 0.0,
+            "send_ms_p95": TelegramSender._percentile(envio, 0.95),
+            "delivery_ms_avg": round(1000 * sum(entrega) / len(entrega), 2) if entrega else 0.0,
+            "delivery_ms_p95": TelegramSender._percentile(entrega, 0.95),
+        }
@@ -4,10 +4,11 @@ Script para configurar o webhook do Telegram
 """
 
 import os
-import requests
 import sys
 from dotenv import load_dotenv
 
+from http_transport import MAX_RETRIES, TELEGRAM_API, telegram_transport
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -30,7 +31,7 @@ def setup_telegram_webhook():
     print(f"🌐 Webhook URL: {webhook_url}")
     
     # URL da API do Telegram
-    telegram_api_url = f"https://api.telegram.org/bot{telegram_token}/setWebhook"
+    telegram_api_url = f"{TELEGRAM_API}/bot{telegram_token}/setWebhook"
     
     # Dados do webhook
     webhook_data = {
@@ -40,7 +41,9 @@ def setup_telegram_webhook():
     
     try:
         # Configurar webhook
-        response = requests.post(telegram_api_url, json=webhook_data)
+        # setWebhook é idempotente: pode ser repetido com segurança
+        response = telegram_transport().post(telegram_api_url, json=webhook_data,
+                                             retries=MAX_RETRIES)
         
         if response.status_code == 200:
             result = response.json()
@@ -69,9 +72,9 @@ def get_bot_info():
     
     try:
         # URL da API do Telegram
-        telegram_api_url = f"https://api.telegram.org/bot{telegram_token}/getMe"
+        telegram_api_url = f"{TELEGRAM_API}/bot{telegram_token}/getMe"
         
-        response = requests.get(telegram_api_url)
+        response = telegram_transport().get(telegram_api_url)
         
         if response.status_code == 200:
             result = response.json()
@@ -105,9 +108,9 @@ def test_webhook():
     
     try:
         # URL da API do Telegram
-        telegram_api_url = f"https://api.telegram.org/bot{telegram_token}/getWebhookInfo"
+        telegram_api_url = f"{TELEGRAM_API}/bot{telegram_token}/getWebhookInfo"
         
-        response = requests.get(telegram_api_url)
+        response = telegram_transport().get(telegram_api_url)
         
         if response.status_code == 200:
             result = response.json()
@@ -0,0 +1,15 @@
+"""
+Os módulos do projeto ficam na pasta LNP (sem pacote): coloca-a no sys.path
+dos testes. DIALOGFLOW_API_URL aponta para um host local (sem OAuth), para
+que importar app.py não exija o arquivo de credenciais; os testes trocam
+o cliente HTTP antes de qualquer chamada.
+"""
+
+import os
+import sys
+
+LNP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if LNP_DIR not in sys.path:
+    sys.path.insert(0, LNP_DIR)
+
+os.environ.setdefault("DIALOGFLOW_API_URL", "http://127.0.0.1:9/v2")
@@ -0,0 +1,162 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+import app as hamburgueria
+import asgi_app
+import local_nlu
+from circuit_breaker import CircuitBreaker
+from local_nlu import ENTITIES_FILE, INTENT_FILES, load_or_train
+from menu_index import MenuIndex
+from update_dedup import UpdateDedup
+
+CARDAPIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cardapio.csv")
+
+
+def detect(intent):
+    return httpx.Response(200, json={"queryResult": {"intent": {"displayName": intent}, "parameters": {}}})
+
+
+class Servidor:
+    """
+    Dialogflow e Telegram falsos (httpx.MockTransport): detectIntent responde
+    pela intent de `por_texto` ou, senão, pela fila `detects`.
+    """
+
+    def __init__(self):
+        self.detects = []
+        self.por_texto = {}
+        self.textos_detect = []
+        self.enviadas = []
+        self.atraso = {}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith(":detectIntent"):
+            texto = httpx.Response(200, content=request.content).json()["queryInput"]["text"]["text"]
+            self.textos_detect.append(texto)
+            await asyncio.sleep(self.atraso.get(texto, 0))
+            if texto in self.por_texto:
+                return detect(self.por_texto[texto])
+            resultado = self.detects.pop(0) if self.detects else detect("BoasVindas")
+            if isinstance(resultado, Exception):
+                raise resultado
+            return resultado
+        if request.url.path.endswith("/sendMessage"):
+            corpo = httpx.Response(200, content=request.content).json()
+            self.enviadas.append((corpo["chat_id"], corpo["text"]))
+            return httpx.Response(200, json={"ok": True})
+        # PUT do @Item da sessão
+        return httpx.Response(200, json={})
+
+
+@pytest.fixture(scope="module")
+def modelo(tmp_path_factory):
+    return load_or_train(INTENT_FILES, ENTITIES_FILE, str(tmp_path_factory.mktemp("nlu") / "nlu.npz"))
+
+
+@pytest.fixture
+def servidor():
+    return Servidor()
+
+
+@pytest.fixture
+def cliente(monkeypatch, servidor, modelo):
+    monkeypatch.setattr(hamburgueria, "MENU_INDEX", MenuIndex.from_csv(CARDAPIO))
+    monkeypatch.setattr(hamburgueria, "DIALOGFLOW_BREAKER", CircuitBreaker("teste-asgi"))
+    monkeypatch.setattr(local_nlu, "_DEFAULT_MODEL", modelo)
+    monkeypatch.setattr(asgi_app, "TELEGRAM_TOKEN", "token-de-teste")
+    monkeypatch.setattr(asgi_app, "TELEGRAM_DEDUP", UpdateDedup())
+    monkeypatch.setattr(asgi_app, "UPDATE_STATS", {"pending": 0, "processed": 0, "rejected": 0, "errors": 0})
+    with TestClient(asgi_app.app) as client:
+        for transporte in (asgi_app.DIALOGFLOW, asgi_app.TELEGRAM):
+            transporte.client = httpx.AsyncClient(transport=httpx.MockTransport(servidor))
+        asgi_app.TELEGRAM_SENDER.per_chat_rate = 1000
+        yield client
+
+
+def atualizacao(update_id, chat_id, texto):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": texto}}
+
+
+def test_webhook_responde_e_envia_em_segundo_plano(cliente, servidor):
+    resp = cliente.post("/webhook", json=atualizacao(1, 101, "oi"))
+    assert resp.status_code == 200 and resp.text == "ok"
+    assert servidor.enviadas == [(101, "Olá! Bem-vindo à nossa hamburgueria! Como posso te ajudar hoje?")]
+    stats = cliente.get("/stats/queue").json()
+    assert stats["processed"] == 1 and stats["pending"] == 0 and stats["chats"] == 0
+    assert stats["sender"]["sent"] == 1
+
+
+def test_webhook_descarta_reentrega(cliente, servidor):
+    assert cliente.post("/webhook", json=atualizacao(2, 102, "oi")).text == "ok"
+    assert cliente.post("/webhook", json=atualizacao(2, 102, "oi")).text == "skip"
+    assert len(servidor.textos_detect) == 1
+    assert len(servidor.enviadas) == 1
+
+
+def test_webhook_ignora_atualizacao_sem_texto(cliente, servidor):
+    resp = cliente.post("/webhook", json={"update_id": 3, "message": {"chat": {"id": 103}, "photo": []}})
+    assert resp.text == "skip"
+    assert servidor.textos_detect == []
+
+
+@pytest.mark.parametrize("rota", ["/webhook", "/dialogflow"])
+@pytest.mark.parametrize("corpo", [b"{", b"[1, 2]", b"\xff"])
+def test_json_invalido_responde_400(cliente, rota, corpo):
+    resp = cliente.post(rota, content=corpo, headers={"Content-Type": "application/json"})
+    assert resp.status_code == 400
+
+
+def test_webhook_ocupado_responde_503_e_aceita_reentrega(cliente, servidor, monkeypatch):
+    monkeypatch.setattr(asgi_app, "MAX_QUEUE_DEPTH", 0)
+    resp = cliente.post("/webhook", json=atualizacao(4, 104, "oi"))
+    assert resp.status_code == 503
+    assert servidor.enviadas == []
+    monkeypatch.setattr(asgi_app, "MAX_QUEUE_DEPTH", 10)
+    assert cliente.post("/webhook", json=atualizacao(4, 104, "oi")).text == "ok"
+    assert len(servidor.enviadas) == 1
+    assert cliente.get("/stats/queue").json()["rejected"] == 1
+
+
+def test_mensagens_do_mesmo_chat_em_ordem(cliente, servidor):
+    # A primeira mensagem demora mais no detectIntent; sem o lock por chat, sairia por último
+    servidor.atraso = {"primeira": 0.2, "segunda": 0.05}
+    servidor.por_texto = {"primeira": "BoasVindas", "segunda": "Despedida", "terceira": "Cardapio"}
+
+    async def processar():
+        asgi_app.UPDATE_STATS["pending"] += 3
+        await asyncio.gather(*(asgi_app.process_update(105, texto)
+                               for texto in ("primeira", "segunda", "terceira")))
+
+    cliente.portal.call(processar)
+    assert [texto[:4] for _, texto in servidor.enviadas] == ["Olá!", "Obri", "Temo"]
+    assert asgi_app.UPDATE_STATS["pending"] == 0
+    assert asgi_app._CHAT_LOCKS == {}
+
+
+def test_dialogflow_com_texto(cliente, servidor):
+    servidor.detects = [detect("Cardapio")]
+    resp = cliente.post("/dialogflow", json={"text": "quero ver o cardápio"})
+    assert resp.json()["fulfillmentText"].startswith("Temos hambúrgueres artesanais")
+
+
+@pytest.mark.parametrize("falha", [
+    httpx.ConnectError("recusada"),
+    httpx.Response(503, text="<html>Service Unavailable</html>"),
+    httpx.Response(200, text="<html>proxy</html>"),
+])
+def test_fallback_local_quando_dialogflow_falha(cliente, servidor, falha):
+    servidor.detects = [falha]
+    resp = cliente.post("/dialogflow", json={"text": "tchau, obrigado pela visita"})
+    assert resp.status_code == 200
+    assert resp.json()["fulfillmentText"].startswith("Obrigado pela visita")
+    assert len(servidor.textos_detect) == 1
+
+
+def test_fallback_local_no_webhook_do_telegram(cliente, servidor):
+    servidor.detects = [httpx.ConnectError("recusada")]
+    assert cliente.post("/webhook", json=atualizacao(6, 106, "tchau, obrigado pela visita")).text == "ok"
+    assert servidor.enviadas == [(106, "Obrigado pela visita! Esperamos vê-lo em breve! 🍔")]
@@ -0,0 +1,121 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, http_failure
+
+
+class Relogio:
+    """time.monotonic controlado pelo teste."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = Relogio()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", r)
+    return r
+
+
+def falha():
+    raise ConnectionError("fora do ar")
+
+
+def test_abre_apos_falhas_seguidas(relogio):
+    breaker = CircuitBreaker("teste-abre", failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(falha)
+    assert breaker.state == CLOSED
+    with pytest.raises(ConnectionError):
+        breaker.call(falha)
+    assert breaker.state == OPEN
+    chamadas = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(chamadas.append, 1)
+    assert chamadas == []
+    assert breaker.stats()["rejected"] == 1
+    assert breaker.stats()["trips"] == 1
+
+
+def test_sucesso_zera_falhas(relogio):
+    breaker = CircuitBreaker("teste-zera", failure_threshold=2)
+    with pytest.raises(ConnectionError):
+        breaker.call(falha)
+    assert breaker.call(lambda: "ok") == "ok"
+    with pytest.raises(ConnectionError):
+        breaker.call(falha)
+    assert breaker.state == CLOSED
+
+
+def test_meio_aberto_libera_uma_chamada_de_teste(relogio):
+    breaker = CircuitBreaker("teste-probe", failure_threshold=1, reset_timeout=10)
+    with pytest.raises(ConnectionError):
+        breaker.call(falha)
+    relogio.agora += 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # Segunda chamada simultânea não é liberada enquanto o teste não termina
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_chamada_de_teste_com_falha_reabre(relogio):
+    breaker = CircuitBreaker("teste-reabre", failure_threshold=1, reset_timeout=10)
+    with pytest.raises(ConnectionError):
+        breaker.call(falha)
+    relogio.agora += 10
+    with pytest.raises(ConnectionError):
+        breaker.call(falha)
+    assert breaker.state == OPEN
+    relogio.agora += 9
+    assert breaker.state == OPEN
+    relogio.agora += 1
+    assert breaker.state == HALF_OPEN
+    assert breaker.stats()["trips"] == 2
+
+
+def test_chamada_lenta_conta_como_falha(relogio):
+    breaker = CircuitBreaker("teste-lenta", failure_threshold=2, slow_call_seconds=1.0)
+
+    def lenta():
+        relogio.agora += 1.5
+        return "tarde"
+    assert breaker.call(lenta) == "tarde"
+    assert breaker.call(lenta) == "tarde"
+    assert breaker.state == OPEN
+    assert breaker.stats()["slow_calls"] == 2
+
+
+class Resposta:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def test_is_failure_marca_respostas_sem_excecao(relogio):
+    breaker = CircuitBreaker("teste-http", failure_threshold=2)
+    assert breaker.call(Resposta, 503, is_failure=http_failure).status_code == 503
+    assert breaker.call(Resposta, 404, is_failure=http_failure).status_code == 404
+    assert breaker.state == CLOSED
+    breaker.call(Resposta, 429, is_failure=http_failure)
+    breaker.call(Resposta, 500, is_failure=http_failure)
+    assert breaker.state == OPEN
+
+
+def test_http_failure():
+    assert http_failure(Resposta(500))
+    assert http_failure(Resposta(429))
+    assert not http_failure(Resposta(200))
+    assert not http_failure(Resposta(400))
+    assert not http_failure(object())
+
+
+def test_breaker_stats_lista_disjuntores(relogio):
+    CircuitBreaker("teste-registro")
+    assert "teste-registro" in {s["name"] for s in circuit_breaker.breaker_stats()}
@@ -0,0 +1,18 @@
+from dialogflow_stub import AgentStore
+from local_nlu import ENTITIES_FILE, INTENT_FILES
+
+
+def test_seed_carrega_dados_do_projeto(capsys):
+    store = AgentStore()
+    store.seed(INTENT_FILES, ENTITIES_FILE)
+    nomes = {intent["displayName"] for intent in store.intents.values()}
+    assert {"BoasVindas", "Despedida"} <= nomes
+    assert store.entity_types
+    assert "[WARN]" not in capsys.readouterr().out
+
+
+def test_seed_sem_arquivos_avisa(tmp_path, capsys):
+    store = AgentStore()
+    store.seed([str(tmp_path / "intents.json")], str(tmp_path / "entities.json"))
+    assert not store.intents and not store.entity_types
+    assert "0 intents e 0 entidades" in capsys.readouterr().out
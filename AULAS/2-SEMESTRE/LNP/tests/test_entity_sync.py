@@ -0,0 +1,125 @@
+from urllib.parse import urlsplit
+
+import pytest
+
+import dialogflow_stub
+import entity_sync
+from dialogflow_stub import AgentStore
+from entity_sync import EntitySyncError, diff_entities, sync_item_entity
+from menu_index import MenuIndex, MenuItem
+
+
+def indice(itens: dict[str, str]):
+    return MenuIndex([
+        MenuItem.from_record({"categoria": "Burgers", "item": nome, "preco": 10, "sinonimos": sinonimos})
+        for nome, sinonimos in itens.items()
+    ])
+
+
+class Resposta:
+    """Resposta do test client do Flask com a interface usada de requests.Response."""
+
+    def __init__(self, resp):
+        self.status_code = resp.status_code
+        self.ok = resp.status_code < 400
+        self.content = resp.get_data()
+        self.text = resp.get_data(as_text=True)
+        self._json = resp.get_json(silent=True)
+
+    def json(self):
+        return self._json
+
+
+class StubHttp:
+    """Transporte que atende as chamadas com o dialogflow_stub em processo, registrando-as."""
+
+    def __init__(self, client):
+        self.client = client
+        self.chamadas = []
+
+    def _call(self, method, url, **kwargs):
+        path = urlsplit(url).path
+        self.chamadas.append((method, path.rsplit(":", 1)[-1] if ":" in path else path, kwargs.get("json")))
+        return Resposta(self.client.open(path, method=method, query_string=kwargs.get("params"),
+                                         json=kwargs.get("json")))
+
+    def get(self, url, **kwargs):
+        return self._call("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._call("POST", url, **kwargs)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = AgentStore()
+    monkeypatch.setattr(dialogflow_stub, "STORE", store)
+    monkeypatch.setattr(entity_sync, "DIALOGFLOW_API", "http://stub/v2")
+    return store
+
+
+@pytest.fixture
+def http(store):
+    return StubHttp(dialogflow_stub.app.test_client())
+
+
+def valores(store):
+    (entity_type,) = store.entity_types.values()
+    return {e["value"]: sorted(e["synonyms"]) for e in entity_type["entities"]}
+
+
+def test_diff_entities():
+    atual = {"Cheeseburger": ["Cheeseburger", "cheese"], "X-Salada": ["X-Salada"],
+             "Antigo": ["Antigo"]}
+    desejado = {"Cheeseburger": ["cheese", "Cheeseburger"], "X-Salada": ["X-Salada", "salada"],
+                "Novo": ["Novo"]}
+    novos, alterados, removidos = diff_entities(atual, desejado)
+    assert novos == [{"value": "Novo", "synonyms": ["Novo"]}]
+    # Ordem dos sinônimos não conta como alteração
+    assert alterados == [{"value": "X-Salada", "synonyms": ["X-Salada", "salada"]}]
+    assert removidos == ["Antigo"]
+    assert diff_entities(desejado, desejado) == ([], [], [])
+
+
+def test_cria_entidade_e_aplica_so_diferencas(store, http):
+    resumo = sync_item_entity(http, "fiap-boot", indice({"Cheeseburger": "cheese", "X-Salada": ""}))
+    assert (resumo["added"], resumo["changed"], resumo["removed"]) == (2, 0, 0)
+    assert valores(store) == {"Cheeseburger": ["Cheeseburger", "cheese"], "X-Salada": ["X-Salada"]}
+
+    http.chamadas.clear()
+    resumo = sync_item_entity(http, "fiap-boot", indice({"Cheeseburger": "cheese|xb", "Bacon": ""}))
+    assert (resumo["added"], resumo["changed"], resumo["removed"]) == (1, 1, 1)
+    assert valores(store) == {"Cheeseburger": ["Cheeseburger", "cheese", "xb"], "Bacon": ["Bacon"]}
+    lotes = [(alvo, corpo) for metodo, alvo, corpo in http.chamadas if metodo == "POST"]
+    assert [alvo for alvo, _ in lotes] == ["batchUpdate", "batchDelete"]
+    assert lotes[1][1]["entityValues"] == ["X-Salada"]
+
+
+def test_sem_diferencas_nao_chama_lotes(store, http):
+    menu = indice({"Cheeseburger": "cheese"})
+    sync_item_entity(http, "fiap-boot", menu)
+    http.chamadas.clear()
+    resumo = sync_item_entity(http, "fiap-boot", menu)
+    assert resumo["operations"] == []
+    assert [metodo for metodo, _, _ in http.chamadas] == ["GET"]
+
+
+def test_lotes_divididos_por_batch_size(store, http, monkeypatch):
+    monkeypatch.setattr(entity_sync, "BATCH_SIZE", 2)
+    sync_item_entity(http, "fiap-boot", indice({f"Item {i}": "" for i in range(5)}))
+    http.chamadas.clear()
+    resumo = sync_item_entity(http, "fiap-boot", indice({f"Novo {i}": "" for i in range(3)}))
+    lotes = [(alvo, corpo) for metodo, alvo, corpo in http.chamadas if metodo == "POST"]
+    assert [(alvo, len(corpo.get("entities") or corpo.get("entityValues"))) for alvo, corpo in lotes] == [
+        ("batchUpdate", 2), ("batchUpdate", 1), ("batchDelete", 2), ("batchDelete", 2), ("batchDelete", 1)]
+    assert len(resumo["operations"]) == 5
+    assert sorted(valores(store)) == ["Novo 0", "Novo 1", "Novo 2"]
+
+
+def test_erro_http_interrompe_sincronizacao(store, http, monkeypatch):
+    sync_item_entity(http, "fiap-boot", indice({"Cheeseburger": ""}))
+    monkeypatch.setattr(dialogflow_stub.FAULTS, "error_rate", 1.0)
+    with pytest.raises(EntitySyncError):
+        sync_item_entity(http, "fiap-boot", indice({"Bacon": ""}))
+    monkeypatch.setattr(dialogflow_stub.FAULTS, "error_rate", 0.0)
+    assert valores(store) == {"Cheeseburger": ["Cheeseburger"]}
@@ -0,0 +1,87 @@
+import io
+
+import pytest
+import requests
+
+import http_transport
+from http_transport import HttpTransport
+
+
+class FakeSession(requests.Session):
+    """Sessão que devolve os status da lista em ordem, sem rede."""
+
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(method)
+        status = self.statuses.pop(0)
+        if status is None:
+            raise requests.ConnectionError("sem conexão")
+        resp = requests.Response()
+        resp.status_code = status
+        resp.raw = io.BytesIO(b"{}")
+        return resp
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(http_transport.time, "sleep", lambda s: None)
+
+
+def transport(statuses, name):
+    return HttpTransport(FakeSession(statuses), name=name)
+
+
+def test_get_repete_em_5xx():
+    t = transport([503, 502, 200], "test-get")
+    assert t.get("http://x").status_code == 200
+    assert t.session.calls == ["GET"] * 3
+    assert t.stats()["retries"] == 2
+
+
+def test_post_nao_repete_por_padrao():
+    t = transport([503, 200], "test-post")
+    assert t.post("http://x").status_code == 503
+    assert t.session.calls == ["POST"]
+
+
+def test_post_nao_repete_erro_de_conexao():
+    t = transport([None, 200], "test-post-conn")
+    with pytest.raises(requests.ConnectionError):
+        t.post("http://x")
+    assert t.session.calls == ["POST"]
+
+
+def test_post_repete_com_retries_explicito():
+    t = transport([None, 503, 200], "test-post-opt-in")
+    assert t.post("http://x", retries=3).status_code == 200
+    assert t.session.calls == ["POST"] * 3
+
+
+def test_retries_zero_desliga_repeticao_do_get():
+    t = transport([503, 200], "test-get-zero")
+    assert t.get("http://x", retries=0).status_code == 503
+    assert t.session.calls == ["GET"]
+
+
+def test_desiste_apos_max_retries():
+    t = transport([503] * 10, "test-limit")
+    assert t.put("http://x").status_code == 503
+    assert len(t.session.calls) == http_transport.MAX_RETRIES + 1
+
+
+def test_nomes_repetidos_mantem_os_dois_transportes():
+    primeiro = transport([200], "test-repetido")
+    segundo = transport([200, 200], "test-repetido")
+    primeiro.get("http://x")
+    segundo.get("http://x")
+    segundo.get("http://x")
+    stats = [s for s in http_transport.pool_stats() if s["name"] == "test-repetido"]
+    assert sorted(s["requests"] for s in stats) == [1, 2]
+
+
+def test_telegram_transport_e_unico():
+    assert http_transport.telegram_transport() is http_transport.telegram_transport()
@@ -0,0 +1,110 @@
+import pytest
+
+import intent_cache
+from intent_cache import IntentCache, active_contexts, normalize_text
+
+
+class Relogio:
+    """time.monotonic controlado pelo teste."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = Relogio()
+    monkeypatch.setattr(intent_cache.time, "monotonic", r)
+    return r
+
+
+@pytest.fixture
+def cache(relogio):
+    return IntentCache({"BoasVindas", "Cardapio", "Despedida"}, ttl=60, max_entries=3)
+
+
+def test_normalize_text():
+    assert normalize_text("  Oi!!  ") == "oi"
+    assert normalize_text("Cardápio   por favor?") == "cardápio por favor"
+
+
+def test_chave_ignora_texto_vazio_ou_longo():
+    assert IntentCache.key("?!") is None
+    assert IntentCache.key("a" * (intent_cache.MAX_CACHED_TEXT + 1)) is None
+    assert IntentCache.key("Oi!", ("b", "a")) == ("oi", ("a", "b"), "")
+
+
+def test_expira_apos_ttl(cache, relogio):
+    chave = cache.key("oi")
+    assert cache.put(chave, "BoasVindas", ("BoasVindas", {}))
+    relogio.agora += 59
+    assert cache.get(chave) == ("BoasVindas", {})
+    relogio.agora += 2
+    assert cache.get(chave) is None
+    assert len(cache) == 0
+
+
+def test_descarta_o_menos_usado(cache):
+    chaves = [cache.key(t) for t in ("oi", "cardapio", "tchau")]
+    for chave in chaves:
+        cache.put(chave, "BoasVindas", chave[0])
+    # "oi" foi usado por último; "cardapio" passa a ser o mais antigo
+    assert cache.get(chaves[0]) == "oi"
+    cache.put(cache.key("ola"), "BoasVindas", "ola")
+    assert cache.get(chaves[1]) is None
+    assert cache.get(chaves[0]) == "oi"
+    assert cache.get(chaves[2]) == "tchau"
+    assert len(cache) == 3
+
+
+def test_contextos_diferentes_nao_compartilham(cache):
+    sem_contexto = cache.key("sim")
+    em_pedido = cache.key("sim", ("aguardando_pedido",))
+    cache.put(sem_contexto, "BoasVindas", "sem contexto")
+    assert cache.get(em_pedido) is None
+    assert cache.get(sem_contexto) == "sem contexto"
+
+
+def test_contexto_da_sessao(cache):
+    cache.set_session_context("s1", ["pedido", "aguardando"])
+    assert cache.session_context("s1") == ("aguardando", "pedido")
+    assert cache.session_context("s2") == ()
+    assert cache.key("sim", cache.session_context("s1")) != cache.key("sim", cache.session_context("s2"))
+    cache.set_session_context("s1", [])
+    assert cache.session_context("s1") == ()
+
+
+def test_nao_guarda_intent_dependente_de_contexto(cache):
+    assert not cache.put(cache.key("quero um x-burger"), "FazerPedido", "x")
+    assert not cache.put(cache.key("oi"), "BoasVindas", "x", output_contexts=("pedido",))
+    assert not cache.put(None, "BoasVindas", "x")
+    assert len(cache) == 0
+
+
+def test_active_contexts_rest_e_grpc():
+    class Ctx:
+        def __init__(self, name, lifespan_count):
+            self.name, self.lifespan_count = name, lifespan_count
+
+    rest = [{"name": "projects/p/agent/sessions/s/contexts/pedido", "lifespanCount": 2},
+            {"name": "projects/p/agent/sessions/s/contexts/__system_counters__", "lifespanCount": 1},
+            {"name": "projects/p/agent/sessions/s/contexts/fim", "lifespanCount": 0}]
+    assert active_contexts(rest) == ("pedido",)
+    assert active_contexts([Ctx("x/b", 1), Ctx("x/a", 5)]) == ("a", "b")
+    assert active_contexts(None) == ()
+
+
+def test_estatisticas(cache, relogio):
+    chave = cache.key("oi")
+    cache.get(chave)
+    cache.put(chave, "BoasVindas", "oi")
+    cache.get(chave)
+    cache.get(chave)
+    cache.put(cache.key("dois x-salada"), "FazerPedido", "x")
+    assert cache.stats() == {"entries": 1, "hits": 2, "misses": 1, "not_cacheable": 1,
+                             "hit_rate": round(2 / 3, 4)}
+    cache.clear()
+    assert cache.stats()["entries"] == 0
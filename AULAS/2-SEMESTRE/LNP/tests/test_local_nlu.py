@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+import local_nlu
+from local_nlu import CONFIDENCE_THRESHOLD, LocalNLU, char_ngrams, expand_placeholders, load_or_train
+
+TEXTOS = [
+    "oi", "olá", "bom dia", "boa noite", "e aí",
+    "qual o cardápio", "mostra o cardápio", "quero ver o menu", "o que vocês têm",
+    "quero um hambúrguer", "quero pedir uma pizza", "me vê uma coca", "vou querer batata frita",
+    "tchau", "até mais", "obrigado, tchau",
+]
+ROTULOS = (["BoasVindas"] * 5 + ["Cardapio"] * 4 + ["FazerPedido"] * 4 + ["Despedida"] * 3)
+RESPOSTAS = {"BoasVindas": "Olá!", "Cardapio": "Temos lanches.", "FazerPedido": "",
+             "Despedida": "Até logo!"}
+
+
+@pytest.fixture(scope="module")
+def modelo():
+    return LocalNLU.train(TEXTOS, ROTULOS, RESPOSTAS, source_hash="abc")
+
+
+def test_char_ngrams_ignora_acentos_e_pontuacao():
+    assert char_ngrams("Olá!") == char_ngrams("ola")
+    assert char_ngrams("!!!") == []
+
+
+def test_expand_placeholders_usa_sinonimos():
+    variacoes = expand_placeholders("quero @Item:item", {"Item": ["coca", "suco"]})
+    assert set(variacoes) == {"quero coca", "quero suco"}
+    assert expand_placeholders("sem placeholder", {}) == ["sem placeholder"]
+
+
+def test_predict_frases_de_treino(modelo):
+    for texto, rotulo in zip(TEXTOS, ROTULOS):
+        assert modelo.predict(texto)[0] == rotulo
+
+
+def test_predict_variacao_com_confianca_alta(modelo):
+    intent, confianca = modelo.predict("bom dia!")
+    assert intent == "BoasVindas"
+    assert confianca >= CONFIDENCE_THRESHOLD
+
+
+def test_texto_fora_do_dominio_nao_e_classificado(modelo):
+    assert modelo.predict("xyzw kkkk qqq") == (None, 0.0)
+    assert modelo.predict("") == (None, 0.0)
+
+
+def test_predict_proba_soma_um(modelo):
+    probabilidades = modelo.predict_proba("quero um hambúrguer")
+    assert set(probabilidades) == set(ROTULOS)
+    assert sum(probabilidades.values()) == pytest.approx(1.0, abs=1e-5)
+    assert max(probabilidades, key=probabilidades.get) == "FazerPedido"
+
+
+def test_save_load(modelo, tmp_path):
+    path = tmp_path / "nlu.npz"
+    modelo.save(str(path))
+    carregado = LocalNLU.load(str(path))
+    assert carregado.labels == modelo.labels
+    assert carregado.responses == RESPOSTAS
+    assert carregado.source_hash == "abc"
+    for texto in TEXTOS:
+        assert carregado.predict(texto) == pytest.approx(modelo.predict(texto))
+    assert os.listdir(tmp_path) == ["nlu.npz"]
+
+
+def test_load_or_train_reusa_artefato(tmp_path, monkeypatch):
+    intents = tmp_path / "intents.json"
+    intents.write_text(
+        '[{"displayName": "BoasVindas", "trainingPhrases": ["oi", "olá"], "response": "Oi!"},'
+        ' {"displayName": "Despedida", "trainingPhrases": ["tchau", "até mais"], "response": ""}]',
+        encoding="utf-8",
+    )
+    artefato = str(tmp_path / "nlu.npz")
+    primeiro = load_or_train([str(intents)], None, artefato)
+    assert primeiro.responses == {"BoasVindas": "Oi!", "Despedida": ""}
+
+    def sem_treino(*args, **kwargs):
+        raise AssertionError("não deveria treinar de novo")
+    monkeypatch.setattr(LocalNLU, "train", sem_treino)
+    assert load_or_train([str(intents)], None, artefato).source_hash == primeiro.source_hash
+
+
+def test_load_or_train_sem_arquivos(tmp_path):
+    assert load_or_train([str(tmp_path / "nao_existe.json")], None, str(tmp_path / "x.npz")) is None
+
+
+def test_modelo_do_projeto_respeita_limiar(tmp_path):
+    if not all(os.path.exists(f) for f in local_nlu.INTENT_FILES + [local_nlu.ENTITIES_FILE]):
+        pytest.skip("arquivos de treino do projeto ausentes")
+    nlu = load_or_train(local_nlu.INTENT_FILES, local_nlu.ENTITIES_FILE, str(tmp_path / "nlu.npz"))
+    intent, confianca = nlu.predict("tchau, obrigado pela visita")
+    assert intent == "Despedida"
+    assert confianca >= CONFIDENCE_THRESHOLD
+    # Fora do domínio: nunca passa do limiar (a mensagem vai ao Dialogflow)
+    assert nlu.predict("qwrtp zxcv")[1] < CONFIDENCE_THRESHOLD
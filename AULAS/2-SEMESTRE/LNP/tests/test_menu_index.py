@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+import menu_index
+from menu_index import FuzzyIndex, MenuIndex, trigramas
+
+CARDAPIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cardapio.csv")
+
+
+@pytest.fixture(scope="module")
+def menu():
+    return MenuIndex.from_csv(CARDAPIO)
+
+
+# Erros de digitação vistos nas conversas -> item esperado
+TYPOS = {
+    "chesburguer": "Cheeseburger",
+    "cheesburger": "Cheeseburger",
+    "chesseburger": "Cheeseburger",
+    "xsalda": "X-Salada",
+    "bacom burger": "Bacon Burger",
+    "bacon burguer": "Bacon Burger",
+    "duplo burguer": "Duplo Burger",
+    "vegetarian": "Vegetariano",
+    "frango crispi": "Frango Crispy",
+    "chedar melt": "Cheddar Melt",
+    "onio rings": "Onion Rings",
+    "nugets": "Nuggets 8un",
+    "cocacola": "Coca-Cola Lata",
+    "guarna": "Guaraná Lata",
+    "suco laranj": "Suco Laranja",
+    "brownei": "Brownie",
+    "sorvet": "Sorvete",
+    "molho extr": "Molho Extra",
+}
+
+
+@pytest.mark.parametrize("texto,esperado", sorted(TYPOS.items()))
+def test_resolve_erros_de_digitacao(menu, texto, esperado):
+    row = menu.resolve(texto)
+    assert row is not None and row.item == esperado
+
+
+def test_resolve_nome_exato_e_sinonimo(menu):
+    assert menu.resolve("cheeseburger").item == "Cheeseburger"
+    assert menu.resolve("Coca-Cola Lata").item == "Coca-Cola Lata"
+    assert menu.resolve("batata").item == "Batata Frita P"
+
+
+@pytest.mark.parametrize("texto", ["batata frit", "batata frita"])
+def test_variantes_de_tamanho_ficam_ambiguas(menu, texto):
+    # P e G são igualmente parecidos: o bot pergunta em vez de escolher
+    assert menu.resolve(texto) is None
+    assert {row.item for row in menu.search(texto)[:2]} == {"Batata Frita P", "Batata Frita G"}
+
+
+@pytest.mark.parametrize("texto", ["hamburguer", "pizza", "lanche", "refri", ""])
+def test_termos_genericos_nao_resolvem(menu, texto):
+    assert menu.resolve(texto) is None
+
+
+# Parecidos com um item, mas outro produto ou variante: o bot deve perguntar, não escolher
+NEAR_MISSES = ["suco uva", "suco limao", "suco manga", "coca zero", "guarana zero",
+               "frango frito", "brownie de nozes", "sorvete casquinha", "duplo bacon"]
+
+
+@pytest.mark.parametrize("texto", NEAR_MISSES)
+def test_quase_iguais_nao_resolvem(menu, texto):
+    assert menu.resolve(texto) is None
+
+
+def test_cache_usa_texto_normalizado(menu, monkeypatch):
+    fuzzy = FuzzyIndex(menu.items)
+    primeiro = fuzzy.search("X-Búrguer")
+    assert fuzzy.search("x burguer") is primeiro
+    assert len(fuzzy._cache) == 1
+    monkeypatch.setattr(menu_index, "FUZZY_CACHE_MAX", 3)
+    for texto in ["cheese", "bacon", "coca", "suco"]:
+        fuzzy.search(texto)
+    assert len(fuzzy._cache) == 3
+    assert ("x burguer", 5, menu_index.FUZZY_MIN_SCORE, False) not in fuzzy._cache
+
+
+def test_search_ordena_por_similaridade(menu):
+    itens = menu.search("chesburguer")
+    assert itens[0].item == "Cheeseburger"
+
+
+def test_trigramas_ignoram_acentos_e_pontuacao():
+    assert trigramas("Coca-Cola") == trigramas("coca cola")
+    assert trigramas("Porção") == trigramas("porcao")
+
+
+def test_matcher_encontra_itens_e_sinonimos_no_texto(menu):
+    achados = menu.matcher.find("quero um x-burguer e uma coca cola gelada")
+    assert [row.item for row in achados] == ["Cheeseburger", "Coca-Cola Lata"]
+    # Ocorrência mais longa vence ("batata grande" e não "batata")
+    assert [row.item for row in menu.matcher.find("batata grande")] == ["Batata Frita G"]
+
+
+def test_fuzzy_index_sem_termos():
+    assert FuzzyIndex([]).search("qualquer") == []
+    assert FuzzyIndex([]).resolve("qualquer") is None
+
+
+def test_indices_por_categoria_e_vegetarianos(menu):
+    assert [row.item for row in menu.get_category("BEBIDAS")][:2] == ["Coca-Cola Lata", "Guaraná Lata"]
+    assert all(row.vegetariano for row in menu.vegetarian)
+    assert menu.get_item("x-salada").item == "X-Salada"
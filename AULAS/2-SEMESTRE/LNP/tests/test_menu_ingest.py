@@ -0,0 +1,57 @@
+import io
+import os
+import threading
+
+import pytest
+
+from menu_index import MenuIndex
+from menu_ingest import MenuIngestError, ingest
+
+CSV = (
+    "categoria,item,descricao,preco,vegetariano,sinonimos\n"
+    "Burgers,Cheeseburger,Queijo,\"18,90\",nao,xb\n"
+    "Burgers,,Sem nome,10,nao,\n"
+    "Bebidas,Suco,Laranja,abc,sim,\n"
+    "Bebidas,Agua,,4.5,,\n"
+)
+
+
+def test_ingest_normaliza_e_rejeita_linhas(tmp_path):
+    cache = tmp_path / "cache.csv"
+    result = ingest(io.BytesIO(CSV.encode()), "cardapio.csv", str(cache), chunk_size=2)
+    assert [row.item for row in result.index.items] == ["Cheeseburger", "Agua"]
+    assert result.index.get_item("cheeseburger").preco_centavos == 1890
+    assert [line for line, _ in result.bad_rows] == [3, 4]
+    # O cache gravado é lido de volta com o mesmo conteúdo
+    assert MenuIndex.from_csv(str(cache)).version == result.index.version
+    assert os.listdir(tmp_path) == ["cache.csv"]
+
+
+def test_colunas_ausentes_preservam_cache_anterior(tmp_path):
+    cache = tmp_path / "cache.csv"
+    cache.write_text("anterior")
+    with pytest.raises(MenuIngestError):
+        ingest(io.BytesIO(b"item,preco\nX,1\n"), "cardapio.csv", str(cache))
+    with pytest.raises(MenuIngestError):
+        ingest(io.BytesIO(b"categoria,item,descricao,preco\nA,,d,x\n"), "cardapio.csv", str(cache))
+    assert cache.read_text() == "anterior"
+    assert os.listdir(tmp_path) == ["cache.csv"]
+
+
+def test_uploads_simultaneos_no_mesmo_processo(tmp_path):
+    cache = str(tmp_path / "cache.csv")
+    erros = []
+
+    def upload():
+        try:
+            ingest(io.BytesIO(CSV.encode()), "cardapio.csv", cache, chunk_size=1)
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=upload) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert erros == []
+    assert len(MenuIndex.from_csv(cache)) == 2
@@ -0,0 +1,95 @@
+import os
+import struct
+
+import pytest
+
+import menu_snapshot
+from menu_index import MenuIndex
+from menu_snapshot import MenuWatcher, SnapshotError, load_menu, load_snapshot, write_snapshot
+
+CARDAPIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cardapio.csv")
+
+
+@pytest.fixture(scope="module")
+def menu():
+    return MenuIndex.from_csv(CARDAPIO)
+
+
+def test_round_trip(menu, tmp_path):
+    path = str(tmp_path / "menu.snap")
+    write_snapshot(menu, path)
+    carregado = load_snapshot(path)
+    assert carregado.version == menu.version
+    assert [row.item for row in carregado.items] == [row.item for row in menu.items]
+    assert carregado.get_item("x-salada").preco_centavos == menu.get_item("x-salada").preco_centavos
+    assert [row.item for row in carregado.get_category("bebidas")] == \
+        [row.item for row in menu.get_category("bebidas")]
+    # Seções tardias: só desserializadas no primeiro uso, com as mesmas referências de itens
+    assert carregado._matcher is None and carregado._fuzzy is None
+    assert carregado.resolve("chesburguer") is carregado.get_item("cheeseburger")
+    assert carregado.matcher.find("uma coca")[0] is carregado.get_item("coca-cola lata")
+    assert os.listdir(tmp_path) == ["menu.snap"]
+
+
+def _corromper(path, posicao):
+    with open(path, "r+b") as f:
+        f.seek(posicao)
+        byte = f.read(1)
+        f.seek(posicao)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+
+def test_secao_corrompida_nao_chega_ao_pickle(menu, tmp_path, monkeypatch):
+    path = str(tmp_path / "menu.snap")
+    write_snapshot(menu, path)
+    _corromper(path, os.path.getsize(path) - 10)  # dentro da última seção (fuzzy)
+    carregado = load_snapshot(path)
+    with pytest.raises(SnapshotError):
+        carregado.fuzzy
+
+    write_snapshot(menu, path)
+    inicio_core = menu_snapshot._HEADER.size + 3 * menu_snapshot._SECTION.size
+    _corromper(path, inicio_core + 5)
+    monkeypatch.setattr(menu_snapshot.pickle, "loads", lambda *_: pytest.fail("pickle.loads chamado"))
+    with pytest.raises(SnapshotError):
+        load_snapshot(path)
+
+
+def test_formato_incompativel_e_truncado(menu, tmp_path):
+    path = str(tmp_path / "menu.snap")
+    write_snapshot(menu, path)
+    with open(path, "r+b") as f:
+        f.seek(8)
+        f.write(struct.pack("<H", menu_snapshot.FORMAT_VERSION + 1))
+    with pytest.raises(SnapshotError):
+        load_snapshot(path)
+
+    write_snapshot(menu, path)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 100)
+    with pytest.raises(SnapshotError):
+        load_snapshot(path)
+
+
+def test_load_menu_recai_no_csv(menu, tmp_path):
+    csv_path = str(tmp_path / "cache.csv")
+    snap = str(tmp_path / "cache.snap")
+    with open(CARDAPIO, encoding="utf-8") as origem, open(csv_path, "w", encoding="utf-8") as destino:
+        destino.write(origem.read())
+    assert load_menu(csv_path, snap).version == menu.version
+    assert os.path.exists(snap)
+    with open(snap, "wb") as f:
+        f.write(b"lixo")
+    os.utime(csv_path, (0, 0))
+    assert load_menu(csv_path, snap).version == menu.version
+
+
+def test_watcher_troca_o_indice(menu, tmp_path):
+    path = str(tmp_path / "menu.snap")
+    atual = {"index": None}
+    watcher = MenuWatcher(lambda: atual["index"], lambda idx: atual.update(index=idx), path)
+    assert watcher.poll() is False
+    write_snapshot(menu, path)
+    assert watcher.poll() is True
+    assert atual["index"].version == menu.version
+    assert watcher.poll() is False
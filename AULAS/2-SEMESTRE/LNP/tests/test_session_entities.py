@@ -0,0 +1,223 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import session_entities
+from menu_index import MenuIndex, MenuItem
+from session_entities import (FRESH, MISSING, STALE, AsyncEntityPusher, EntityPusher,
+                              SessionEntityTracker, entity_payload, push_item_entities)
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = Relogio()
+    monkeypatch.setattr(session_entities.time, "monotonic", r)
+    return r
+
+
+def indice(*nomes):
+    return MenuIndex([MenuItem.from_record({"categoria": "Burgers", "item": nome, "preco": 10})
+                      for nome in nomes])
+
+
+class FakeHttp:
+    """Registra os PUTs; `falhar` faz a próxima chamada responder 503."""
+
+    def __init__(self):
+        self.chamadas = []
+        self.falhar = False
+
+    def put(self, url, data, headers):
+        self.chamadas.append((url, json.loads(data)))
+        status, self.falhar = (503 if self.falhar else 200), False
+        return Resposta(status)
+
+
+class Resposta:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+def test_estados_do_tracker(relogio):
+    tracker = SessionEntityTracker(ttl=100, margin=10)
+    assert tracker.status("s", "v1") == MISSING
+    tracker.mark_pushed("s", "v1")
+    assert tracker.status("s", "v1") == FRESH
+    # Outra versão do cardápio: ainda válido, reenviar sem bloquear
+    assert tracker.status("s", "v2") == STALE
+    relogio.agora += 90
+    assert tracker.status("s", "v1") == STALE
+    relogio.agora += 10
+    assert tracker.status("s", "v1") == MISSING
+    assert tracker.needs_push("s", "v1")
+
+
+def test_tracker_descarta_sessao_menos_recente(relogio):
+    tracker = SessionEntityTracker(max_sessions=2)
+    tracker.mark_pushed("a", "v1")
+    tracker.mark_pushed("b", "v1")
+    # Consultar "a" a torna a mais recente: "b" sai quando "c" entra
+    assert tracker.status("a", "v1") == FRESH
+    tracker.mark_pushed("c", "v1")
+    assert tracker.sessions() == ["a", "c"]
+    assert tracker.status("b", "v1") == MISSING
+    tracker.forget("a")
+    assert len(tracker) == 1
+
+
+def test_push_pula_sessao_em_dia(relogio):
+    http = FakeHttp()
+    tracker = SessionEntityTracker()
+    menu = indice("Cheeseburger", "X-Salada")
+    assert push_item_entities(http, "proj", "s1", menu, tracker)
+    assert not push_item_entities(http, "proj", "s1", menu, tracker)
+    assert len(http.chamadas) == 1
+    url, corpo = http.chamadas[0]
+    assert url.endswith("/projects/proj/agent/sessions/s1/entityTypes/Item")
+    assert [e["value"] for e in corpo["entities"]] == ["Cheeseburger", "X-Salada"]
+    # Cardápio novo: a mesma sessão recebe a nova versão
+    novo = indice("Cheeseburger")
+    assert push_item_entities(http, "proj", "s1", novo, tracker)
+    assert len(http.chamadas) == 2
+
+
+def test_push_com_falha_nao_marca_sessao(relogio):
+    http = FakeHttp()
+    http.falhar = True
+    tracker = SessionEntityTracker()
+    menu = indice("Cheeseburger")
+    with pytest.raises(RuntimeError):
+        push_item_entities(http, "proj", "s1", menu, tracker)
+    assert tracker.status("s1", menu.version) == MISSING
+    assert push_item_entities(http, "proj", "s1", menu, tracker)
+
+
+def test_payload_reaproveitado_por_versao():
+    menu = indice("Cheeseburger")
+    assert entity_payload(menu) is entity_payload(menu)
+
+
+class PushLento:
+    """Função de envio que espera `liberar` e registra as sessões enviadas."""
+
+    def __init__(self, tracker, version="v1"):
+        self.tracker = tracker
+        self.version = version
+        self.chamadas = []
+        self.liberar = threading.Event()
+
+    def __call__(self, session_id):
+        self.chamadas.append(session_id)
+        self.liberar.wait(5)
+        self.tracker.mark_pushed(session_id, self.version)
+
+
+def test_pusher_um_envio_pendente_por_sessao():
+    tracker = SessionEntityTracker()
+    push = PushLento(tracker)
+    pusher = EntityPusher(push, tracker)
+    futures = [pusher.submit("s1") for _ in range(5)]
+    assert all(f is futures[0] for f in futures)
+    push.liberar.set()
+    futures[0].result(5)
+    assert push.chamadas == ["s1"]
+    # Concluído o envio, um novo pedido agenda outro
+    pusher.submit("s1").result(5)
+    assert push.chamadas == ["s1", "s1"]
+
+
+def test_pusher_ensure_so_espera_sem_entidades():
+    tracker = SessionEntityTracker()
+    push = PushLento(tracker)
+    pusher = EntityPusher(push, tracker, first_turn_timeout=0.2)
+    push.liberar.set()
+    # MISSING: espera o envio
+    pusher.ensure("s1", "v1")
+    assert tracker.status("s1", "v1") == FRESH
+    # FRESH: nada a fazer
+    pusher.ensure("s1", "v1")
+    assert push.chamadas == ["s1"]
+    # STALE (cardápio novo): agenda sem esperar
+    push.liberar.clear()
+    push.version = "v2"
+    inicio = time.monotonic()
+    pusher.ensure("s1", "v2")
+    assert time.monotonic() - inicio < 0.1
+    push.liberar.set()
+    pusher.submit("s1").result(5)
+    assert tracker.status("s1", "v2") == FRESH
+
+
+def test_pusher_falha_nao_bloqueia_proximo_envio():
+    tracker = SessionEntityTracker()
+    chamadas = []
+
+    def push(session_id):
+        chamadas.append(session_id)
+        if len(chamadas) == 1:
+            raise RuntimeError("503")
+    pusher = EntityPusher(push, tracker)
+    pusher.submit("s1").result(5)
+    pusher.submit("s1").result(5)
+    assert chamadas == ["s1", "s1"]
+
+
+def test_refresh_all_reagenda_sessoes_desatualizadas():
+    tracker = SessionEntityTracker()
+    tracker.mark_pushed("a", "v1")
+    tracker.mark_pushed("b", "v2")
+    push = PushLento(tracker, version="v2")
+    push.liberar.set()
+    pusher = EntityPusher(push, tracker)
+    assert pusher.refresh_all("v2") == 1
+    pusher.submit("a").result(5)
+    assert push.chamadas == ["a"]
+
+
+def test_async_pusher_um_envio_pendente_por_sessao():
+    tracker = SessionEntityTracker()
+    chamadas = []
+
+    async def push(session_id):
+        chamadas.append(session_id)
+        await asyncio.sleep(0.05)
+        tracker.mark_pushed(session_id, "v1")
+
+    async def cenario():
+        pusher = AsyncEntityPusher(push, tracker, first_turn_timeout=1)
+        await asyncio.gather(*(pusher.ensure("s1", "v1") for _ in range(5)))
+        assert tracker.status("s1", "v1") == FRESH
+        await pusher.ensure("s1", "v1")
+    asyncio.run(cenario())
+    assert chamadas == ["s1"]
+
+
+def test_async_pusher_timeout_nao_cancela_envio():
+    tracker = SessionEntityTracker()
+
+    async def push(session_id):
+        await asyncio.sleep(0.2)
+        tracker.mark_pushed(session_id, "v1")
+
+    async def cenario():
+        pusher = AsyncEntityPusher(push, tracker, first_turn_timeout=0.01)
+        await pusher.ensure("s1", "v1")
+        assert tracker.status("s1", "v1") == MISSING
+        await asyncio.sleep(0.3)
+        assert tracker.status("s1", "v1") == FRESH
+    asyncio.run(cenario())
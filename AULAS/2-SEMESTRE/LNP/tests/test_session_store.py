@@ -0,0 +1,146 @@
+import multiprocessing
+import threading
+
+import pytest
+
+import session_store
+from session_store import MemorySessionStore, SessionStore, SQLiteSessionStore, open_session_store
+
+
+class Relogio:
+    def __init__(self, inicio):
+        self.agora = inicio
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = Relogio(1000.0)
+    monkeypatch.setattr(session_store.time, "monotonic", r)
+    monkeypatch.setattr(session_store.time, "time", r)
+    return r
+
+
+def adiciona(store, session_id, item):
+    with store.session(session_id) as sessao:
+        sessao["cart"].append(item)
+        sessao["last_action"] = "adicionou"
+
+
+def test_interface_e_abstrata():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, relogio):
+    if request.param == "memory":
+        return MemorySessionStore(ttl=60, max_sessions=100, stripes=4)
+    return SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=60, max_sessions=100)
+
+
+def test_grava_e_le(store):
+    adiciona(store, "a", "X-Burger")
+    adiciona(store, "a", "Coca")
+    assert store.get("a") == {"cart": ["X-Burger", "Coca"], "last_action": "adicionou"}
+    assert store.get("b") == {"cart": [], "last_action": None}
+    assert len(store) == 1
+
+
+def test_excecao_no_bloco_nao_grava(store):
+    adiciona(store, "a", "X-Burger")
+    with pytest.raises(RuntimeError):
+        with store.session("a") as sessao:
+            sessao["cart"].clear()
+            raise RuntimeError("falhou no meio")
+    assert store.get("a")["cart"] == ["X-Burger"]
+
+
+def test_sessao_expira_pelo_ttl(store, relogio):
+    adiciona(store, "a", "X-Burger")
+    relogio.agora += 59
+    assert store.get("a")["cart"] == ["X-Burger"]
+    relogio.agora += 61
+    assert store.get("a") == {"cart": [], "last_action": None}
+
+
+def test_delete(store):
+    adiciona(store, "a", "X-Burger")
+    store.delete("a")
+    store.delete("inexistente")
+    assert store.get("a")["cart"] == []
+
+
+def test_memoria_descarta_menos_recente(relogio):
+    store = MemorySessionStore(ttl=60, max_sessions=2, stripes=1)
+    adiciona(store, "a", 1)
+    adiciona(store, "b", 2)
+    adiciona(store, "a", 3)
+    adiciona(store, "c", 4)
+    assert len(store) == 2
+    assert store.get("b")["cart"] == []
+    assert store.get("a")["cart"] == [1, 3]
+    assert store.stats()["evicted"] == 1
+
+
+def test_memoria_descarta_expiradas_ao_gravar(relogio):
+    store = MemorySessionStore(ttl=60, max_sessions=10, stripes=1)
+    adiciona(store, "a", 1)
+    relogio.agora += 61
+    adiciona(store, "b", 2)
+    assert len(store) == 1
+    assert store.stats()["expired"] == 1
+
+
+def test_sqlite_purge_remove_expiradas_e_excedentes(tmp_path, relogio):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=60, max_sessions=2)
+    for i, session_id in enumerate(["a", "b", "c", "d"]):
+        relogio.agora += 1
+        adiciona(store, session_id, i)
+    relogio.agora += 57.5
+    # "a" expirou; das demais ficam as 2 mais recentes
+    assert store.purge() == 2
+    assert store.get("c")["cart"] == [2]
+    assert store.get("d")["cart"] == [3]
+    assert store.get("b")["cart"] == []
+
+
+def test_memoria_threads_no_mesmo_carrinho():
+    store = MemorySessionStore(stripes=2)
+    threads = [threading.Thread(target=lambda: [adiciona(store, "a", 1) for _ in range(200)])
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(store.get("a")["cart"]) == 1600
+
+
+def _escritor(store, vezes):
+    for _ in range(vezes):
+        adiciona(store, "compartilhada", 1)
+
+
+def test_sqlite_escritores_concorrentes(tmp_path):
+    """Vários processos (como workers do gunicorn) alterando o mesmo carrinho."""
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    # Conexão aberta antes do fork: os filhos herdam o objeto e precisam abrir a própria
+    adiciona(store, "outra", 0)
+    ctx = multiprocessing.get_context("fork")
+    processos = [ctx.Process(target=_escritor, args=(store, 50)) for _ in range(4)]
+    for p in processos:
+        p.start()
+    for p in processos:
+        p.join(30)
+        assert p.exitcode == 0
+    # Sem perda de atualização: cada bloco leu o carrinho gravado pelo anterior
+    assert len(store.get("compartilhada")["cart"]) == 200
+
+
+def test_open_session_store(tmp_path):
+    assert open_session_store("memory").backend == "memory"
+    assert open_session_store(f"sqlite:///{tmp_path / 's.db'}").backend == "sqlite"
+    with pytest.raises(ValueError):
+        open_session_store("redis://localhost")
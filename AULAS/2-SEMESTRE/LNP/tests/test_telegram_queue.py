@@ -0,0 +1,84 @@
+import threading
+import time
+
+from telegram_queue import ShardedUpdateQueue, extract_message
+
+
+def mensagem(chat_id=42, texto="oi", chave="message"):
+    return {"update_id": 1, chave: {"chat": {"id": chat_id}, "text": texto}}
+
+
+def test_extract_message():
+    assert extract_message(mensagem()) == (42, "oi")
+    assert extract_message(mensagem(texto="corrigido", chave="edited_message")) == (42, "corrigido")
+    # Foto, figurinha etc.: sem texto
+    assert extract_message({"message": {"chat": {"id": 42}, "photo": [{"file_id": "x"}]}}) is None
+    assert extract_message({"message": {"text": "sem chat"}}) is None
+    assert extract_message({"callback_query": {"data": "x"}}) is None
+    assert extract_message({}) is None
+
+
+def test_ordem_por_chat_entre_particoes():
+    recebidas: dict[int, list[int]] = {}
+    lock = threading.Lock()
+
+    def handler(chat_id, n):
+        time.sleep(0.001 * (n % 3))
+        with lock:
+            recebidas.setdefault(chat_id, []).append(n)
+
+    fila = ShardedUpdateQueue(handler, shards=4, max_depth=1000, name="teste-ordem")
+    for n in range(30):
+        for chat_id in range(8):
+            assert fila.submit(chat_id, n)
+    fila.join()
+    assert set(recebidas) == set(range(8))
+    for chat_id, ordem in recebidas.items():
+        assert ordem == list(range(30)), chat_id
+    assert {fila.shard_of(c) for c in range(8)} == set(range(4))
+    assert fila.stats()["processed"] == 240
+
+
+def test_shard_de_chat_nao_numerico():
+    fila = ShardedUpdateQueue(lambda *a: None, shards=4, name="teste-shard")
+    assert fila.shard_of("@canal") == fila.shard_of("@canal")
+    assert 0 <= fila.shard_of("@canal") < 4
+
+
+def test_submit_falso_com_particao_cheia():
+    comecou, libera = threading.Event(), threading.Event()
+
+    def handler(chat_id):
+        comecou.set()
+        libera.wait(5)
+
+    # 2 partições, 1 vaga em cada; os chats 0, 2 e 4 caem na mesma partição
+    fila = ShardedUpdateQueue(handler, shards=2, max_depth=2, name="teste-cheia")
+    assert fila.submit(0)
+    assert comecou.wait(5)          # a thread já tirou o chat 0 da fila
+    assert fila.submit(2)
+    assert not fila.submit(4)
+    assert fila.submit(1)           # a outra partição segue aceitando
+    libera.set()
+    fila.join()
+    stats = fila.stats()
+    assert stats["rejected"] == 1
+    assert stats["enqueued"] == stats["processed"] == 3
+
+
+def test_erro_no_handler_nao_para_a_particao(capsys):
+    processadas = []
+
+    def handler(chat_id, texto):
+        if texto == "falha":
+            raise RuntimeError("quebrou")
+        processadas.append(texto)
+
+    fila = ShardedUpdateQueue(handler, shards=1, name="teste-erro")
+    for texto in ("antes", "falha", "depois"):
+        assert fila.submit(7, texto)
+    fila.join()
+    assert processadas == ["antes", "depois"]
+    stats = fila.stats()
+    assert stats["errors"] == 1 and stats["processed"] == 3
+    assert "quebrou" in capsys.readouterr().out
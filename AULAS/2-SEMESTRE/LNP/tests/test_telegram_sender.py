@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+import requests
+
+import telegram_sender
+from telegram_sender import PRIORITY_HIGH, PRIORITY_LOW, AsyncTelegramSender, TelegramSender, TokenBucket
+
+
+def resposta(status, headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    resp._content = b'{"ok": true}'
+    return resp
+
+
+class FakeTransport:
+    """Devolve (ou levanta) os resultados da lista em ordem; depois, 200."""
+
+    def __init__(self, resultados=()):
+        self.resultados = list(resultados)
+        self.enviadas = []
+        self._lock = threading.Lock()
+
+    def post(self, url, json, retries):
+        with self._lock:
+            self.enviadas.append((time.monotonic(), json["chat_id"], json["text"]))
+            resultado = self.resultados.pop(0) if self.resultados else resposta(200)
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+
+@pytest.fixture(autouse=True)
+def backoff_curto(monkeypatch):
+    monkeypatch.setattr(telegram_sender.random, "uniform", lambda a, b: 0.01)
+
+
+def sender(transport, **kwargs):
+    kwargs.setdefault("global_rate", 1000)
+    kwargs.setdefault("per_chat_rate", 1000)
+    return TelegramSender("token-de-teste", transport=transport, **kwargs)
+
+
+def test_token_bucket_pausa():
+    balde = TokenBucket(rate=10, capacity=1)
+    agora = time.monotonic()
+    assert balde.wait_time(agora) == 0.0
+    balde.consume(agora)
+    assert balde.wait_time(agora) == pytest.approx(0.1)
+    balde.pause(2.0, agora)
+    assert balde.wait_time(agora + 0.5) == pytest.approx(1.5)
+    assert balde.wait_time(agora + 2.0) == 0.0
+
+
+def test_429_pausa_todos_os_chats():
+    transport = FakeTransport([resposta(429, {"Retry-After": "0.3"})])
+    s = sender(transport)
+    s.send(1, "primeira")
+    assert s.flush(5)
+    s.send(2, "outro chat")
+    assert s.flush(5)
+    (t_429, _, _), *envios = transport.enviadas
+    assert [chat for _, chat, _ in envios] == [1, 2]
+    assert all(t - t_429 >= 0.29 for t, _, _ in envios)
+    assert s.stats()["rate_limited"] == 1
+    assert s.stats()["sent"] == 2
+
+
+def test_falha_de_conexao_e_repetida():
+    transport = FakeTransport([requests.ConnectTimeout("sem conexão")])
+    s = sender(transport)
+    s.send(1, "oi")
+    assert s.flush(5)
+    assert len(transport.enviadas) == 2
+    assert s.stats()["retries"] == 1
+    assert s.stats()["sent"] == 1
+
+
+def test_timeout_de_leitura_nao_e_repetido():
+    transport = FakeTransport([requests.ReadTimeout("demorou"), requests.RequestException("outro")])
+    s = sender(transport)
+    s.send(1, "oi")
+    s.send(2, "olá")
+    assert s.flush(5)
+    assert len(transport.enviadas) == 2
+    assert s.stats()["retries"] == 0
+    assert s.stats()["dropped_failed"] == 2
+
+
+def test_junta_so_mensagens_de_mesma_prioridade():
+    transport = FakeTransport()
+    # Sem fichas por chat até o fim do teste: as mensagens ficam pendentes
+    s = sender(transport, per_chat_rate=0.001)
+    s.send(1, "a")
+    assert s.flush(5)
+    s.send(1, "b")
+    s.send(1, "c")
+    s.send(1, "urgente", priority=PRIORITY_HIGH)
+    s.send(1, "aviso", priority=PRIORITY_LOW)
+    stats = s.stats()
+    assert stats["coalesced"] == 1
+    assert stats["pending"] == 3
+    textos = [m.text for m in s._pending[1]]
+    assert textos == ["b\n\nc", "urgente", "aviso"]
+
+
+class FakeAsyncTransport:
+    """Versão assíncrona do FakeTransport, com respostas do httpx."""
+
+    def __init__(self, resultados=()):
+        self.resultados = list(resultados)
+        self.enviadas = []
+
+    async def post(self, url, json, retries):
+        self.enviadas.append((time.monotonic(), json["chat_id"], json["text"]))
+        resultado = self.resultados.pop(0) if self.resultados else httpx.Response(200, json={"ok": True})
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+
+def async_sender(transport):
+    return AsyncTelegramSender("token-de-teste", transport, global_rate=1000, per_chat_rate=1000)
+
+
+def test_async_429_pausa_e_reenvia():
+    transport = FakeAsyncTransport([httpx.Response(429, headers={"Retry-After": "0.3"})])
+    s = async_sender(transport)
+
+    async def enviar():
+        return await asyncio.gather(s.send(1, "a"), s.send(2, "b"))
+
+    inicio = time.monotonic()
+    assert asyncio.run(enviar()) == [True, True]
+    # Os dois chats esperaram o retry_after, não só o que recebeu o 429
+    assert min(t for t, _, _ in transport.enviadas[1:]) - inicio >= 0.3
+    stats = s.stats()
+    assert stats["rate_limited"] == 1 and stats["retries"] == 0 and stats["sent"] == 2
+
+
+def test_async_repete_falha_de_conexao_e_5xx():
+    transport = FakeAsyncTransport([httpx.ConnectError("recusada"), httpx.Response(502)])
+    s = async_sender(transport)
+    assert asyncio.run(s.send(1, "oi"))
+    assert len(transport.enviadas) == 3
+    assert s.stats()["retries"] == 2
+
+
+def test_async_nao_repete_envio_incerto_nem_recusa():
+    transport = FakeAsyncTransport([httpx.ReadTimeout("demorou"), httpx.Response(403, text="blocked")])
+    s = async_sender(transport)
+    assert not asyncio.run(s.send(1, "oi"))
+    assert not asyncio.run(s.send(2, "oi"))
+    assert len(transport.enviadas) == 2
+    stats = s.stats()
+    assert stats["retries"] == 0 and stats["dropped_failed"] == 2 and stats["waiting"] == 0
+
+
+def test_async_desiste_apos_max_tentativas():
+    transport = FakeAsyncTransport([httpx.Response(500)] * telegram_sender.MAX_SEND_ATTEMPTS)
+    s = async_sender(transport)
+    assert not asyncio.run(s.send(1, "oi"))
+    assert len(transport.enviadas) == telegram_sender.MAX_SEND_ATTEMPTS
@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+import update_dedup
+from update_dedup import UpdateDedup
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = Relogio()
+    monkeypatch.setattr(update_dedup.time, "monotonic", r)
+    return r
+
+
+def test_reentrega_e_descartada(relogio):
+    dedup = UpdateDedup()
+    assert dedup.claim(10, 1)
+    assert not dedup.claim(10, 1)
+    assert dedup.stats()["duplicates_window"] == 1
+
+
+def test_sem_update_id_sempre_processa(relogio):
+    dedup = UpdateDedup()
+    assert dedup.claim(None, 1)
+    assert dedup.claim(None, 1)
+
+
+def test_release_permite_reentrega(relogio):
+    dedup = UpdateDedup()
+    assert dedup.claim(10, 1)
+    dedup.release(10, 1)
+    assert dedup.claim(10, 1)
+
+
+def test_release_intercalado_com_id_maior_do_mesmo_chat(relogio):
+    dedup = UpdateDedup()
+    assert dedup.claim(11, 1)
+    assert dedup.claim(12, 1)
+    dedup.release(11, 1)
+    # 11 foi recusado (fila cheia): a reentrega precisa ser aceita, mesmo com 12 já aceito
+    assert dedup.claim(11, 1)
+    assert not dedup.claim(12, 1)
+
+
+def test_marca_dagua_cobre_ids_fora_da_janela(relogio):
+    dedup = UpdateDedup(window=10)
+    assert dedup.claim(20, 1)
+    assert dedup.claim(21, 2)
+    relogio.agora += 11
+    # Saíram da janela, mas a marca d'água de cada chat ainda os reconhece
+    assert not dedup.claim(20, 1)
+    assert not dedup.claim(19, 1)
+    assert not dedup.claim(21, 2)
+    assert dedup.claim(22, 1)
+    stats = dedup.stats()
+    assert stats["duplicates_high_water"] == 3
+    assert stats["entries"] == 1
+
+
+def test_limite_de_entradas_e_de_chats(relogio):
+    dedup = UpdateDedup(max_entries=3, max_chats=2)
+    for update_id in range(1, 11):
+        assert dedup.claim(update_id, update_id)
+    stats = dedup.stats()
+    assert stats["entries"] <= 4
+    assert stats["chats"] <= 2
+
+
+def test_claim_concorrente_aceita_uma_vez():
+    dedup = UpdateDedup()
+    aceitos = []
+    barreira = threading.Barrier(8)
+
+    def trabalho():
+        barreira.wait()
+        for update_id in range(200):
+            if dedup.claim(update_id, update_id % 5):
+                aceitos.append(update_id)
+    threads = [threading.Thread(target=trabalho) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(aceitos) == list(range(200))
@@ -0,0 +1,105 @@
+"""
+Descarte de atualizações repetidas do Telegram (por update_id).
+
+Quando o processamento demora, o Telegram reentrega o mesmo update_id e a
+mensagem era tratada de novo: detectIntent em dobro e, no pior caso, item
+adicionado duas vezes ao carrinho. UpdateDedup é consultado antes de a
+atualização entrar na fila, com duas verificações O(1):
+
+    - janela de tempo: update_ids aceitos nos últimos DEDUP_WINDOW segundos
+      (OrderedDict em ordem de chegada, limitado a DEDUP_MAX_ENTRIES);
+    - marca d'água por chat: o maior update_id de cada chat que já saiu da
+      janela; os update_ids crescem em sequência, então um id menor ou
+      igual já foi visto (LRU de DEDUP_MAX_CHATS chats).
+
+A marca só sobe quando a atualização sai da janela. Enquanto está nela,
+release() (fila cheia) ainda pode desfazer o claim() sem que um id maior
+do mesmo chat, aceito depois, faça a reentrega parecer repetida.
+
+A memória é constante (os dois mapas têm limite). Vale por processo: com
+vários workers do gunicorn, uma reentrega pode cair em outro processo.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# update_ids lembrados (segundos e quantidade)
+DEDUP_WINDOW = float(os.getenv("TELEGRAM_DEDUP_WINDOW", "3600"))
+DEDUP_MAX_ENTRIES = int(os.getenv("TELEGRAM_DEDUP_MAX", "100000"))
+# Chats com marca d'água mantida
+DEDUP_MAX_CHATS = int(os.getenv("TELEGRAM_DEDUP_MAX_CHATS", "100000"))
+
+
+class UpdateDedup:
+    """Janela de update_ids recentes + maior update_id aceito por chat; seguro entre threads."""
+
+    def __init__(self, window: float = DEDUP_WINDOW, max_entries: int = DEDUP_MAX_ENTRIES,
+                 max_chats: int = DEDUP_MAX_CHATS):
+        self.window = window
+        self.max_entries = max_entries
+        self.max_chats = max_chats
+        # update_id -> (visto em, chat_id), em ordem de chegada
+        self._seen: OrderedDict[int, tuple[float, object]] = OrderedDict()
+        self._high_water: OrderedDict[object, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._checks = 0
+        self._dup_window = 0
+        self._dup_high_water = 0
+
+    def _expire(self, agora: float) -> None:
+        """Tira da janela as atualizações antigas (ou excedentes), subindo a marca do chat."""
+        limite = agora - self.window
+        while self._seen:
+            update_id, (visto_em, chat_id) = next(iter(self._seen.items()))
+            if visto_em > limite and len(self._seen) <= self.max_entries:
+                break
+            del self._seen[update_id]
+            marca = self._high_water.get(chat_id)
+            self._high_water[chat_id] = update_id if marca is None else max(marca, update_id)
+            self._high_water.move_to_end(chat_id)
+        while len(self._high_water) > self.max_chats:
+            self._high_water.popitem(last=False)
+
+    def claim(self, update_id, chat_id) -> bool:
+        """
+        Registra a atualização e devolve True se ela é nova; False se é
+        repetida (não processar). Sem update_id não há como deduplicar: True.
+        """
+        if update_id is None:
+            return True
+        agora = time.monotonic()
+        with self._lock:
+            self._checks += 1
+            self._expire(agora)
+            if update_id in self._seen:
+                self._dup_window += 1
+                return False
+            marca = self._high_water.get(chat_id)
+            if marca is not None and update_id <= marca:
+                self._dup_high_water += 1
+                return False
+            self._seen[update_id] = (agora, chat_id)
+            return True
+
+    def release(self, update_id, chat_id) -> None:
+        """Desfaz claim() quando a atualização não foi aceita (fila cheia): a reentrega será processada."""
+        if update_id is None:
+            return
+        with self._lock:
+            self._seen.pop(update_id, None)
+
+    def stats(self) -> dict:
+        """Consultas, repetidas descartadas (por janela e por marca d'água) e taxa de acerto."""
+        with self._lock:
+            repetidas = self._dup_window + self._dup_high_water
+            return {
+                "entries": len(self._seen),
+                "chats": len(self._high_water),
+                "checks": self._checks,
+                "duplicates": repetidas,
+                "duplicates_window": self._dup_window,
+                "duplicates_high_water": self._dup_high_water,
+                "hit_rate": round(repetidas / self._checks, 4) if self._checks else 0.0,
+            }
@@ -1,16 +1,26 @@
 import os
 import json
-import requests
-import pandas as pd
 from flask import Flask, request
-from google.oauth2 import service_account
-from google.auth.transport.requests import AuthorizedSession
+
+from http_transport import DIALOGFLOW_API, dialogflow_credentials, dialogflow_transport
+from menu_index import MenuIndex
+from menu_snapshot import MENU_CACHE_CSV, MENU_SNAPSHOT, MenuWatcher, load_menu
+from session_entities import EntityPusher, SessionEntityTracker, push_item_entities
+from entity_sync import ITEM_ENTITY_MODE
+from circuit_breaker import DETECT_INTENT_TIMEOUT, OPEN, CircuitBreaker, CircuitOpenError, http_failure
+from local_nlu import CONFIDENCE_THRESHOLD, default_model
+from telegram_polling import LongPoller
+from telegram_queue import ShardedUpdateQueue, extract_message
+from telegram_sender import TelegramSender
+from update_dedup import UpdateDedup
 
 """
 Webhook para integrar Telegram a Dialogflow.
-Recebe mensagens do bot do Telegram, sincroniza entidades dinâmicas
-(@Item) com base no cardápio e repassa a mensagem para o Dialogflow.
-Em seguida, envia a resposta do Dialogflow de volta ao usuário no Telegram.
+Recebe mensagens do bot do Telegram e as enfileira por chat; a fila
+sincroniza entidades dinâmicas (@Item) com base no cardápio, repassa a
+mensagem para o Dialogflow e envia a resposta de volta ao usuário no Telegram.
+Com TELEGRAM_MODE=polling as mensagens chegam por getUpdates (telegram_polling.py)
+em vez do webhook.
 """
 
 # Configurações principais
@@ -24,104 +34,183 @@ app = Flask(__name__)
 
 # Sessão autenticada para Dialogflow
 SCOPES = ["https://www.googleapis.com/auth/dialogflow"]
-credentials = service_account.Credentials.from_service_account_file(
-    CREDENTIALS_FILE, scopes=SCOPES
-)
-df_session = AuthorizedSession(credentials)
+credentials = dialogflow_credentials(CREDENTIALS_FILE, SCOPES)
+df_session = dialogflow_transport(credentials)
+# Com o Dialogflow fora do ar ou lento, a resposta vem de local_reply
+DIALOGFLOW_BREAKER = CircuitBreaker("dialogflow")
+# Resposta quando nem o Dialogflow nem o classificador local resolvem a mensagem
+DEGRADED_REPLY = "Estamos com instabilidade no atendimento. Tente novamente em instantes. 🍔"
+# Respostas enviadas dentro dos limites da Bot API (30/s no bot, 1/s por chat)
+TELEGRAM_SENDER = TelegramSender(TELEGRAM_TOKEN)
+
+# Índice em cache com cardápio (lido sem pandas)
+MENU_INDEX: MenuIndex | None = None
+# Versão do cardápio já publicada em cada chat (evita PUT de @Item a cada mensagem)
+ENTITY_TRACKER = SessionEntityTracker()
+
+
+def set_menu_index(index: MenuIndex) -> None:
+    """Troca o índice global de uma vez (leitores mantêm a referência antiga)."""
+    global MENU_INDEX
+    MENU_INDEX = index
+    if ITEM_ENTITY_MODE != "agent":
+        # Chats ativos recebem o @Item novo em segundo plano
+        ENTITY_PUSHER.refresh_all(index.version)
 
-# DataFrame em cache com cardápio
-MENU_DF: pd.DataFrame | None = None
+
+# Acompanha uploads feitos pelo app.py (outro processo) via snapshot
+MENU_WATCHER = MenuWatcher(lambda: MENU_INDEX, set_menu_index, MENU_SNAPSHOT)
 
 
 def ensure_menu_loaded() -> bool:
-    """Carrega o cardápio salvo em cache (cardapio_cache.csv) se ainda não estiver carregado."""
-    global MENU_DF
-    if MENU_DF is None and os.path.exists("cardapio_cache.csv"):
+    """Carrega o cardápio salvo em cache (snapshot binário ou CSV) se ainda não estiver carregado."""
+    global MENU_INDEX
+    MENU_WATCHER.start()
+    if MENU_INDEX is None:
         try:
-            MENU_DF = pd.read_csv("cardapio_cache.csv")
+            MENU_INDEX = load_menu(MENU_CACHE_CSV, MENU_SNAPSHOT)
         except Exception:
-            MENU_DF = None
-    return MENU_DF is not None
+            MENU_INDEX = None
+    return MENU_INDEX is not None
+
+
+def _push_entities(session_id: str) -> None:
+    """Atualiza usando PUT (corpo pré-serializado por versão do cardápio)."""
+    push_item_entities(df_session, PROJECT_ID, session_id, MENU_INDEX, ENTITY_TRACKER)
+
+
+# Publicações de @Item em segundo plano, uma pendente por chat
+ENTITY_PUSHER = EntityPusher(_push_entities, ENTITY_TRACKER)
 
 
 def push_session_entities(session_id: str) -> None:
     """
     Publica um SessionEntityType @Item na sessão do Dialogflow para reconhecer itens do cardápio.
     Lê nomes e sinônimos da coluna 'item' e opcional 'sinonimos' do arquivo de cardápio.
+    Só espera a publicação no primeiro turno do chat; republicações são feitas em segundo plano.
+    Com ITEM_ENTITY_MODE=agent a entidade do agente já está sincronizada e nada é enviado;
+    com o disjuntor aberto a mensagem não irá ao Dialogflow e também não há publicação.
     """
-    if not ensure_menu_loaded():
+    if ITEM_ENTITY_MODE == "agent" or DIALOGFLOW_BREAKER.state == OPEN or not ensure_menu_loaded():
         return
-    items_entities = []
-    # Constrói entidades
-    for _, row in MENU_DF.iterrows():
-        value = str(row["item"]).strip()
-        synonyms = [value]
-        if "sinonimos" in MENU_DF.columns:
-            raw = row.get("sinonimos", "")
-            if pd.notna(raw) and str(raw).strip() != "":
-                parts = str(raw).split("|")
-                synonyms += [p.strip() for p in parts if p.strip()]
-        items_entities.append({"value": value, "synonyms": synonyms})
-    url = (
-        f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/sessions/"
-        f"{session_id}/entityTypes/Item"
-    )
-    payload = {
-        "entityOverrideMode": "ENTITY_OVERRIDE_MODE_OVERRIDE",
-        "entities": items_entities,
-    }
-    # Atualiza usando PUT
-    try:
-        df_session.put(url, json=payload)
-    except Exception as e:
-        print("Falha ao publicar SessionEntityType:", e)
+    ENTITY_PUSHER.ensure(session_id, MENU_INDEX.version)
 
 
-@app.post("/webhook")
-def telegram_webhook():
-    """
-    Endpoint que recebe atualizações do Telegram.
-    Extrai a mensagem de texto, envia para o Dialogflow e devolve a resposta ao usuário.
-    """
-    data = request.json or {}
-    msg = data.get("message") or data.get("edited_message") or {}
-    chat = msg.get("chat", {})
-    chat_id = chat.get("id")
-    user_message = msg.get("text", "")
-    # Ignora mensagens sem texto ou sem chat_id
-    if not chat_id or not user_message:
-        return "skip", 200
+def local_reply(text: str) -> str:
+    """Resposta sem Dialogflow: texto da intent prevista pelo classificador local."""
+    nlu = default_model()
+    if nlu is not None:
+        intent, confianca = nlu.predict(text)
+        resposta = nlu.responses.get(intent, "") if confianca >= CONFIDENCE_THRESHOLD else ""
+        # Respostas com parâmetros ($tipo, $bebida...) dependem do fulfillment
+        if resposta and "$" not in resposta:
+            return resposta
+    return DEGRADED_REPLY
 
-    session_id = str(chat_id)
-    # Atualiza entidades dinâmicas para esta sessão
-    try:
-        push_session_entities(session_id)
-    except Exception as e:
-        print("Erro ao atualizar entidades:", e)
-    # Envia a mensagem para o detectIntent
+
+def detect_reply(text: str, session_id: str) -> str:
+    """fulfillmentText do detectIntent, com orçamento de latência e disjuntor."""
     url = (
-        f"https://dialogflow.googleapis.com/v2/projects/{PROJECT_ID}/agent/sessions/"
+        f"{DIALOGFLOW_API}/projects/{PROJECT_ID}/agent/sessions/"
         f"{session_id}:detectIntent"
     )
     payload = {
         "queryInput": {
             "text": {
-                "text": user_message,
+                "text": text,
                 "languageCode": LANG,
             }
         }
     }
-    df_response = df_session.post(url, json=payload).json()
-    reply = df_response.get("queryResult", {}).get("fulfillmentText", "Desculpe, não entendi.")
-    # Envia resposta via Telegram
-    send_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
     try:
-        requests.post(send_url, json={"chat_id": chat_id, "text": reply})
+        resp = DIALOGFLOW_BREAKER.call(df_session.post, url, json=payload, timeout=DETECT_INTENT_TIMEOUT,
+                                       retries=0, is_failure=http_failure)
+        resp.raise_for_status()
+    except CircuitOpenError:
+        return local_reply(text)
+    except Exception as e:
+        print("detectIntent indisponível, usando resposta local:", e)
+        return local_reply(text)
+    return resp.json().get("queryResult", {}).get("fulfillmentText", "Desculpe, não entendi.")
+
+
+def process_message(chat_id: int, user_message: str) -> None:
+    """Processa uma mensagem (thread da fila): entidades, detectIntent e resposta no Telegram."""
+    session_id = str(chat_id)
+    # Atualiza entidades dinâmicas para esta sessão
+    try:
+        push_session_entities(session_id)
     except Exception as e:
-        print("Falha ao enviar mensagem para Telegram:", e)
+        print("Erro ao atualizar entidades:", e)
+    # Envia a mensagem para o detectIntent (ou responde localmente)
+    reply = detect_reply(user_message, session_id)
+    # Envia resposta via Telegram (fila de saída com limite de taxa)
+    if not TELEGRAM_SENDER.send(chat_id, reply):
+        print(f"Resposta para o chat {chat_id} descartada: fila de envio cheia")
+
+
+# Mensagens processadas fora do webhook, em ordem por chat
+UPDATE_QUEUE = ShardedUpdateQueue(process_message)
+# update_ids já aceitos (o Telegram reentrega quando o webhook demora)
+UPDATE_DEDUP = UpdateDedup()
+
+
+def enqueue_update(update: dict) -> bool | None:
+    """
+    Coloca a atualização na fila (webhook e long polling).
+    None: nada a processar; False: fila cheia; True: enfileirada.
+    """
+    mensagem = extract_message(update)
+    if mensagem is None:
+        return None
+    chat_id, user_message = mensagem
+    update_id = update.get("update_id")
+    # Reentrega de uma atualização já aceita: descarta sem chamar Dialogflow nem Telegram
+    if not UPDATE_DEDUP.claim(update_id, chat_id):
+        return None
+    if not UPDATE_QUEUE.submit(chat_id, user_message):
+        UPDATE_DEDUP.release(update_id, chat_id)
+        return False
+    return True
+
+
+@app.post("/webhook")
+def telegram_webhook():
+    """
+    Endpoint que recebe atualizações do Telegram.
+    Só valida e enfileira a mensagem; o processamento e a resposta ao usuário
+    acontecem na fila (process_message). Com a fila cheia responde 503 e o
+    Telegram reentrega a atualização mais tarde.
+    """
+    resultado = enqueue_update(request.json or {})
+    # Ignora mensagens sem texto ou sem chat_id
+    if resultado is None:
+        return "skip", 200
+    if not resultado:
+        return "busy", 503
     return "ok", 200
 
 
+@app.get("/stats/queue")
+def queue_stats():
+    """Profundidade e contadores da fila de mensagens, da fila de envio e das repetidas."""
+    stats = {**UPDATE_QUEUE.stats(), "sender": TELEGRAM_SENDER.stats(), "dedup": UPDATE_DEDUP.stats()}
+    if POLLER is not None:
+        stats["polling"] = POLLER.stats()
+    return stats
+
+
+# Long polling (TELEGRAM_MODE=polling), iniciado só ao rodar este arquivo
+POLLER: LongPoller | None = None
+
+
 if __name__ == "__main__":
+    # Com FLASK_DEBUG o reloader roda este bloco também no processo pai: polling só no filho
+    processo_servidor = not app.debug or os.getenv("WERKZEUG_RUN_MAIN") == "true"
+    if os.getenv("TELEGRAM_MODE", "webhook") == "polling" and processo_servidor:
+        # Sem endpoint público: busca as mensagens com getUpdates (o Flask segue servindo /stats)
+        POLLER = LongPoller(TELEGRAM_TOKEN, enqueue_update)
+        POLLER.delete_webhook()
+        POLLER.start()
     # Define a porta padrão para o webhook do Telegram
     app.run(host="0.0.0.0", port=5007)
\ No newline at end of file
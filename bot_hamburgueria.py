@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import os
+import sys
 import json
 import random
 import uuid
@@ -8,6 +9,16 @@ from datetime import datetime
 from google.cloud import dialogflow
 import google.auth.exceptions
 
+# Módulos compartilhados com o backend Flask (AULAS/2-SEMESTRE/LNP)
+LNP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "AULAS", "2-SEMESTRE", "LNP")
+if LNP_DIR not in sys.path:
+    sys.path.append(LNP_DIR)
+from menu_index import MenuIndex
+from menu_ingest import MenuIngestError, ingest
+from local_nlu import CONFIDENCE_THRESHOLD, load_or_train
+from intent_cache import IntentCache, active_contexts
+from circuit_breaker import DETECT_INTENT_TIMEOUT, CircuitBreaker, CircuitOpenError
+
 # ===== CONFIGURAÇÃO DO STREAMLIT =====
 # Define configuração para aceitar conexões de qualquer IP
 os.environ['STREAMLIT_SERVER_ADDRESS'] = '0.0.0.0'      # Aceita conexões de qualquer IP
@@ -41,16 +52,43 @@ if 'context' not in st.session_state:
 if 'cart' not in st.session_state:
     st.session_state.cart = []
 
+@st.cache_resource
+def carregar_nlu_local():
+    """Classificador de intents local, compartilhado por todas as sessões do servidor."""
+    return load_or_train(
+        [os.path.join(LNP_DIR, "intents_hamburgueria.json"),
+         os.path.join(LNP_DIR, "intent_PedidoDetalhado.json")],
+        os.path.join(LNP_DIR, "entities_hamburgueria.json"),
+        os.path.join(LNP_DIR, "nlu_model.npz"),
+    )
+
+# Intents de resposta fixa, que não dependem do contexto da conversa
+INTENTS_SEM_CONTEXTO = {'BoasVindas', 'Cardapio', 'MostrarItens', 'HorarioFuncionamento', 'Endereco', 'Despedida'}
+
+@st.cache_resource
+def carregar_cache_intents():
+    """Cache de detectIntent compartilhado por todas as sessões do servidor."""
+    return IntentCache(INTENTS_SEM_CONTEXTO)
+
+@st.cache_resource
+def carregar_disjuntor():
+    """Disjuntor do Dialogflow compartilhado por todas as sessões do servidor."""
+    return CircuitBreaker("dialogflow")
+
+def definir_cardapio(menu_index):
+    """Atualiza o cardápio da sessão (índice/autômato de itens já compilado)."""
+    st.session_state.menu_index = menu_index
+
 # Cardápio
-if 'cardapio' not in st.session_state:
+if 'menu_index' not in st.session_state:
     # Cardápio padrão
-    st.session_state.cardapio = pd.DataFrame({
+    definir_cardapio(MenuIndex.from_dataframe(pd.DataFrame({
         'categoria': ['Burgers', 'Burgers', 'Burgers', 'Bebidas', 'Bebidas', 'Porções'],
         'item': ['Cheeseburger', 'Vegetariano', 'Duplo', 'Coca-Cola', 'Suco', 'Batata Frita'],
         'descricao': ['Hambúrguer com queijo', 'Hambúrguer de grão de bico', 'Hambúrguer duplo com queijo', 'Refrigerante lata', 'Suco natural de laranja', 'Batata frita crocante'],
         'preco': [18.90, 20.00, 25.00, 6.00, 7.50, 12.00],
         'vegetariano': ['não', 'sim', 'não', 'não', 'sim', 'sim'],
-    })
+    })))
 
 # ===== FUNÇÕES DE PROCESSAMENTO DE LINGUAGEM NATURAL =====
 def reconhecer_intent(texto):
@@ -93,91 +131,78 @@ def reconhecer_intent(texto):
     # Intent padrão (fallback)
     return "Default"
 
-def gerar_cardapio_completo(cardapio):
+def gerar_cardapio_completo(menu_index):
     """Gera a string completa do cardápio para exibição."""
-    if cardapio.empty:
+    if not menu_index:
         return "Desculpe, nosso cardápio não está disponível no momento."
 
-    # Gera lista de itens por categoria
-    categorias = cardapio['categoria'].unique()
-    resultado = "📋 **CARDÁPIO COMPLETO** 📋\n\n"
+    # Markdown memoizado pela versão do cardápio (recalculado só após upload/exemplo)
+    return menu_index.render("markdown") + "Digite o nome do item que deseja pedir ou 'voltar' para retornar ao menu principal."
 
-    for categoria in categorias:
-        items_categoria = cardapio[cardapio['categoria'] == categoria]
-        resultado += f"🍴 **{categoria.upper()}**\n"
-        for _, item in items_categoria.iterrows():
-            vegetariano = " 🌱" if item.get('vegetariano', '').lower() in ['sim', 'true', 'vegetariano'] else ""
-            resultado += f"• **{item['item']}** - R$ {item['preco']:.2f}{vegetariano}\n"
-            if 'descricao' in item and pd.notna(item['descricao']):
-                resultado += f"  {item['descricao']}\n"
-        resultado += "\n"
+# Similaridade mínima (fração dos trigramas do item presentes na frase) para sugerir itens
+SUGESTAO_MIN_SCORE = 0.4
 
-    resultado += "Digite o nome do item que deseja pedir ou 'voltar' para retornar ao menu principal."
-    return resultado
+def formatar_itens(itens):
+    """Formata itens do cardápio, um por linha, com nome em negrito e preço."""
+    return "\n".join(f"**{row.item}** (R$ {row.preco:.2f})" for row in itens)
 
-def listar_itens_categoria(cardapio, categoria):
+def listar_itens_categoria(menu_index, categoria):
     """Lista os itens de uma categoria específica."""
-    categoria_normalizada = categoria.lower().strip()
-
-    # Verifica se a categoria existe no cardápio
-    if categoria_normalizada not in cardapio['categoria'].str.lower().values:
+    # Busca a categoria no índice (sem diferenciar maiúsculas)
+    itens_categoria = menu_index.get_category(categoria)
+    if not itens_categoria:
         return "Categoria não encontrada no cardápio."
 
-    # Filtra os itens pela categoria
-    itens_categoria = cardapio[cardapio['categoria'].str.lower() == categoria_normalizada]
-    items = [f"**{row['item']}** (R$ {row['preco']:.2f})" for _, row in itens_categoria.iterrows()]
+    return f"Temos as seguintes opções em {categoria}:\n\n" + formatar_itens(itens_categoria) + "\n\nQual você gostaria de pedir?"
 
-    return f"Temos as seguintes opções em {categoria}:\n\n" + "\n".join(items) + "\n\nQual você gostaria de pedir?"
-
-def processar_pedido_local(texto, cardapio, cart, context):
+def processar_pedido_local(texto, menu_index, cart, context):
     """Processa o pedido usando lógica local (fallback do Dialogflow)."""
-    # Verifica se há algum item do cardápio mencionado no texto
-    item_encontrado = None
-
     # Normaliza o texto para comparação (remove acentos, converte para minúsculas)
     texto_normalizado = texto.lower().strip()
 
-    # Primeiro tenta encontrar itens específicos do cardápio
-    for _, row in cardapio.iterrows():
-        item_nome = row['item'].lower()
-        if item_nome in texto_normalizado:
-            item_encontrado = row
-            break
+    # Procura todos os itens (nomes e sinônimos) citados em uma única passada
+    itens_encontrados = menu_index.matcher.find(texto_normalizado)
+    item_encontrado = bool(itens_encontrados)
 
     # Verifica também para categorias específicas
     if not item_encontrado and ("burger" in texto_normalizado or "hambúrguer" in texto_normalizado
                                or "hamburger" in texto_normalizado or "burgers" in texto_normalizado):
         # Se mencionou a categoria de hambúrgueres
-        burgers = cardapio[cardapio["categoria"].str.lower() == "burgers"]
-        if not burgers.empty:
-            items = [f"**{row['item']}** (R$ {row['preco']:.2f})" for _, row in burgers.iterrows()]
-            return f"Temos os seguintes hambúrgueres:\n\n" + "\n".join(items) + "\n\nQual você gostaria de pedir?"
+        burgers = menu_index.get_category("burgers")
+        if burgers:
+            return f"Temos os seguintes hambúrgueres:\n\n" + formatar_itens(burgers) + "\n\nQual você gostaria de pedir?"
 
     elif not item_encontrado and ("bebida" in texto_normalizado or "bebidas" in texto_normalizado):
         # Se mencionou a categoria de bebidas
-        bebidas = cardapio[cardapio["categoria"].str.lower() == "bebidas"]
-        if not bebidas.empty:
-            items = [f"**{row['item']}** (R$ {row['preco']:.2f})" for _, row in bebidas.iterrows()]
-            return f"Temos as seguintes bebidas:\n\n" + "\n".join(items) + "\n\nQual você gostaria de pedir?"
+        bebidas = menu_index.get_category("bebidas")
+        if bebidas:
+            return f"Temos as seguintes bebidas:\n\n" + formatar_itens(bebidas) + "\n\nQual você gostaria de pedir?"
 
     elif not item_encontrado and ("porção" in texto_normalizado or "porcao" in texto_normalizado
                                  or "porções" in texto_normalizado or "porcoes" in texto_normalizado):
         # Se mencionou a categoria de porções
-        porcoes = cardapio[cardapio["categoria"].str.lower() == "porções"]
-        if not porcoes.empty:
-            items = [f"**{row['item']}** (R$ {row['preco']:.2f})" for _, row in porcoes.iterrows()]
-            return f"Temos as seguintes porções:\n\n" + "\n".join(items) + "\n\nQual você gostaria de pedir?"
-
-    # Se encontrou um item específico, adiciona ao carrinho
-    if item_encontrado is not None:
-        # Adiciona ao carrinho
-        cart.append({
-            'item': item_encontrado['item'],
-            'preco': item_encontrado['preco'],
-            'quantidade': 1
-        })
+        porcoes = menu_index.get_category("porções")
+        if porcoes:
+            return f"Temos as seguintes porções:\n\n" + formatar_itens(porcoes) + "\n\nQual você gostaria de pedir?"
+
+    # Se encontrou itens específicos, adiciona todos ao carrinho
+    if item_encontrado:
+        for item in itens_encontrados:
+            cart.append({
+                'item': item.item,
+                'preco': item.preco,
+                'quantidade': 1
+            })
         context['last_action'] = 'adicionou_item'
-        return f"Adicionei 1x **{item_encontrado['item']}** (R$ {item_encontrado['preco']:.2f}) ao seu pedido. Deseja pedir mais alguma coisa ou confirmar o pedido?"
+        adicionados = ", ".join(f"1x **{item.item}** (R$ {item.preco:.2f})" for item in itens_encontrados)
+        return f"Adicionei {adicionados} ao seu pedido. Deseja pedir mais alguma coisa ou confirmar o pedido?"
+
+    # Nenhum nome exato: tenta um item parecido (erros de digitação) sem consultar o Dialogflow
+    parecidos = menu_index.fuzzy.search(texto_normalizado, limit=3, min_score=SUGESTAO_MIN_SCORE, word=True)
+    if parecidos:
+        context['last_action'] = 'sugeriu_item'
+        sugestoes = formatar_itens(row for row, _ in parecidos)
+        return f"Não encontrei exatamente esse item. Você quis dizer:\n\n{sugestoes}\n\nDigite o nome do item para pedir."
 
     # Se nada foi identificado
     context['last_action'] = 'pediu_nao_especifico'
@@ -191,7 +216,7 @@ def processar_confirmacao(context, cart):
     if last_action == 'mostrou_menu':
         context['last_action'] = 'mostrou_itens'  # Muda o contexto para evitar loops
 
-        return gerar_cardapio_completo(st.session_state.cardapio)
+        return gerar_cardapio_completo(st.session_state.menu_index)
 
     # Se confirmou após adicionar um item, finaliza o pedido
     elif last_action == 'adicionou_item':
@@ -231,164 +256,206 @@ def processar_mensagem(texto):
     """Processa a mensagem do usuário usando Dialogflow API ou processamento local"""
     context = st.session_state.context
     cart = st.session_state.cart
-    cardapio = st.session_state.cardapio
-
-    # Tenta usar o Dialogflow primeiro
-    dialogflow_response = st.session_state.dialogflow_bot.detect_intent(texto)
+    menu_index = st.session_state.menu_index
+
+    # Classificador local primeiro: com confiança alta não há ida ao Dialogflow
+    nlu_response = None
+    nlu = carregar_nlu_local()
+    if nlu is not None:
+        intent_local, confianca = nlu.predict(texto)
+        resposta_local = nlu.responses.get(intent_local, '') if intent_local else ''
+        # Resposta vazia ou com parâmetros ($tipo, $bebida...) depende do Dialogflow: não conta como acerto
+        if confianca >= CONFIDENCE_THRESHOLD and resposta_local and '$' not in resposta_local:
+            nlu_response = {
+                'text': resposta_local,
+                'intent': intent_local,
+                'confidence': confianca,
+                'parameters': {}
+            }
+    if nlu_response is None:
+        nlu_response = st.session_state.dialogflow_bot.detect_intent(texto, menu_index.version)
 
-    if dialogflow_response and dialogflow_response['confidence'] > 0.6:
-        # Usa a resposta do Dialogflow se a confiança for alta
-        intent = dialogflow_response['intent']
-        parameters = dialogflow_response['parameters']
+    if nlu_response and nlu_response['confidence'] > 0.6:
+        # Usa a resposta classificada se a confiança for alta
+        intent = nlu_response['intent']
+        parameters = nlu_response['parameters']
 
         # Registra a intent para contexto
         context['last_intent'] = intent
 
-        # Processa conforme a intenção detectada pelo Dialogflow
+        # Processa conforme a intenção detectada
         if intent in ['Default Welcome Intent', 'BoasVindas', 'cumprimentos']:
             context['last_action'] = 'boas_vindas'
-            return dialogflow_response['text'] or "Olá! Bem-vindo à nossa hamburgueria virtual! 🍔 Como posso ajudar você hoje?"
+            return nlu_response['text'] or "Olá! Bem-vindo à nossa hamburgueria virtual! 🍔 Como posso ajudar você hoje?"
 
         elif intent in ['Cardapio', 'mostrar.cardapio', 'ver.menu']:
             context['last_action'] = 'mostrou_menu'
-            return dialogflow_response['text'] or "Temos hambúrgueres artesanais, porções e bebidas geladas. Deseja ver o cardápio detalhado?"
+            return nlu_response['text'] or "Temos hambúrgueres artesanais, porções e bebidas geladas. Deseja ver o cardápio detalhado?"
 
         elif intent in ['MostrarItens', 'listar.itens', 'ver.opcoes']:
             context['last_action'] = 'mostrou_itens'
-            return gerar_cardapio_completo(cardapio)
+            return gerar_cardapio_completo(menu_index)
 
-        elif intent in ['FazerPedido', 'pedir.item', 'adicionar.carrinho']:
+        elif intent in ['FazerPedido', 'PedidoDetalhado', 'pedir.item', 'adicionar.carrinho']:
             # Extrai parâmetros do Dialogflow
             item_solicitado = parameters.get('item', '')
             categoria_solicitada = parameters.get('categoria', '')
 
             if item_solicitado:
                 # Procura item específico
-                item_encontrado = None
-                for _, row in cardapio.iterrows():
-                    if row['item'].lower() == item_solicitado.lower():
-                        item_encontrado = row
-                        break
+                item_encontrado = menu_index.resolve(item_solicitado)
 
                 if item_encontrado is not None:
                     cart.append({
-                        'item': item_encontrado['item'],
-                        'preco': item_encontrado['preco'],
+                        'item': item_encontrado.item,
+                        'preco': item_encontrado.preco,
                         'quantidade': 1
                     })
                     context['last_action'] = 'adicionou_item'
-                    return f"Adicionei 1x **{item_encontrado['item']}** (R$ {item_encontrado['preco']:.2f}) ao seu pedido. Deseja pedir mais alguma coisa ou confirmar o pedido?"
+                    return f"Adicionei 1x **{item_encontrado.item}** (R$ {item_encontrado.preco:.2f}) ao seu pedido. Deseja pedir mais alguma coisa ou confirmar o pedido?"
 
             elif categoria_solicitada:
-                return listar_itens_categoria(cardapio, categoria_solicitada)
+                return listar_itens_categoria(menu_index, categoria_solicitada)
 
             # Fallback para processamento local se não conseguiu extrair parâmetros
-            return processar_pedido_local(texto, cardapio, cart, context)
+            return processar_pedido_local(texto, menu_index, cart, context)
 
-        elif intent in ['Confirmar', 'sim', 'confirmar.pedido']:
+        elif intent in ['Confirmar', 'ConfirmarPedido', 'sim', 'confirmar.pedido']:
             return processar_confirmacao(context, cart)
 
-        elif intent in ['Negar', 'nao', 'cancelar']:
+        elif intent in ['Negar', 'NegarPedido', 'nao', 'cancelar']:
             return processar_negacao(context, cart)
 
         elif intent in ['Despedida', 'tchau', 'finalizar']:
             context['last_action'] = 'despedida'
-            return dialogflow_response['text'] or "Obrigado por visitar nossa hamburgueria virtual! Volte sempre! 👋"
+            return nlu_response['text'] or "Obrigado por visitar nossa hamburgueria virtual! Volte sempre! 👋"
 
         else:
             # Usa resposta padrão do Dialogflow para intents não mapeadas
-            return dialogflow_response['text']
+            return nlu_response['text']
 
-    # Fallback para processamento local se Dialogflow não está disponível ou confiança baixa
-    return processar_pedido_local(texto, cardapio, cart, context)
+    # Fallback para processamento local se nenhuma classificação tem confiança suficiente
+    return processar_pedido_local(texto, menu_index, cart, context)
 
 # ===== CONFIGURAÇÃO DO DIALOGFLOW =====
-class DialogflowBot:
-    def __init__(self, project_id, session_id, language_code='pt-BR'):
-        self.project_id = project_id
-        self.session_id = session_id
-        self.language_code = language_code
-        self.dialogflow_enabled = False
+@st.cache_resource
+def carregar_cliente_dialogflow():
+    """
+    Cliente do Dialogflow único no servidor, compartilhado por todas as sessões:
+    credenciais lidas (e renovadas) uma vez e um único canal gRPC/TLS.
+    Retorna (cliente ou None, id do projeto, mensagem de status).
+    """
+    # Configuração do projeto - tenta usar secrets, se não conseguir usa valor padrão
+    try:
+        project_id = st.secrets.get('DIALOGFLOW_PROJECT_ID', 'fiap-boot')
+    except Exception:
+        project_id = 'fiap-boot'  # Valor padrão quando não há secrets configurados
 
-        # Tenta configurar as credenciais do Google Cloud
+    # Tenta configurar as credenciais do Google Cloud
+    try:
+        # Verifica se existe um arquivo de credenciais como variável de ambiente no Streamlit
         try:
-            # Verifica se existe um arquivo de credenciais como variável de ambiente no Streamlit
-            try:
-                if hasattr(st, 'secrets') and 'GOOGLE_APPLICATION_CREDENTIALS_JSON' in st.secrets:
-                    # Para Streamlit Cloud - credenciais via secrets
-                    credentials_info = json.loads(st.secrets['GOOGLE_APPLICATION_CREDENTIALS_JSON'])
-                    from google.oauth2 import service_account
-                    credentials = service_account.Credentials.from_service_account_info(credentials_info)
-                    self.session_client = dialogflow.SessionsClient(credentials=credentials)
-                    self.dialogflow_enabled = True
-                    st.success("✅ Conectado ao Dialogflow via Streamlit Secrets")
-                    self.session_path = self.session_client.session_path(project_id, session_id)
-                    return
-            except Exception:
-                # Ignora erros de secrets e continua para outros métodos
-                pass
-
-            if os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
-                # Para ambiente local - credenciais via arquivo
-                self.session_client = dialogflow.SessionsClient()
-                self.dialogflow_enabled = True
-                st.success("✅ Conectado ao Dialogflow via variável de ambiente")
-            else:
-                # Tenta encontrar o arquivo de credenciais no projeto
-                credentials_path = "AULAS/2-SEMESTRE/LNP/fiap-boot-a239f7750ffc.json"
-                if os.path.exists(credentials_path):
-                    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
-                    self.session_client = dialogflow.SessionsClient()
-                    self.dialogflow_enabled = True
-                    st.success("✅ Conectado ao Dialogflow usando credenciais do projeto")
-                else:
-                    st.warning("⚠️ Credenciais do Dialogflow não encontradas. Usando processamento local.")
-                    self.dialogflow_enabled = False
-                    return
-
-            self.session_path = self.session_client.session_path(project_id, session_id)
+            if hasattr(st, 'secrets') and 'GOOGLE_APPLICATION_CREDENTIALS_JSON' in st.secrets:
+                # Para Streamlit Cloud - credenciais via secrets
+                credentials_info = json.loads(st.secrets['GOOGLE_APPLICATION_CREDENTIALS_JSON'])
+                from google.oauth2 import service_account
+                credentials = service_account.Credentials.from_service_account_info(credentials_info)
+                return (dialogflow.SessionsClient(credentials=credentials), project_id,
+                        "✅ Conectado ao Dialogflow via Streamlit Secrets")
+        except Exception:
+            # Ignora erros de secrets e continua para outros métodos
+            pass
+
+        if os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+            # Para ambiente local - credenciais via arquivo
+            return dialogflow.SessionsClient(), project_id, "✅ Conectado ao Dialogflow via variável de ambiente"
+
+        # Tenta encontrar o arquivo de credenciais no projeto
+        credentials_path = "AULAS/2-SEMESTRE/LNP/fiap-boot-a239f7750ffc.json"
+        if os.path.exists(credentials_path):
+            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
+            return dialogflow.SessionsClient(), project_id, "✅ Conectado ao Dialogflow usando credenciais do projeto"
+        return None, project_id, "⚠️ Credenciais do Dialogflow não encontradas. Usando processamento local."
+
+    except Exception as e:
+        return None, project_id, f"⚠️ Erro ao conectar com Dialogflow: {str(e)}. Usando processamento local."
 
-        except Exception as e:
-            st.warning(f"⚠️ Erro ao conectar com Dialogflow: {str(e)}. Usando processamento local.")
-            self.dialogflow_enabled = False
+class DialogflowBot:
+    """Estado de uma sessão de chat: só o session_path; o cliente é compartilhado."""
 
-    def detect_intent(self, text_input):
-        """Envia mensagem para o Dialogflow e retorna a resposta"""
+    def __init__(self, session_client, project_id, session_id, language_code='pt-BR',
+                 intent_cache=None, breaker=None):
+        self.session_client = session_client
+        self.project_id = project_id
+        self.session_id = session_id
+        self.language_code = language_code
+        self.intent_cache = intent_cache
+        self.breaker = breaker or CircuitBreaker("dialogflow")
+        self.dialogflow_enabled = session_client is not None
+        self.session_path = (
+            dialogflow.SessionsClient.session_path(project_id, session_id) if self.dialogflow_enabled else None
+        )
+
+    def detect_intent(self, text_input, versao_cardapio=""):
+        """Envia mensagem para o Dialogflow e retorna a resposta (ou a guardada no cache)"""
         if not self.dialogflow_enabled:
             return None
 
+        cache = self.intent_cache
+        chave = None
+        if cache is not None:
+            chave = cache.key(text_input, cache.session_context(self.session_id), versao_cardapio)
+            guardada = cache.get(chave)
+            if guardada is not None:
+                return {**guardada, 'parameters': dict(guardada['parameters'])}
+
         try:
             # Prepara o input de texto
             text_input_obj = dialogflow.TextInput(text=text_input, language_code=self.language_code)
             query_input = dialogflow.QueryInput(text=text_input_obj)
 
-            # Faz a chamada para a API do Dialogflow
-            response = self.session_client.detect_intent(
-                request={"session": self.session_path, "query_input": query_input}
+            # Faz a chamada para a API do Dialogflow (com orçamento de latência e disjuntor)
+            response = self.breaker.call(
+                self.session_client.detect_intent,
+                request={"session": self.session_path, "query_input": query_input},
+                timeout=DETECT_INTENT_TIMEOUT[1],
+                retry=None
             )
 
-            return {
+            resultado = {
                 'text': response.query_result.fulfillment_text,
                 'intent': response.query_result.intent.display_name,
                 'confidence': response.query_result.intent_detection_confidence,
                 'parameters': dict(response.query_result.parameters)
             }
-
+            if cache is not None:
+                contextos = active_contexts(response.query_result.output_contexts)
+                cache.set_session_context(self.session_id, contextos)
+                cache.put(chave, resultado['intent'],
+                          {**resultado, 'parameters': dict(resultado['parameters'])}, contextos)
+            return resultado
+
+        except CircuitOpenError:
+            # Dialogflow instável: a mensagem vai direto para o processamento local
+            return None
         except Exception as e:
             st.error(f"Erro na comunicação com Dialogflow: {str(e)}")
             return None
 
-# Inicializa o bot do Dialogflow
+# Inicializa o bot do Dialogflow (sessão leve sobre o cliente compartilhado)
 if 'dialogflow_bot' not in st.session_state:
-    # Configuração do projeto - tenta usar secrets, se não conseguir usa valor padrão
-    try:
-        PROJECT_ID = st.secrets.get('DIALOGFLOW_PROJECT_ID', 'fiap-boot')
-    except:
-        PROJECT_ID = 'fiap-boot'  # Valor padrão quando não há secrets configurados
+    cliente, PROJECT_ID, status_dialogflow = carregar_cliente_dialogflow()
+    if cliente is not None:
+        st.success(status_dialogflow)
+    else:
+        st.warning(status_dialogflow)
 
     st.session_state.dialogflow_bot = DialogflowBot(
+        session_client=cliente,
         project_id=PROJECT_ID,
-        session_id=st.session_state.session_id
+        session_id=st.session_state.session_id,
+        intent_cache=carregar_cache_intents(),
+        breaker=carregar_disjuntor()
     )
 
 # ===== INTERFACE STREAMLIT =====
@@ -444,23 +511,23 @@ with tab1:
 with tab2:
     st.header("Cardápio Atual")
 
-    if not st.session_state.cardapio.empty:
+    menu_index = st.session_state.menu_index
+    if menu_index:
         # Mostra o cardápio formatado
-        for categoria in st.session_state.cardapio['categoria'].unique():
+        for categoria in menu_index.categories:
             st.subheader(f"🍴 {categoria}")
-            itens_categoria = st.session_state.cardapio[st.session_state.cardapio['categoria'] == categoria]
 
-            for _, item in itens_categoria.iterrows():
+            for item in menu_index.get_category(categoria):
                 col1, col2 = st.columns([3, 1])
                 with col1:
-                    titulo = f"{item['item']}"
-                    if 'vegetariano' in item and item['vegetariano'].lower() == 'sim':
+                    titulo = item.item
+                    if item.vegetariano:
                         titulo += " 🌱"
                     st.markdown(f"**{titulo}**")
-                    if 'descricao' in item and pd.notna(item['descricao']):
-                        st.write(item['descricao'])
+                    if item.descricao is not None:
+                        st.write(item.descricao)
                 with col2:
-                    st.markdown(f"**R$ {item['preco']:.2f}**")
+                    st.markdown(f"**R$ {item.preco:.2f}**")
                 st.markdown("---")
     else:
         st.warning("Nenhum cardápio carregado.")
@@ -473,34 +540,24 @@ with tab3:
     st.subheader("Upload de Cardápio")
     uploaded_file = st.file_uploader("Escolha um arquivo CSV ou Excel", type=['csv', 'xlsx'])
 
-    if uploaded_file is not None:
+    # Só reprocessa (e recompila o índice) quando um arquivo novo é enviado
+    upload_key = (uploaded_file.name, uploaded_file.size) if uploaded_file is not None else None
+    if uploaded_file is not None and upload_key != st.session_state.get('cardapio_upload_key'):
         try:
-            # Lê o arquivo
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-            else:
-                df = pd.read_excel(uploaded_file)
-
-            # Normaliza colunas
-            df.columns = [c.strip().lower() for c in df.columns]
-
-            # Verifica colunas obrigatórias
-            required = ["categoria", "item", "descricao", "preco"]
-            if not set(required).issubset(set(df.columns)):
-                st.error(f"Colunas obrigatórias ausentes: {', '.join(required)}")
-            else:
-                # Coluna vegetariano padrão "não" se não existir
-                df["vegetariano"] = df.get("vegetariano", "não").astype(str).str.lower()
-
-                # Converte preços para numérico
-                df["preco"] = pd.to_numeric(df["preco"], errors="coerce").round(2)
-
-                # Atualiza o cardápio
-                st.session_state.cardapio = df
-                st.success("Cardápio carregado com sucesso!")
-
-                # Mostra preview
-                st.dataframe(df)
+            # Lê o arquivo em streaming: valida colunas e normaliza preço/vegetariano por bloco
+            resultado = ingest(uploaded_file, uploaded_file.name)
+
+            # Atualiza o cardápio
+            definir_cardapio(resultado.index)
+            st.session_state.cardapio_upload_key = upload_key
+            st.success("Cardápio carregado com sucesso!")
+            if resultado.bad_count:
+                st.warning(resultado.report())
+
+            # Mostra preview (primeiras linhas)
+            st.dataframe(pd.DataFrame(resultado.preview))
+        except MenuIngestError as e:
+            st.error(str(e))
         except Exception as e:
             st.error(f"Erro ao processar arquivo: {e}")
 
@@ -513,7 +570,7 @@ with tab3:
             'preco': [18.90, 20.00, 25.00, 6.00, 7.50, 12.00],
             'vegetariano': ['não', 'sim', 'não', 'não', 'sim', 'sim']
         })
-        st.session_state.cardapio = exemplo
+        definir_cardapio(MenuIndex.from_dataframe(exemplo))
         st.success("Cardápio de exemplo gerado!")
         st.dataframe(exemplo)
 